@@ -0,0 +1,86 @@
+# benchmarks/bench_micro.py
+"""Micro-benchmarks of the hot functions of the stock and login paths.
+
+Run from the project root:
+    python benchmarks/bench_micro.py [--iterations 200] [--only process_stock_data]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import clear_caches, load_server, save_results, setup_environment, summarize_latencies
+
+
+def time_calls(func, iterations, setup=None):
+    """Time each call separately so the percentiles can be reported."""
+    latencies = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return summarize_latencies(latencies)
+
+
+def build_benchmarks(server, iterations):
+    from db import models
+
+    from bench_process_stock_data import make_frame
+
+    intraday = server.market_data.download("AAPL", interval="5m", period="1d")
+    daily = server.market_data.download("AAPL", interval="1d", period="2mo")
+    long_frame = make_frame(10_000)
+    # what the old process_stock_data passed in: the printed Series of one row cell
+    series_text = str(intraday.iloc[-1].get("Close"))
+
+    user = models.User(nickname="bench", email="bench@example.com")
+    user.set_password("correct horse battery staple")
+
+    def warm_cache():
+        clear_caches(server)
+        server.fetch_stock_data("AAPL", "1d", "2mo")
+
+    return {
+        "process_stock_data_5m_1d": (lambda: server.process_stock_data(intraday, "5m"), iterations, None),
+        "process_stock_data_1d_2mo": (lambda: server.process_stock_data(daily, "1d"), iterations, None),
+        "process_stock_data_10k_bars": (lambda: server.process_stock_data(long_frame, "5m"), max(iterations // 20, 5), None),
+        "extract_float_from_dictionary": (lambda: server.extract_float_from_dictionary(series_text), iterations * 10, None),
+        "fetch_stock_data_hit": (lambda: server.fetch_stock_data("AAPL", "1d", "2mo"), iterations * 10, None),
+        "fetch_stock_data_derived_hit": (lambda: server.fetch_stock_data("AAPL", "1d", "5d"), iterations, None),
+        "fetch_stock_data_miss": (lambda: server.fetch_stock_data("AAPL", "1d", "2mo"), max(iterations // 10, 5), lambda: clear_caches(server)),
+        "check_password": (lambda: user.check_password("correct horse battery staple"), max(iterations // 40, 3), None),
+    }, warm_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--only", help="comma separated benchmark names")
+    parser.add_argument("--out", help="directory for the JSON results")
+    args = parser.parse_args()
+
+    setup_environment(provider="synthetic")
+    server = load_server()
+    benchmarks, warm_cache = build_benchmarks(server, args.iterations)
+    selected = set(args.only.split(",")) if args.only else None
+
+    results = {}
+    for name, (func, iterations, setup) in benchmarks.items():
+        if selected is not None and name not in selected:
+            continue
+        warm_cache()
+        results[name] = time_calls(func, iterations, setup)
+        summary = results[name]
+        print(f"{name:32s} n={summary['count']:5d} p50={summary['p50_ms']:9.3f} ms "
+              f"p95={summary['p95_ms']:9.3f} ms p99={summary['p99_ms']:9.3f} ms")
+
+    print(f"Saved {save_results('micro', results, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
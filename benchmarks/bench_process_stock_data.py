@@ -0,0 +1,109 @@
+# benchmarks/bench_process_stock_data.py
+"""Compare the columnar process_stock_data with the old iterrows version.
+
+Run from the project root:
+    python benchmarks/bench_process_stock_data.py [--bars 10000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import setup_environment
+
+if "services.server" not in sys.modules:
+    setup_environment(provider="synthetic")
+
+import numpy as np
+import pandas as pd
+
+from services.server import extract_float_from_dictionary, process_stock_data
+
+
+def legacy_process_stock_data(stock_data, interval):
+    """The iterrows + string parsing implementation kept for comparison."""
+    if stock_data is None or stock_data.empty:
+        return None
+
+    result = {}
+
+    if interval == '1d':
+        time_series_key = "Time Series (Daily)"
+    else:
+        time_series_key = f"Time Series ({interval})"
+
+    result[time_series_key] = {}
+
+    for index, row in stock_data.iterrows():
+        date_str = index.strftime('%Y-%m-%d %H:%M:%S')
+
+        open_val = extract_float_from_dictionary(str(row.get('Open', 0)))
+        high_val = extract_float_from_dictionary(str(row.get('High', 0)))
+        low_val = extract_float_from_dictionary(str(row.get('Low', 0)))
+        close_val = extract_float_from_dictionary(str(row.get('Close', 0)))
+        volume_val = extract_float_from_dictionary(str(row.get('Volume', 0)))
+
+        result[time_series_key][date_str] = {
+            "1. open": open_val,
+            "2. high": high_val,
+            "3. low": low_val,
+            "4. close": close_val,
+            "5. volume": volume_val,
+        }
+
+    return result
+
+
+def make_frame(bars, symbol="AAPL", interval="5m"):
+    """Build a yfinance shaped frame with (Price, Ticker) columns."""
+    rng = np.random.default_rng(42)
+    freq = "5min" if interval == "5m" else "D"
+    index = pd.date_range("2020-01-01 09:30", periods=bars, freq=freq, tz="America/New_York")
+    close = 100 + np.cumsum(rng.normal(0, 0.5, bars))
+    high = close + rng.random(bars)
+    low = close - rng.random(bars)
+    open_ = low + (high - low) * rng.random(bars)
+    volume = rng.integers(1_000, 1_000_000, bars).astype(float)
+    columns = pd.MultiIndex.from_product(
+        [["Close", "High", "Low", "Open", "Volume"], [symbol]], names=["Price", "Ticker"]
+    )
+    values = np.column_stack([close, high, low, open_, volume])
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bars", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--interval", default="5m")
+    args = parser.parse_args()
+
+    frame = make_frame(args.bars, interval=args.interval)
+
+    if legacy_process_stock_data(frame, args.interval) != process_stock_data(frame, args.interval):
+        print("Error: columnar output differs from the legacy output")
+        sys.exit(1)
+
+    legacy = best_of(lambda: legacy_process_stock_data(frame, args.interval), max(1, args.repeat // 2))
+    columnar = best_of(lambda: process_stock_data(frame, args.interval), args.repeat)
+
+    print(f"bars={args.bars} interval={args.interval}")
+    print(f"legacy iterrows : {legacy * 1000:9.2f} ms")
+    print(f"columnar numpy  : {columnar * 1000:9.2f} ms")
+    print(f"speedup         : {legacy / columnar:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/common.py
+"""Shared setup for the benchmarks: an offline app, timing summaries and result files."""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+
+def setup_environment(provider="synthetic", latency_ms=0, failure_rate=0.0, database_url=None):
+    """Point the app at an offline market data provider and a scratch database.
+
+    Has to run before services.server is imported, the server reads its
+    configuration at import time.
+    """
+    sys.path.insert(0, PROJECT_ROOT)
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "db"))
+
+    if database_url is None:
+        database_file = os.path.join(tempfile.mkdtemp(prefix="borsa-bench-"), "bench.db")
+        database_url = f"sqlite:///{database_file}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["MARKET_DATA_PROVIDER"] = provider
+    os.environ["SYNTHETIC_LATENCY_MS"] = str(latency_ms)
+    os.environ["SYNTHETIC_FAILURE_RATE"] = str(failure_rate)
+    os.environ.setdefault("STOCK_LIST_PATH", os.path.join(PROJECT_ROOT, "services", "service_stock_list.json"))
+    # the cache warmer would race the scenarios for the same keys
+    os.environ.pop("POLLING_INTERVAL_SECONDS", None)
+    # every simulated user comes from 127.0.0.1, one bucket would throttle them all
+    os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+
+
+def load_server():
+    """Import the Flask app and create the tables in the scratch database."""
+    from db import models
+    from db.database import engine
+    from services import server
+
+    models.Base.metadata.create_all(bind=engine)
+    return server
+
+
+def clear_caches(server):
+    """Forget everything the app cached in process, the next requests are cold."""
+    server.stock_cache.clear()
+    server.stale_cache.clear()
+    server.response_cache.clear()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    position = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[position]
+
+
+def summarize_latencies(latencies):
+    """p50/p95/p99, mean and max of latencies given in seconds, reported in milliseconds."""
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def save_results(name, results, out_dir=None):
+    """Write the results with the commit and environment they were measured on."""
+    out_dir = out_dir or RESULTS_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    revision = git_revision()
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    document = {
+        "benchmark": name,
+        "revision": revision,
+        "timestamp": timestamp.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    path = os.path.join(out_dir, f"{name}-{revision or 'unknown'}-{timestamp.strftime('%Y%m%dT%H%M%S')}.json")
+    with open(path, "w") as file:
+        json.dump(document, file, indent=2)
+    return path
@@ -0,0 +1,41 @@
+# benchmarks/compare.py
+"""Compare two saved benchmark result files.
+
+    python benchmarks/compare.py benchmarks/results/load-<old>.json benchmarks/results/load-<new>.json
+"""
+
+import argparse
+import json
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps", "rate_503"]
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"{baseline['benchmark']}: {baseline['revision']} -> {candidate['revision']}")
+
+    for name, before in baseline["results"].items():
+        after = candidate["results"].get(name)
+        if not isinstance(before, dict) or not isinstance(after, dict) or "count" not in before:
+            continue
+        print(name)
+        for metric in METRICS:
+            if before.get(metric) is None or after.get(metric) is None:
+                continue
+            old, new = before[metric], after[metric]
+            change = f"{(new - old) / old:+.1%}" if old else "n/a"
+            print(f"    {metric:16s} {old:12.3f} -> {new:12.3f}  {change}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# benchmarks/load_test.py
+"""Replay the frontend request patterns against the Flask API.
+
+By default the app is started in process on a free port with the synthetic
+market data provider, so no request leaves the machine. Use --url to run the
+same scenarios against a deployment instead.
+
+Run from the project root:
+    python benchmarks/load_test.py [--scenarios dashboard,details,login] [--users 10] [--latency-ms 200] [--asgi]
+
+Scenarios:
+    dashboard        stock_charts page: every symbol of /api/stock_symbols, 5m/1d and 1d/5d each
+    dashboard_batch  stock_charts page through /stock/batch, two requests per user
+    details          stockdetails page: 1d/1mo of a random symbol
+    login            login storm: every user posts /login at once
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import clear_caches, load_server, save_results, setup_environment, summarize_latencies
+
+BENCH_EMAIL = "loadtest@example.com"
+BENCH_PASSWORD = "loadtest-password"
+# mirrors MAX_BATCH_SYMBOLS in services/server.py, larger /stock/batch requests are rejected
+MAX_BATCH_SYMBOLS = 50
+
+
+class Recorder:
+    """Collects the latency and status of every request of a scenario."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+
+    def request(self, url, data=None):
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"} if body else {})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                status = response.status
+                payload = response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            payload = e.read()
+        except Exception:
+            status = "error"
+            payload = b""
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status, payload
+
+    def summary(self, elapsed):
+        total = sum(self.statuses.values())
+        return {
+            **summarize_latencies(self.latencies),
+            "duration_s": elapsed,
+            "throughput_rps": total / elapsed if elapsed else None,
+            "status_counts": {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            "rate_503": self.statuses.get(503, 0) / total if total else 0.0,
+            "error_rate": sum(c for s, c in self.statuses.items() if s == "error" or s >= 500) / total if total else 0.0,
+        }
+
+
+def dashboard_user(recorder, base_url, user_index):
+    status, payload = recorder.request(f"{base_url}/api/stock_symbols")
+    symbols = json.loads(payload) if status == 200 else []
+    # the page requests one symbol after the other
+    for symbol in symbols:
+        recorder.request(f"{base_url}/stock/{symbol}?interval=5m&period=1d")
+        recorder.request(f"{base_url}/stock/{symbol}?interval=1d&period=5d")
+
+
+def dashboard_batch_user(recorder, base_url, user_index):
+    status, payload = recorder.request(f"{base_url}/api/stock_symbols")
+    symbols = json.loads(payload) if status == 200 else []
+    for start in range(0, len(symbols), MAX_BATCH_SYMBOLS):
+        joined = ",".join(symbols[start:start + MAX_BATCH_SYMBOLS])
+        recorder.request(f"{base_url}/stock/batch?symbols={joined}&interval=5m&period=1d")
+        recorder.request(f"{base_url}/stock/batch?symbols={joined}&interval=1d&period=5d")
+
+
+def details_user(recorder, base_url, user_index, symbols, requests_per_user=5):
+    rng = random.Random(user_index)
+    for _ in range(requests_per_user):
+        recorder.request(f"{base_url}/stock/{rng.choice(symbols)}?interval=1d&period=1mo")
+
+
+def login_user(recorder, base_url, user_index):
+    recorder.request(f"{base_url}/login", {"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+
+
+def run_scenario(name, base_url, users, symbols):
+    if name == "dashboard":
+        work = dashboard_user
+    elif name == "dashboard_batch":
+        work = dashboard_batch_user
+    elif name == "details":
+        work = lambda recorder, url, index: details_user(recorder, url, index, symbols)
+    elif name == "login":
+        work = login_user
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=users) as pool:
+        futures = [pool.submit(work, recorder, base_url, index) for index in range(users)]
+        for future in futures:
+            future.result()
+    return recorder.summary(time.perf_counter() - start)
+
+
+def start_local_server(server):
+    """Serve the app on a free local port with werkzeug's threaded server."""
+    from werkzeug.serving import make_server
+
+    http_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    return http_server, f"http://127.0.0.1:{http_server.server_port}"
+
+
+class AsgiServer:
+    """The async serving mode on uvicorn, with the shutdown() of the werkzeug server."""
+
+    def __init__(self, uvicorn_server, thread):
+        self._server = uvicorn_server
+        self._thread = thread
+
+    def shutdown(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def start_local_asgi_server():
+    """Serve services.asgi on a free local port with uvicorn."""
+    import socket
+
+    import uvicorn
+
+    from services import asgi
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    config = uvicorn.Config(asgi.app, log_level="error", backlog=4096)
+    uvicorn_server = uvicorn.Server(config)
+    thread = threading.Thread(target=uvicorn_server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not uvicorn_server.started:
+        time.sleep(0.01)
+    return AsgiServer(uvicorn_server, thread), f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def create_login_user(server):
+    from services import crud
+
+    with server.db_session_scope() as db_session:
+        if crud.get_user_by_email(db_session, BENCH_EMAIL) is None:
+            crud.create_user(db_session, nickname="loadtest", email=BENCH_EMAIL, password=BENCH_PASSWORD)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="dashboard,dashboard_batch,details,login")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--latency-ms", type=float, default=200, help="synthetic upstream latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="synthetic upstream failure rate")
+    parser.add_argument("--provider", default="synthetic", choices=["synthetic", "replay"])
+    parser.add_argument("--warm", action="store_true", help="keep the caches between scenarios")
+    parser.add_argument("--asgi", action="store_true", help="serve the async mode with uvicorn instead of werkzeug")
+    parser.add_argument("--url", help="run against this base url instead of an in-process app")
+    parser.add_argument("--out", help="directory for the JSON results")
+    args = parser.parse_args()
+
+    server = None
+    http_server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        setup_environment(provider=args.provider, latency_ms=args.latency_ms, failure_rate=args.failure_rate)
+        server = load_server()
+        # silence the per request logging of the app and werkzeug
+        import logging
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        create_login_user(server)
+        http_server, base_url = start_local_asgi_server() if args.asgi else start_local_server(server)
+
+    with urllib.request.urlopen(f"{base_url}/api/stock_symbols", timeout=30) as response:
+        symbols = json.loads(response.read())
+
+    results = {"config": vars(args)}
+    try:
+        for name in args.scenarios.split(","):
+            if server is not None and not args.warm:
+                clear_caches(server)
+            summary = run_scenario(name, base_url, args.users, symbols)
+            results[name] = summary
+            print(f"{name:16s} n={summary['count']:6d} p50={summary['p50_ms']:9.2f} ms "
+                  f"p95={summary['p95_ms']:9.2f} ms p99={summary['p99_ms']:9.2f} ms "
+                  f"rps={summary['throughput_rps']:8.1f} 503={summary['rate_503']:.2%}")
+    finally:
+        if http_server is not None:
+            http_server.shutdown()
+
+    print(f"Saved {save_results('load', results, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
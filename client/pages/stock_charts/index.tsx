@@ -7,7 +7,7 @@ import NextLink from "next/link";
 
 import DefaultLayout from "@/layouts/default";
 import { title } from "@/components/primitives";
-import { fetchStockData } from "@/utils/fetchStockData";
+import { fetchStockDataBatch } from "@/utils/fetchStockData";
 
 interface StockData {
   symbol: string;
@@ -81,42 +81,18 @@ const StockListPage: React.FC = () => {
 
       const stockListItemsUpdated: StockListItem[] = [];
 
+      // batched requests per interval/period instead of two requests per symbol
+      const [intradayBatch, historyBatch] = await Promise.all([
+        fetchStockDataBatch(symbolsData, "5m", "1d"),
+        fetchStockDataBatch(symbolsData, "1d", "5d"),
+      ]);
+
       for (const symbol of symbolsData) {
         try {
-          let intradayData: StockData;
-
-          try {
-            intradayData = await fetchStockData(symbol, "5m", "1d");
-          } catch (e) {
-            intradayData = await fetchStockData(symbol, "1d", "1d");
-          }
-
-          let historyData: StockData;
-
-          try {
-            historyData = await fetchStockData(symbol, "1d", "5d");
-          } catch (e) {
-            historyData = await fetchStockData(symbol, "1d", "1wk");
-          }
-
-          if (intradayData.symbol !== symbol) {
-            console.error(
-              `Symbol mismatch: expected ${symbol}, got ${intradayData.symbol}`
-            );
-            intradayData.symbol = symbol;
-          }
-
-          if (historyData.symbol !== symbol) {
-            console.error(
-              `Symbol mismatch: expected ${symbol}, got ${historyData.symbol}`
-            );
-            historyData.symbol = symbol;
-          }
-
           const processedItem = processStockData(
             symbol,
-            intradayData,
-            historyData
+            intradayBatch[symbol],
+            historyBatch[symbol]
           );
 
           stockListItemsUpdated.push(processedItem);
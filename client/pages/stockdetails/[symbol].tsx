@@ -3,7 +3,7 @@ import dynamic from "next/dynamic";
 import React, { useState, useEffect } from "react";
 import { ApexOptions } from "apexcharts";
 
-import { fetchStockData, StockData } from "@/utils/fetchStockData";
+import { fetchStockColumns, StockColumns } from "@/utils/fetchStockData";
 import DefaultLayout from "@/layouts/default";
 
 const ApexChart = dynamic(() => import("react-apexcharts"), {
@@ -21,18 +21,14 @@ const StockDetailPage = () => {
         ? symbolQuery[0]
         : ""; // get symbol string safely
 
-  const [historyData, setHistoryData] = useState<StockData | null>(null);
+  const [historyData, setHistoryData] = useState<StockColumns | null>(null);
 
   useEffect(() => {
     if (symbol) {
       const fetchData = async () => {
-        let data: StockData | null = null;
+        // columnar MessagePack, the bars arrive as parallel arrays ready for the chart
+        const data = await fetchStockColumns(symbol, "1d", "1mo"); // 1 month now TODO, give option to look further in history
 
-        try {
-          data = (await fetchStockData(symbol, "1d", "1mo")) as StockData; // 1 month now TODO, give option to look further in history
-        } catch (e) {
-          data = (await fetchStockData(symbol, "1d", "2mo")) as StockData;
-        }
         setHistoryData(data); // set the history data
       };
 
@@ -93,23 +89,14 @@ const StockDetailPage = () => {
 
     useEffect(() => {
       if (historyData && !historyData.error) {
-        // process the historyData to extract dates and prices for ApexCharts
-        const timeSeriesKey = Object.keys(historyData).find(
-          (key) => key.startsWith("Time Series") || key.includes("Series")
-        );
-
-        if (timeSeriesKey && historyData[timeSeriesKey]) {
-          const timeSeries = historyData[timeSeriesKey];
-          const dataPoints = Object.entries(timeSeries)
-            .map(([date, values]: [string, any]) => {
-              return [
-                new Date(date).getTime(),
-                parseFloat(
-                  values["4. close"] || values["close"] || values["Close"]
-                ),
-              ];
-            })
-            .sort((a, b) => a[0] - b[0]); // Sort data points by date
+        // pair the timestamps with the closes for ApexCharts, the server sends them oldest first
+        const { timestamps, close } = historyData;
+
+        if (timestamps.length > 0 && timestamps.length === close.length) {
+          const dataPoints = timestamps.map((timestamp, i) => [
+            timestamp,
+            close[i],
+          ]);
 
           setState((prevState) => ({
             ...prevState,
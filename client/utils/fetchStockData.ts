@@ -1,4 +1,6 @@
 // src/utils/fetchStockData.ts
+import { decodeMsgpack } from "./msgpack";
+
 export interface StockData {
   symbol: string;
   interval: string;
@@ -7,14 +9,21 @@ export interface StockData {
   error?: string;
 }
 
+// maxPoints caps the number of bars, the server keeps the ones that shape the close line (LTTB)
 export const fetchStockData = async (
   symbol: string,
   interval: string,
-  period: string
+  period: string,
+  maxPoints?: number
 ): Promise<StockData> => {
   try {
     const apiBaseUrl = process.env.NEXT_PUBLIC_BTAKIP_API_BASE_URL;
-    const queryString = new URLSearchParams({ interval, period }).toString();
+    const params: Record<string, string> = { interval, period };
+
+    if (maxPoints) {
+      params.max_points = String(maxPoints);
+    }
+    const queryString = new URLSearchParams(params).toString();
 
     console.log(
       `Fetching ${symbol} data with interval=${interval}, period=${period}`
@@ -81,3 +90,174 @@ export const fetchStockData = async (
     };
   }
 };
+
+// format=columnar: parallel arrays instead of one object per bar, missing values are null (nil in MessagePack)
+export interface StockColumns {
+  symbol: string;
+  interval: string;
+  period: string;
+  timezone?: string | null;
+  timestamps: number[]; // epoch milliseconds, ready for chart x values
+  open: (number | null)[];
+  high: (number | null)[];
+  low: (number | null)[];
+  close: (number | null)[];
+  volume: (number | null)[];
+  error?: string;
+}
+
+export const fetchStockColumns = async (
+  symbol: string,
+  interval: string,
+  period: string,
+  binary = true,
+  maxPoints?: number
+): Promise<StockColumns> => {
+  const empty = {
+    symbol,
+    interval,
+    period,
+    timestamps: [],
+    open: [],
+    high: [],
+    low: [],
+    close: [],
+    volume: [],
+  };
+
+  try {
+    const apiBaseUrl = process.env.NEXT_PUBLIC_BTAKIP_API_BASE_URL;
+    const params: Record<string, string> = {
+      interval,
+      period,
+      format: "columnar",
+    };
+
+    if (maxPoints) {
+      params.max_points = String(maxPoints);
+    }
+    const queryString = new URLSearchParams(params).toString();
+
+    const response = await fetch(
+      `${apiBaseUrl}/stock/${symbol}?${queryString}`,
+      {
+        headers: {
+          Accept: binary
+            ? "application/msgpack, application/json;q=0.5"
+            : "application/json",
+        },
+      }
+    );
+
+    if (!response.ok) {
+      let errorData;
+
+      try {
+        errorData = await response.json();
+      } catch (e) {
+        errorData = {};
+      }
+
+      return {
+        ...empty,
+        error:
+          errorData.error ||
+          `Failed to fetch data: ${response.status} ${response.statusText}`,
+      };
+    }
+
+    const contentType = response.headers.get("Content-Type") || "";
+    const data = contentType.includes("msgpack")
+      ? decodeMsgpack(await response.arrayBuffer())
+      : await response.json();
+
+    return {
+      ...empty,
+      ...data,
+      symbol,
+      period,
+      // the server sends epoch seconds
+      timestamps: (data.timestamps as number[]).map(
+        (seconds) => seconds * 1000
+      ),
+    };
+  } catch (err: any) {
+    console.error(`Network error fetching ${symbol}:`, err);
+
+    return { ...empty, error: `Network error: ${err.message}` };
+  }
+};
+
+// mirrors MAX_BATCH_SYMBOLS on the server, larger /stock/batch requests are rejected
+export const MAX_BATCH_SYMBOLS = 50;
+
+const fetchStockDataChunk = async (
+  symbols: string[],
+  interval: string,
+  period: string
+): Promise<Record<string, StockData>> => {
+  const result: Record<string, StockData> = {};
+
+  try {
+    const apiBaseUrl = process.env.NEXT_PUBLIC_BTAKIP_API_BASE_URL;
+    const queryString = new URLSearchParams({
+      symbols: symbols.join(","),
+      interval,
+      period,
+    }).toString();
+
+    const response = await fetch(`${apiBaseUrl}/stock/batch?${queryString}`);
+
+    if (!response.ok) {
+      throw new Error(
+        `Failed to fetch batch data: ${response.status} ${response.statusText}`
+      );
+    }
+
+    const data = await response.json();
+
+    for (const symbol of symbols) {
+      result[symbol] = {
+        symbol,
+        interval,
+        period,
+        ...(data[symbol] || { error: `No data returned for ${symbol}` }),
+      };
+    }
+  } catch (err: any) {
+    console.error("Error fetching batch stock data:", err);
+
+    for (const symbol of symbols) {
+      result[symbol] = {
+        symbol,
+        interval,
+        period,
+        error: `Network error: ${err.message}`,
+      };
+    }
+  }
+
+  return result;
+};
+
+export const fetchStockDataBatch = async (
+  symbols: string[],
+  interval: string,
+  period: string
+): Promise<Record<string, StockData>> => {
+  const chunks: string[][] = [];
+
+  for (let start = 0; start < symbols.length; start += MAX_BATCH_SYMBOLS) {
+    chunks.push(symbols.slice(start, start + MAX_BATCH_SYMBOLS));
+  }
+
+  console.log(
+    `Fetching ${symbols.length} symbols in ${chunks.length} batches with interval=${interval}, period=${period}`
+  );
+
+  const results = await Promise.all(
+    chunks.map((chunk) => fetchStockDataChunk(chunk, interval, period))
+  );
+
+  return Object.assign({}, ...results);
+};
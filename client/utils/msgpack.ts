@@ -0,0 +1,159 @@
+// src/utils/msgpack.ts
+// Decoder for the MessagePack bodies of the API (format=columnar with Accept: application/msgpack).
+// Covers the types the server writes: nil, booleans, integers, floats, strings, binary, arrays and maps.
+
+class Reader {
+  private view: DataView;
+  private bytes: Uint8Array;
+  private textDecoder = new TextDecoder();
+  offset = 0;
+
+  constructor(buffer: ArrayBuffer) {
+    this.view = new DataView(buffer);
+    this.bytes = new Uint8Array(buffer);
+  }
+
+  read(): any {
+    const tag = this.view.getUint8(this.offset++);
+
+    if (tag < 0x80) return tag; // positive fixint
+    if (tag >= 0xe0) return tag - 0x100; // negative fixint
+    if (tag >= 0xa0 && tag <= 0xbf) return this.string(tag & 0x1f);
+    if (tag >= 0x90 && tag <= 0x9f) return this.array(tag & 0x0f);
+    if (tag >= 0x80 && tag <= 0x8f) return this.map(tag & 0x0f);
+
+    switch (tag) {
+      case 0xc0:
+        return null;
+      case 0xc2:
+        return false;
+      case 0xc3:
+        return true;
+      case 0xc4:
+        return this.binary(this.uint(1));
+      case 0xc5:
+        return this.binary(this.uint(2));
+      case 0xc6:
+        return this.binary(this.uint(4));
+      case 0xca:
+        return this.number(4, (offset) => this.view.getFloat32(offset));
+      case 0xcb:
+        return this.number(8, (offset) => this.view.getFloat64(offset));
+      case 0xcc:
+        return this.uint(1);
+      case 0xcd:
+        return this.uint(2);
+      case 0xce:
+        return this.uint(4);
+      case 0xcf:
+        return this.number(8, (offset) =>
+          Number(this.view.getBigUint64(offset))
+        );
+      case 0xd0:
+        return this.number(1, (offset) => this.view.getInt8(offset));
+      case 0xd1:
+        return this.number(2, (offset) => this.view.getInt16(offset));
+      case 0xd2:
+        return this.number(4, (offset) => this.view.getInt32(offset));
+      case 0xd3:
+        return this.number(8, (offset) =>
+          Number(this.view.getBigInt64(offset))
+        );
+      case 0xd9:
+        return this.string(this.uint(1));
+      case 0xda:
+        return this.string(this.uint(2));
+      case 0xdb:
+        return this.string(this.uint(4));
+      case 0xdc:
+        return this.array(this.uint(2));
+      case 0xdd:
+        return this.array(this.uint(4));
+      case 0xde:
+        return this.map(this.uint(2));
+      case 0xdf:
+        return this.map(this.uint(4));
+      default:
+        throw new Error(`Unsupported MessagePack type 0x${tag.toString(16)}`);
+    }
+  }
+
+  private number(size: number, get: (offset: number) => number): number {
+    const value = get(this.offset);
+
+    this.offset += size;
+
+    return value;
+  }
+
+  private uint(size: number): number {
+    if (size === 1) {
+      return this.number(1, (offset) => this.view.getUint8(offset));
+    }
+    if (size === 2) {
+      return this.number(2, (offset) => this.view.getUint16(offset));
+    }
+
+    return this.number(4, (offset) => this.view.getUint32(offset));
+  }
+
+  private string(length: number): string {
+    const value = this.textDecoder.decode(
+      this.bytes.subarray(this.offset, this.offset + length)
+    );
+
+    this.offset += length;
+
+    return value;
+  }
+
+  private binary(length: number): Uint8Array {
+    const value = this.bytes.slice(this.offset, this.offset + length);
+
+    this.offset += length;
+
+    return value;
+  }
+
+  private array(length: number): any[] {
+    // the float columns of the server are blocks of float64 with nil for missing values,
+    // read them without the generic dispatch
+    const result = new Array(length);
+    let index = 0;
+
+    while (index < length) {
+      const tag = this.view.getUint8(this.offset);
+
+      if (tag === 0xcb) {
+        result[index++] = this.view.getFloat64(this.offset + 1);
+        this.offset += 9;
+      } else if (tag === 0xc0) {
+        result[index++] = null;
+        this.offset += 1;
+      } else {
+        break;
+      }
+    }
+    for (; index < length; index++) {
+      result[index] = this.read();
+    }
+
+    return result;
+  }
+
+  private map(length: number): Record<string, any> {
+    const result: Record<string, any> = {};
+
+    for (let index = 0; index < length; index++) {
+      const key = this.read();
+
+      result[String(key)] = this.read();
+    }
+
+    return result;
+  }
+}
+
+export const decodeMsgpack = (buffer: ArrayBuffer): any => {
+  return new Reader(buffer).read();
+};
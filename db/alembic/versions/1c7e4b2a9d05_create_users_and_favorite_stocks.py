@@ -0,0 +1,57 @@
+"""create users and favorite_stocks tables
+
+Revision ID: 1c7e4b2a9d05
+Revises:
+Create Date: 2026-10-16 09:00:00.000000
+
+The tables create_database() has always created. A database that was set up
+with create_database() before the migrations existed already has them, mark
+it as migrated to here and upgrade from there:
+    alembic stamp 1c7e4b2a9d05
+    alembic upgrade head
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c7e4b2a9d05'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nickname', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('password_hash', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_nickname'), 'users', ['nickname'], unique=True)
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+
+    op.create_table(
+        'favorite_stocks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('stock_name', sa.String(length=5), nullable=False),
+        sa.Column('stock_double', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'stock_name', name='unique_user_stock'),
+    )
+    op.create_index(op.f('ix_favorite_stocks_id'), 'favorite_stocks', ['id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_favorite_stocks_id'), table_name='favorite_stocks')
+    op.drop_table('favorite_stocks')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_index(op.f('ix_users_nickname'), table_name='users')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_table('users')
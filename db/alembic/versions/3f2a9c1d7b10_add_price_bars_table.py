@@ -0,0 +1,35 @@
+"""add price_bars table
+
+Revision ID: 3f2a9c1d7b10
+Revises: 1c7e4b2a9d05
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b10'
+down_revision = '1c7e4b2a9d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'price_bars',
+        sa.Column('symbol', sa.String(length=10), nullable=False),
+        sa.Column('interval', sa.String(length=5), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('open', sa.Float(), nullable=True),
+        sa.Column('high', sa.Float(), nullable=True),
+        sa.Column('low', sa.Float(), nullable=True),
+        sa.Column('close', sa.Float(), nullable=True),
+        sa.Column('volume', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('symbol', 'interval', 'timestamp'),
+    )
+
+
+def downgrade():
+    op.drop_table('price_bars')
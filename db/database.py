@@ -1,6 +1,8 @@
 # db/database.py
 import subprocess
+from contextlib import contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os 
@@ -10,7 +12,22 @@ load_dotenv()
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+def pool_options(database_url):
+    """Connection pool settings from the environment, the defaults fit one app process."""
+    options = {
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE_SECONDS", 1800)),
+    }
+    # sqlite uses a pool without size limits, the server databases get a bounded one
+    if make_url(database_url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=int(os.environ.get("DB_POOL_SIZE", 10)),
+            max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", 10)),
+        )
+    return options
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -22,7 +39,17 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def session_scope():
+    """Session for one unit of work outside a request, always closed at the end of the block."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def create_database(): # Function to create the database and tables
+    # creates every table of the alembic head, run "alembic stamp head" afterwards so later migrations apply
     Base.metadata.create_all(bind=engine)
 
 def run_migrations():
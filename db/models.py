@@ -1,5 +1,5 @@
 # db/models.py
-from sqlalchemy import Column, Integer, String, ARRAY, Float, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ARRAY, Float, ForeignKey, UniqueConstraint, DateTime
 from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import expression
 from database import Base 
@@ -43,4 +43,17 @@ class FavoriteStock(Base):
         # Enforce max length of 5
         if len(stock_name) > 5: 
             raise ValueError("Stock name must be 5 characters or less.")
-        return stock_name
\ No newline at end of file
+        return stock_name
+
+class PriceBar(Base):
+    __tablename__ = 'price_bars'
+
+    # (symbol, interval, timestamp) is both the identity and the range scan index
+    symbol = Column(String(10), primary_key=True)
+    interval = Column(String(5), primary_key=True)
+    timestamp = Column(DateTime, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
@@ -0,0 +1,154 @@
+# services/admission.py
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
+
+from cachetools import TTLCache
+
+# lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class QueueFull(Exception):
+    """Raised when a call is not admitted because the queue in front of the work is full."""
+
+
+class AdmissionQueue:
+    """
+    Bounded priority queue with its own workers in front of the upstream fetches.
+
+    When the queue is full a new call is rejected right away instead of waiting
+    behind calls that would time out anyway. A more urgent call pushes out the
+    newest of the least urgent queued calls, whose future fails with QueueFull.
+    """
+
+    def __init__(self, max_workers, max_queue, name, queued=None, active=None, queue_wait=None, rejected=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.name = name
+        self._queued = queued.labels(name) if queued is not None else None
+        self._active = active.labels(name) if active is not None else None
+        self._queue_wait = queue_wait.labels(name) if queue_wait is not None else None
+        self._rejected = rejected
+        self._heap = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def lane(self, priority):
+        """Return an executor like object that submits with the given priority."""
+        return _Lane(self, priority)
+
+    def submit(self, priority, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        item = (priority, next(self._order), time.perf_counter(), future, fn, args, kwargs)
+        with self._condition:
+            if len(self._heap) >= self.max_queue:
+                dropped = self._least_urgent()
+                if dropped is None or dropped[0] <= priority:
+                    self._reject(priority)
+                    raise QueueFull(f"{self.name} queue is full")
+                self._heap.remove(dropped)
+                heapq.heapify(self._heap)
+                self._reject(dropped[0])
+                dropped[3].set_exception(QueueFull(f"{self.name} queue is full"))
+                if self._queued is not None:
+                    self._queued.dec()
+            heapq.heappush(self._heap, item)
+            if self._queued is not None:
+                self._queued.inc()
+            self._ensure_workers()
+            self._condition.notify()
+        return future
+
+    def queued(self):
+        with self._condition:
+            return len(self._heap)
+
+    def _least_urgent(self):
+        if not self._heap:
+            return None
+        # highest priority number, newest first among equals
+        return max(self._heap, key=lambda item: (item[0], item[1]))
+
+    def _reject(self, priority):
+        if self._rejected is not None:
+            self._rejected.labels(self.name, "interactive" if priority == INTERACTIVE else "background").inc()
+
+    def _ensure_workers(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}_{len(self._threads)}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                _, _, submitted, future, fn, args, kwargs = heapq.heappop(self._heap)
+                if self._queued is not None:
+                    self._queued.dec()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            if self._queue_wait is not None:
+                self._queue_wait.observe(time.perf_counter() - submitted)
+            if self._active is not None:
+                self._active.inc()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                if self._active is not None:
+                    self._active.dec()
+
+
+class _Lane:
+    def __init__(self, queue, priority):
+        self._queue = queue
+        self._priority = priority
+
+    def submit(self, fn, *args, **kwargs):
+        return self._queue.submit(self._priority, fn, *args, **kwargs)
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket per client key (client address, with the user id of the URL).
+
+    Each client gets `burst` tokens that refill at `rate` per second, a request
+    takes one. Idle clients are forgotten after a while, so the memory stays
+    bounded by max_clients.
+    """
+
+    def __init__(self, rate, burst, max_clients=10000, idle_seconds=600):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(maxsize=max_clients, ttl=idle_seconds)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def acquire(self, client_key):
+        """Take a token, returns 0 if allowed or the seconds until a token is available."""
+        if not self.enabled:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client_key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[client_key] = (tokens - 1, now)
+                return 0
+            self._buckets[client_key] = (tokens, now)
+            return (1 - tokens) / self.rate
@@ -0,0 +1,805 @@
+# services/asgi.py
+"""
+Async serving mode of the API.
+
+The stock, symbol list and favorites endpoints run on an event loop, so a client
+waiting on an upstream download holds a coroutine instead of a thread. The
+blocking provider and database calls run on small dedicated thread pools whose
+size is enforced by a semaphore. A waiter that times out or disconnects is
+cancelled, and a download nobody waits for anymore is cancelled before it takes
+a thread. The quote stream waits for its events on the event loop, an open
+stream holds no thread either. Every other route is served by the Flask app,
+each of its requests on a thread of the WSGI pool.
+
+Run from the project root:
+    uvicorn services.asgi:app --host 0.0.0.0 --port 5000
+
+Environment variables:
+    ASYNC_UPSTREAM_CONCURRENCY  market data downloads running at once (default 4)
+    ASYNC_DB_CONCURRENCY        database units of work and file reads running at once (default 5)
+    ASYNC_WSGI_THREADS          requests of the Flask app served at once (default 10)
+"""
+
+import sys
+import os
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_accept_header, parse_etags
+
+from services import crud, server
+from services.admission import QueueFull
+from services.circuit_breaker import CircuitOpenError
+from services.metrics import Gauge, InstrumentedThreadPoolExecutor
+from services.quote_stream import format_sse
+from services.range_cache import derive_stock_data
+from services.singleflight import AsyncSingleFlight
+from services.wire_format import negotiate_format
+
+UPSTREAM_CONCURRENCY = int(os.environ.get("ASYNC_UPSTREAM_CONCURRENCY", 4))
+DB_CONCURRENCY = int(os.environ.get("ASYNC_DB_CONCURRENCY", 5))
+WSGI_THREADS = int(os.environ.get("ASYNC_WSGI_THREADS", 10))
+
+ASYNC_WAITERS = Gauge("async_requests_waiting", "Async requests waiting on a blocking call.", ["pool"])
+
+
+class BlockingPool:
+    """
+    Runs blocking calls on a thread pool without ever queueing more calls than it has threads.
+
+    Callers wait for a slot on the event loop, so a cancelled caller that has not
+    started yet never uses a thread. A call that already runs cannot be
+    interrupted, it keeps its slot until it returns so abandoned calls cannot pile
+    up behind the pool. With max_waiting set, callers beyond it are rejected with
+    QueueFull right away.
+    """
+
+    def __init__(self, name, max_concurrency, max_waiting=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self._waiting_count = 0
+        self._executor = InstrumentedThreadPoolExecutor(
+            max_workers=max_concurrency, name=f"async_{name}", queued=server.EXECUTOR_QUEUED,
+            active=server.EXECUTOR_ACTIVE, queue_wait=server.EXECUTOR_QUEUE_WAIT
+        )
+        self._semaphore = None
+        self._waiting = ASYNC_WAITERS.labels(name)
+
+    async def run(self, fn, *args, **kwargs):
+        if self._semaphore is None:
+            # created lazily so it binds to the loop of the server
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+
+        if self.max_waiting is not None and self._waiting_count >= self.max_waiting and self._semaphore.locked():
+            server.ADMISSION_REJECTED.labels(f"async_{self.name}", "interactive").inc()
+            raise QueueFull(f"{self.name} queue is full")
+
+        self._waiting_count += 1
+        self._waiting.inc()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting_count -= 1
+            self._waiting.dec()
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(lambda done: self._release(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            # the loop was closed while the call was still running, on shutdown
+            pass
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs each request on a thread of its executor instead of the one thread sensitive thread."""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        instance = _ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit, self.executor)
+        await instance(scope, receive, send)
+
+
+# run_wsgi_app below reaches into asgiref internals, requirements.txt pins the versions this was tested on
+_BASE_RUN_WSGI_APP = getattr(WsgiToAsgiInstance.__dict__.get("run_wsgi_app"), "func", None)
+if not callable(_BASE_RUN_WSGI_APP):
+    raise RuntimeError(
+        "asgiref's WsgiToAsgiInstance.run_wsgi_app is no longer a sync_to_async wrapper, "
+        "ThreadedWsgiToAsgi needs updating for this asgiref version"
+    )
+
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, duplicate_header_limit, executor):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        # the base class wraps it in a thread sensitive sync_to_async, .func is the plain method
+        run = sync_to_async(_BASE_RUN_WSGI_APP, thread_sensitive=False, executor=self.executor)
+        await run(self, body)
+
+
+upstream_pool = BlockingPool("upstream", UPSTREAM_CONCURRENCY, max_waiting=server.app.config['UPSTREAM_QUEUE_SIZE'])
+db_pool = BlockingPool("db", DB_CONCURRENCY)
+# encoding is cpu bound, more threads than cores would only queue inside the interpreter
+process_pool = BlockingPool("process", min(4, os.cpu_count() or 1))
+# plain WsgiToAsgi runs every request on one shared thread, one slow Flask route would hold up the rest
+wsgi_pool = InstrumentedThreadPoolExecutor(
+    max_workers=WSGI_THREADS, name="async_wsgi", queued=server.EXECUTOR_QUEUED,
+    active=server.EXECUTOR_ACTIVE, queue_wait=server.EXECUTOR_QUEUE_WAIT
+)
+async_stock_fetches = AsyncSingleFlight()
+# concurrent requests for the same response build it once
+async_responses = AsyncSingleFlight()
+
+# returned by wait_for_request when the client went away before the result was ready
+DISCONNECTED = object()
+# refreshes started for stale responses, referenced until they finish
+background_refreshes = set()
+
+
+async def wait_for_request(request, awaitable, timeout):
+    """
+    Await with a timeout, cancelling the wait when the client disconnects.
+
+    Raises asyncio.TimeoutError on timeout and returns DISCONNECTED on disconnect.
+    """
+    work = asyncio.ensure_future(awaitable)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({work, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if work in done:
+            return work.result()
+        if disconnected in done:
+            return DISCONNECTED
+        raise asyncio.TimeoutError()
+    finally:
+        for task in (work, disconnected):
+            if not task.done():
+                task.cancel()
+
+
+async def wait_for_disconnect(request):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+def observed(rule):
+    """Record the latency of an async endpoint like the Flask routes do."""
+    def decorator(endpoint):
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await endpoint(request)
+            server.HTTP_REQUEST_SECONDS.labels(rule, request.method, response.status_code).observe(
+                time.perf_counter() - started
+            )
+            return response
+        wrapper.__name__ = endpoint.__name__
+        wrapper.__doc__ = endpoint.__doc__
+        return wrapper
+    return decorator
+
+
+def json_response(data, status=200, headers=None):
+    # the JSON provider of the Flask app, so both serving modes produce the same bytes
+    body = server.app.json.dumps(data, separators=(",", ":")) + "\n"
+    return Response(body, status_code=status, media_type="application/json", headers=headers)
+
+
+def retry_response(message, status, retry_after):
+    return json_response({"error": message}, status, headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+
+def check_rate_limit(request, rule):
+    """Return the 429 response when the client is over its rate limit, else None."""
+    client_key = server.client_rate_limit_key(
+        request.client.host if request.client else None, request.path_params.get("user_id")
+    )
+    retry_after = server.rate_limiter.acquire(client_key)
+    if retry_after:
+        server.RATE_LIMITED.labels(rule).inc()
+        return retry_response("Too many requests, slow down.", 429, retry_after)
+    return None
+
+
+def refresh_in_background(fetch_key, symbol, interval, period):
+    """Start the coalesced fetch of a key without waiting for it."""
+    async def refresh():
+        try:
+            await async_stock_fetches.do(fetch_key, load_stock_data, symbol, interval, period)
+        except Exception as e:
+            print(f"Background refresh of {fetch_key} failed: {e}")
+
+    task = asyncio.ensure_future(refresh())
+    background_refreshes.add(task)
+    task.add_done_callback(background_refreshes.discard)
+
+
+def encoded_response(request, encoded):
+    """Response for a cached body, compressed when the client accepts gzip."""
+    headers = {"Vary": "Accept-Encoding", "ETag": f'"{encoded.etag}"'}
+    accept_encodings = parse_accept_header(request.headers.get("accept-encoding"))
+    if encoded.gzipped is not None and accept_encodings["gzip"] > 0:
+        headers["Content-Encoding"] = "gzip"
+        return Response(encoded.gzipped, status_code=200, media_type=encoded.mimetype, headers=headers)
+    return Response(encoded.body, status_code=200, media_type=encoded.mimetype, headers=headers)
+
+
+async def load_stock_data(symbol, interval, period):
+    fetch_key = f"{symbol}_{interval}_{period}"
+    # the thread still goes through the sync single-flight, so it also coalesces with the warmer
+    return await upstream_pool.run(
+        server.stock_fetches.do, fetch_key, server.load_stock_data, symbol, interval, period
+    )
+
+
+def lookup_cached_source(symbol, interval, period):
+    """Return (status, source) of the cached frame a response is cut from, status "ok" or "stale", None when nothing is cached."""
+    source = server.lookup_stock_source(symbol, interval, period)
+    if source is not None:
+        return "ok", source
+    source = server.lookup_stale_stock_source(symbol, interval, period)
+    if source is not None:
+        return "stale", source
+    return None
+
+
+def cached_stock_etag(symbol, interval, period, fmt="json", max_points=None):
+    """
+    Return (status, etag) of the response the cache would answer with, None when it cannot answer.
+
+    Only hashes the cached frame, nothing is cut or encoded, so a matching
+    If-None-Match is answered without building the response.
+    """
+    cached = lookup_cached_source(symbol, interval, period)
+    if cached is None or cached[1][2] is None:
+        return None
+    status, source = cached
+    with server.STOCK_STAGE_SECONDS.labels("etag").time():
+        return status, server.stock_response_etag(server.stock_source_etag(symbol, interval, period, source), fmt, max_points)
+
+
+def build_stock_response(symbol, interval, period, fetched=None, fmt="json", max_points=None):
+    """
+    Build the encoded /stock/<symbol> response from the cache or from a fetched frame.
+
+    Returns (status, encoded) with status "ok", "stale" (built from an expired
+    entry), "not_cached" (nothing to answer without a download), "no_data" or
+    "failed". The response cache is looked up with the ETag of the cached frame
+    before anything is cut out of it. Runs on the process pool, the derive and
+    encode steps of a miss would otherwise block the event loop.
+    """
+    fresh = "ok"
+    if fetched is None:
+        cached = lookup_cached_source(symbol, interval, period)
+        if cached is None:
+            return "not_cached", None
+        fresh, source = cached
+    else:
+        source = fetched
+    if source[2] is None:
+        return "no_data", None
+
+    response_key = server.stock_response_key(symbol, interval, period, fmt, max_points)
+    with server.STOCK_STAGE_SECONDS.labels("etag").time():
+        etag = server.stock_response_etag(server.stock_source_etag(symbol, interval, period, source), fmt, max_points)
+    encoded = server.response_cache.get(response_key, etag)
+    server.RESPONSE_CACHE_LOOKUPS.labels("miss" if encoded is None else "hit").inc()
+    if encoded is None:
+        source_interval, source_period, source_data = source
+        with server.STOCK_STAGE_SECONDS.labels("derive").time():
+            stock_data = derive_stock_data(source_data, source_interval, source_period, interval, period)
+        if stock_data is None or stock_data.empty:
+            return "no_data", None
+        body = server.encode_stock_data(stock_data, interval, fmt, max_points)
+        if body is None:
+            return "failed", None
+        encoded = server.response_cache.put(response_key, etag, body, mimetype=server.STOCK_FORMAT_MIMETYPES[fmt])
+    return fresh, encoded
+
+
+def not_modified_response(etag):
+    server.RESPONSE_CACHE_LOOKUPS.labels("not_modified").inc()
+    return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+
+
+@observed("/stock/<symbol>")
+async def get_stock_price(request):
+    """
+    API endpoint to get daily stock data for a given symbol.
+    With format=columnar the bars come as parallel arrays, as MessagePack when Accept prefers it.
+    max_points caps the number of bars, long ranges are reduced with LTTB before encoding.
+    """
+    symbol = request.path_params["symbol"]
+    interval = request.query_params.get('interval', '1d')
+    period = request.query_params.get('period', '1mo')
+    fmt = negotiate_format(request.query_params.get('format'), request.headers.get('accept'))
+    if fmt is None:
+        return json_response({"error": "format must be json or columnar"}, 400)
+    try:
+        max_points = server.parse_max_points(request.query_params.get('max_points'))
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    response_key = server.stock_response_key(symbol, interval, period, fmt, max_points)
+    timeout_response = lambda: json_response({
+        "error": f"Request timeout for {symbol}. Server is experiencing high load."
+    }, 503)
+
+    limited = check_rate_limit(request, "/stock/<symbol>")
+    if limited is not None:
+        return limited
+
+    if_none_match = parse_etags(request.headers.get("if-none-match"))
+    fetch_interval, fetch_period = server.range_cache.fetch_plan(interval, period)
+    fetch_key = f"{symbol}_{fetch_interval}_{fetch_period}"
+
+    try:
+        if if_none_match:
+            # like the WSGI route, a client holding the current version gets its 304 before anything is built
+            try:
+                cached = await asyncio.wait_for(
+                    process_pool.run(cached_stock_etag, symbol, interval, period, fmt, max_points), timeout=3
+                )
+            except asyncio.TimeoutError:
+                return timeout_response()
+            if cached is not None and cached[1] in if_none_match:
+                status, etag = cached
+                response = not_modified_response(etag)
+                if fmt != "json":
+                    response.headers.append("Vary", "Accept")
+                if status == "stale":
+                    server.STALE_RESPONSES.labels("/stock/<symbol>").inc()
+                    refresh_in_background(fetch_key, symbol, fetch_interval, fetch_period)
+                    response.headers["Warning"] = '110 - "Response is Stale"'
+                return response
+
+        # identical requests share one build of the response
+        try:
+            with server.STOCK_STAGE_SECONDS.labels("process_wait").time():
+                status, encoded = await asyncio.wait_for(
+                    async_responses.do(
+                        response_key, process_pool.run, build_stock_response, symbol, interval, period, None, fmt, max_points
+                    ),
+                    timeout=3
+                )
+        except asyncio.TimeoutError:
+            return timeout_response()
+
+        if status == "stale":
+            # answer with the expired copy now, one refresh runs for everyone
+            server.STALE_RESPONSES.labels("/stock/<symbol>").inc()
+            refresh_in_background(fetch_key, symbol, fetch_interval, fetch_period)
+        elif status == "not_cached":
+            try:
+                with server.STOCK_STAGE_SECONDS.labels("fetch_wait").time():
+                    fetched = await wait_for_request(
+                        request,
+                        async_stock_fetches.do(fetch_key, load_stock_data, symbol, fetch_interval, fetch_period),
+                        timeout=5
+                    )
+                if fetched is DISCONNECTED:
+                    # nobody to answer, status 499 like nginx for the latency metric
+                    return Response(status_code=499)
+                with server.STOCK_STAGE_SECONDS.labels("process_wait").time():
+                    status, encoded = await asyncio.wait_for(
+                        async_responses.do(
+                            f"{response_key}:{fetch_key}", process_pool.run, build_stock_response,
+                            symbol, interval, period, (fetch_interval, fetch_period, fetched), fmt, max_points
+                        ),
+                        timeout=3
+                    )
+            except asyncio.TimeoutError:
+                return timeout_response()
+            except QueueFull:
+                return retry_response(f"Server is busy, try {symbol} again shortly.", 429, 1)
+            except CircuitOpenError as e:
+                return retry_response(f"Market data is temporarily unavailable for {symbol}.", 503, e.retry_after)
+
+        if status == "no_data":
+            return json_response({
+                "error": f"No data available for {symbol} with interval={interval}, period={period}"
+            }, 404)
+        if status == "failed":
+            return json_response({"error": f"Error processing data for {symbol}"}, 500)
+
+        if encoded.etag in if_none_match:
+            response = not_modified_response(encoded.etag)
+        else:
+            response = encoded_response(request, encoded)
+        if fmt != "json":
+            response.headers.append("Vary", "Accept")
+        if status == "stale":
+            response.headers["Warning"] = '110 - "Response is Stale"'
+        return response
+
+    except Exception as e:
+        import traceback
+
+        print(f"Error processing {symbol}: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return json_response({"error": f"Failed to retrieve data for {symbol}: {e}"}, 500)
+
+
+@observed("/stock/batch")
+async def get_stock_price_batch(request):
+    """API endpoint to get stock data for many symbols with one upstream download."""
+    interval = request.query_params.get('interval', '1d')
+    period = request.query_params.get('period', '1mo')
+    symbols_param = request.query_params.get('symbols', '')
+
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols_param.split(',') if s.strip()))
+
+    if not symbols:
+        return json_response({"error": "At least one symbol is required"}, 400)
+    if len(symbols) > server.MAX_BATCH_SYMBOLS:
+        return json_response({"error": f"At most {server.MAX_BATCH_SYMBOLS} symbols can be requested at once"}, 400)
+
+    limited = check_rate_limit(request, "/stock/batch")
+    if limited is not None:
+        return limited
+
+    try:
+        batch_key = f"batch:{','.join(symbols)}_{interval}_{period}"
+        stale_symbols = []
+        try:
+            stock_data_by_symbol = await wait_for_request(
+                request,
+                async_stock_fetches.do(
+                    batch_key, upstream_pool.run, server.fetch_stock_data_batch, symbols, interval, period
+                ),
+                timeout=15
+            )
+        except (asyncio.TimeoutError, QueueFull, CircuitOpenError) as e:
+            stock_data_by_symbol = {}
+            for symbol in symbols:
+                stock_data = server.range_cache.get(symbol, interval, period)
+                if stock_data is None:
+                    stock_data = server.lookup_stale_stock_data(symbol, interval, period)
+                    if stock_data is not None:
+                        stale_symbols.append(symbol)
+                if stock_data is not None:
+                    stock_data_by_symbol[symbol] = stock_data
+
+            if not stock_data_by_symbol:
+                if isinstance(e, QueueFull):
+                    return retry_response("Server is busy, try the batch again shortly.", 429, 1)
+                if isinstance(e, CircuitOpenError):
+                    return retry_response("Market data is temporarily unavailable.", 503, e.retry_after)
+                return json_response({"error": "Batch request timeout. Server is experiencing high load."}, 503)
+        if stock_data_by_symbol is DISCONNECTED:
+            return Response(status_code=499)
+
+        def process_batch():
+            result = {}
+            for symbol in symbols:
+                processed = server.process_stock_data(stock_data_by_symbol.get(symbol), interval)
+                if processed is None:
+                    result[symbol] = {
+                        "error": f"No data available for {symbol} with interval={interval}, period={period}"
+                    }
+                else:
+                    result[symbol] = processed
+            return result
+
+        result = await process_pool.run(process_batch)
+        if stale_symbols:
+            server.STALE_RESPONSES.labels("/stock/batch").inc()
+            return json_response(result, headers={
+                "Warning": '110 - "Response is Stale"', "X-Stale-Symbols": ",".join(stale_symbols)
+            })
+        return json_response(result)
+
+    except Exception as e:
+        import traceback
+
+        print(f"Error processing batch request: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return json_response({"error": f"Failed to retrieve batch data: {e}"}, 500)
+
+
+@observed("/stream/quotes")
+async def stream_quotes(request):
+    """
+    API endpoint to stream live bars of the given symbols as server-sent events.
+    A "snapshot" event with the bars of the day is sent per symbol first, then "bars"
+    events only carry the bars that are new or changed since the previous refresh.
+    """
+    symbols_param = request.query_params.get('symbols', '')
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols_param.split(',') if s.strip()))
+
+    if not symbols:
+        return json_response({"error": "At least one symbol is required"}, 400)
+    if len(symbols) > server.MAX_BATCH_SYMBOLS:
+        return json_response({"error": f"At most {server.MAX_BATCH_SYMBOLS} symbols can be streamed at once"}, 400)
+
+    limited = check_rate_limit(request, "/stream/quotes")
+    if limited is not None:
+        return limited
+
+    # the first snapshot of a symbol may need a download
+    subscribing = asyncio.ensure_future(upstream_pool.run(server.quote_hub.subscribe, symbols))
+    try:
+        subscription = await asyncio.shield(subscribing)
+    except asyncio.CancelledError:
+        # the client left while subscribing, drop the subscription once it exists
+        subscribing.add_done_callback(
+            lambda done: done.cancelled() or done.exception() or server.quote_hub.unsubscribe(done.result())
+        )
+        raise
+    except QueueFull:
+        return retry_response("Server is busy, try the stream again shortly.", 429, 1)
+    except Exception as e:
+        return json_response({"error": f"Failed to start quote stream: {e}"}, 500)
+
+    async def events():
+        try:
+            while not subscription.closed:
+                item = await subscription.get_async(timeout=server.QUOTE_STREAM_HEARTBEAT_SECONDS)
+                if item is None:
+                    # comment line, keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                else:
+                    yield format_sse(*item)
+        finally:
+            server.quote_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@observed("/api/stock_symbols")
+async def get_stock_symbols(request):
+    """API endpoint to get all the stock symbols, or with ?prefix=AA&limit=10 the symbols starting with a prefix."""
+    prefix = request.query_params.get("prefix")
+    limit = request.query_params.get("limit")
+    if prefix is None and limit is None:
+        encoded = server.symbol_catalog.full_response()
+    else:
+        try:
+            limit = int(limit) if limit is not None else 10
+        except ValueError:
+            return json_response({"error": "limit must be an integer"}, 400)
+        encoded = server.symbol_catalog.search(prefix or "", limit)
+
+    if encoded is None or len(server.symbol_catalog) == 0:
+        return json_response({"error": "Could not retrieve stock symbols"}, 500)
+    if encoded.etag in parse_etags(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers={"ETag": f'"{encoded.etag}"'})
+    return encoded_response(request, encoded)
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run fn(db_session, ...) on the db pool, the session lives and dies in that one thread."""
+    def unit_of_work():
+        with server.db_session_scope() as db_session:
+            return fn(db_session, *args, **kwargs)
+
+    return await db_pool.run(unit_of_work)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@observed("/users/<int:user_id>/favorite_stocks")
+async def user_favorite_stocks(request):
+    """API endpoint to get, add, replace or delete the favorite stocks of a user."""
+    if request.method == "GET":
+        return await get_user_favorite_stocks_api(request)
+    if request.method == "POST":
+        return await add_user_favorite_stock(request)
+    if request.method == "DELETE":
+        return await delete_user_favorite_stocks_batch(request)
+    return await replace_user_favorite_stocks_api(request)
+
+
+async def get_user_favorite_stocks_api(request):
+    user_id = request.path_params["user_id"]
+    try:
+        favorite_stocks = await run_db(
+            lambda db_session: [
+                {"name": fs.stock_name, "double": fs.stock_double}
+                for fs in crud.get_user_favorite_stocks(db_session, user_id=user_id)
+            ]
+        )
+        return json_response({"favorite_stocks": favorite_stocks}, 200)
+    except Exception as e:
+        return json_response({"message": "Failed to retrieve favorite stocks", "error": str(e)}, 500)
+
+
+async def add_user_favorite_stock(request):
+    user_id = request.path_params["user_id"]
+    data = await read_json(request)
+    if data is None:
+        return json_response({"message": "Invalid favorite stock data", "error": "Expected a JSON object"}, 400)
+
+    stock_name = data.get("stock_name")
+    stock_double = data.get("stock_double")
+    if not stock_name:
+        return json_response({"message": "Stock name is required"}, 400)
+    try:
+        server.check_known_symbols([stock_name])
+    except ValueError as ve:
+        return json_response({"message": "Invalid favorite stock data", "error": str(ve)}, 400)
+
+    def add(db_session):
+        favorite_stock = crud.add_favorite_stock_to_user(
+            db_session, user_id=user_id, stock_name=stock_name, stock_double=stock_double
+        )
+        if favorite_stock is None:
+            return None
+        return {"name": favorite_stock.stock_name, "double": favorite_stock.stock_double}
+
+    try:
+        favorite_stock = await run_db(add)
+        if favorite_stock:
+            return json_response({"message": "Favorite stock added successfully", "favorite_stock": favorite_stock}, 201)
+        return json_response({"message": "User not found"}, 404)
+    except ValueError as ve:
+        return json_response({"message": "Invalid favorite stock data", "error": str(ve)}, 400)
+    except Exception as e:
+        return json_response({"message": "Failed to add favorite stock", "error": str(e)}, 500)
+
+
+async def replace_user_favorite_stocks_api(request):
+    user_id = request.path_params["user_id"]
+    data = await read_json(request)
+    favorite_stocks_data = data.get("favorite_stocks") if data is not None else None
+    if not isinstance(favorite_stocks_data, list):
+        return json_response({"message": "Favorite stocks must be a list of [name, double] pairs"}, 400)
+    try:
+        server.check_known_symbols(favorite_stocks_data)
+    except ValueError as ve:
+        return json_response({"message": "Invalid favorite stocks data", "error": str(ve)}, 400)
+
+    def replace(db_session):
+        favorite_stocks = crud.replace_user_favorite_stocks(
+            db_session, user_id=user_id, new_favorite_stocks=favorite_stocks_data
+        )
+        if favorite_stocks is None:
+            return None
+        return [{"name": fs.stock_name, "double": fs.stock_double} for fs in favorite_stocks]
+
+    try:
+        favorite_stocks = await run_db(replace)
+        if favorite_stocks is not None:
+            return json_response({
+                "message": "Favorite stocks replaced successfully", "favorite_stocks": favorite_stocks
+            }, 200)
+        return json_response({"message": "User not found"}, 404)
+    except ValueError as ve:
+        return json_response({"message": "Invalid favorite stocks data", "error": str(ve)}, 400)
+    except Exception as e:
+        return json_response({"message": "Failed to replace favorite stocks", "error": str(e)}, 500)
+
+
+@observed("/users/<int:user_id>/favorite_stocks/batch")
+async def add_user_favorite_stocks_batch(request):
+    """API endpoint to add or update many favorite stocks of a user in one query."""
+    user_id = request.path_params["user_id"]
+    data = await read_json(request)
+    favorite_stocks_data = data.get("favorite_stocks") if data is not None else None
+    if not isinstance(favorite_stocks_data, list):
+        return json_response({"message": "Favorite stocks must be a list of [name, double] pairs"}, 400)
+    try:
+        server.check_known_symbols(favorite_stocks_data)
+    except ValueError as ve:
+        return json_response({"message": "Invalid favorite stocks data", "error": str(ve)}, 400)
+
+    def add(db_session):
+        favorite_stocks = crud.add_favorite_stocks_to_user(
+            db_session, user_id=user_id, favorite_stocks=favorite_stocks_data
+        )
+        if favorite_stocks is None:
+            return None
+        return [{"name": fs.stock_name, "double": fs.stock_double} for fs in favorite_stocks]
+
+    try:
+        favorite_stocks = await run_db(add)
+        if favorite_stocks is not None:
+            return json_response({
+                "message": "Favorite stocks added successfully", "favorite_stocks": favorite_stocks
+            }, 200)
+        return json_response({"message": "User not found"}, 404)
+    except ValueError as ve:
+        return json_response({"message": "Invalid favorite stocks data", "error": str(ve)}, 400)
+    except Exception as e:
+        return json_response({"message": "Failed to add favorite stocks", "error": str(e)}, 500)
+
+
+async def delete_user_favorite_stocks_batch(request):
+    user_id = request.path_params["user_id"]
+    stock_names = [
+        name.strip() for name in request.query_params.get("stock_names", "").split(",") if name.strip()
+    ]
+    if not stock_names:
+        return json_response({"message": "stock_names query parameter is required"}, 400)
+
+    try:
+        removed = await run_db(
+            lambda db_session: crud.remove_favorite_stocks_from_user(db_session, user_id=user_id, stock_names=stock_names)
+        )
+        if removed is None:
+            return json_response({"message": "User not found"}, 404)
+        return json_response({"message": f"{removed} favorite stocks removed successfully", "removed": removed}, 200)
+    except ValueError as ve:
+        return json_response({"message": "Invalid stock names", "error": str(ve)}, 400)
+    except Exception as e:
+        return json_response({"message": "Failed to remove favorite stocks", "error": str(e)}, 500)
+
+
+@observed("/users/<int:user_id>/favorite_stocks/<string:stock_name>")
+async def delete_user_favorite_stock(request):
+    """API endpoint to delete a specific favorite stock from a user by stock name."""
+    user_id = request.path_params["user_id"]
+    stock_name = request.path_params["stock_name"]
+    try:
+        deleted = await run_db(
+            lambda db_session: crud.remove_favorite_stock_from_user(db_session, user_id=user_id, stock_name=stock_name)
+        )
+        if deleted:
+            return json_response({"message": f"Favorite stock '{stock_name}' removed successfully"}, 200)
+        return json_response({"message": "Favorite stock not found for this user"}, 404)
+    except Exception as e:
+        return json_response({"message": "Failed to remove favorite stock", "error": str(e)}, 500)
+
+
+routes = [
+    # /stock/batch has to come before /stock/{symbol}
+    Route("/stock/batch", get_stock_price_batch, methods=["GET"]),
+    Route("/stock/{symbol}", get_stock_price, methods=["GET"]),
+    Route("/api/stock_symbols", get_stock_symbols, methods=["GET"]),
+    Route("/stream/quotes", stream_quotes, methods=["GET"]),
+    Route("/users/{user_id:int}/favorite_stocks", user_favorite_stocks, methods=["GET", "POST", "PUT", "DELETE"]),
+    Route("/users/{user_id:int}/favorite_stocks/batch", add_user_favorite_stocks_batch, methods=["POST"]),
+    Route("/users/{user_id:int}/favorite_stocks/{stock_name}", delete_user_favorite_stock, methods=["DELETE"]),
+    # everything else is answered by the Flask app
+    Mount("/", app=ThreadedWsgiToAsgi(server.app, wsgi_pool)),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(
+            CORSMiddleware, allow_origins=[os.environ.get("FRONT_ORIGINS")],
+            allow_methods=["*"], allow_headers=["*"]
+        )
+    ],
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get("HOST", "127.0.0.1"), port=int(os.environ.get("PORT", 5000)))
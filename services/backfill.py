@@ -0,0 +1,137 @@
+# services/backfill.py
+"""
+Backfill the bar archive (services/bar_archive.py) from the market data provider.
+
+The symbols are the service stock list, every user's favorites with
+--favorites, or the ones given on the command line. Downloading and encoding
+run in a process pool, one symbol per task. A symbol that already has a file
+only downloads the bars from its last archived session on, and symbols written
+less than --max-age seconds ago are skipped, so a rerun of an interrupted
+backfill continues with the symbols it did not get to.
+
+Run from the project root:
+    python -m services.backfill --archive-dir bars --interval 1d --period max
+    DATABASE_URL=... python -m services.backfill --archive-dir bars --favorites --interval 5m --period 60d
+    BAR_ARCHIVE_DIR=bars python services/server.py
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+
+from services.bar_archive import BarArchive
+from services.providers import create_provider
+
+DEFAULT_STOCK_LIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_stock_list.json")
+
+# one provider and archive per worker process, created by the pool initializer
+_worker = {}
+
+
+def _init_worker(archive_dir):
+    _worker["provider"] = create_provider()
+    _worker["archive"] = BarArchive(archive_dir)
+
+
+def backfill_symbol(symbol, interval, period, max_age=0, max_retries=2):
+    """Download and archive the missing bars of one symbol, returns (symbol, outcome, new bars)."""
+    archive = _worker["archive"]
+    updated_at = archive.updated_at(symbol, interval)
+    if updated_at is not None and time.time() - updated_at < max_age:
+        return symbol, "skipped", 0
+
+    last_timestamp = archive.last_timestamp(symbol, interval)
+    if last_timestamp is None:
+        date_range = {"period": period}
+    else:
+        # the last archived bar may still have been in progress, so it is fetched again
+        date_range = {"start": last_timestamp.strftime('%Y-%m-%d')}
+
+    for attempt in range(max_retries):
+        try:
+            stock_data = _worker["provider"].download(symbol, interval=interval, progress=False, **date_range)
+            break
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise
+            print(f"Attempt {attempt+1} failed for {symbol}: {e}")
+
+    if stock_data is None or stock_data.empty:
+        return symbol, "empty", 0
+    added = archive.write(symbol, interval, stock_data, period)
+    return symbol, "created" if last_timestamp is None else "updated", added
+
+
+def read_stock_list(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def read_favorite_symbols():
+    # the database is only needed here, DATABASE_URL does not have to be set otherwise
+    from db.database import session_scope
+    from services import crud
+
+    with session_scope() as db_session:
+        return crud.get_all_favorite_stock_names(db_session)
+
+
+def backfill(symbols, archive_dir, interval, period, workers=4, max_age=0):
+    """Backfill the symbols in a process pool and return the number of symbols per outcome."""
+    outcomes = {"created": 0, "updated": 0, "skipped": 0, "empty": 0, "failed": 0}
+    started = time.monotonic()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(archive_dir,)
+    ) as pool:
+        futures = {
+            pool.submit(backfill_symbol, symbol, interval, period, max_age): symbol
+            for symbol in symbols
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            symbol = futures[future]
+            try:
+                _, outcome, added = future.result()
+            except Exception as e:
+                outcome, added = "failed", 0
+                print(f"Error backfilling {symbol}: {e}")
+            outcomes[outcome] += 1
+            print(f"[{done}/{len(futures)}] {symbol}: {outcome}, {added} new bars")
+
+    print(f"Backfilled {len(symbols)} symbols ({interval}, {period}) in {time.monotonic() - started:.1f}s: {outcomes}")
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the bar archive from the market data provider.")
+    parser.add_argument("symbols", nargs="*", help="symbols to backfill, the service stock list by default")
+    parser.add_argument("--favorites", action="store_true", help="backfill every user's favorite stocks")
+    parser.add_argument("--stock-list", default=os.environ.get("STOCK_LIST_PATH") or DEFAULT_STOCK_LIST)
+    parser.add_argument("--archive-dir", default=os.environ.get("BAR_ARCHIVE_DIR"))
+    parser.add_argument("--interval", default="1d")
+    parser.add_argument("--period", default="max", help="history of symbols without a file yet")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-age", type=float, default=3600,
+                        help="skip symbols written less than this many seconds ago, 0 updates all")
+    args = parser.parse_args()
+
+    if not args.archive_dir:
+        parser.error("--archive-dir or BAR_ARCHIVE_DIR is required")
+
+    if args.symbols:
+        symbols = args.symbols
+    elif args.favorites:
+        symbols = read_favorite_symbols()
+    else:
+        symbols = read_stock_list(args.stock_list)
+    # duplicates would write the same file from two processes
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
+
+    outcomes = backfill(symbols, args.archive_dir, args.interval, args.period, args.workers, args.max_age)
+    if outcomes["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# services/bar_archive.py
+"""
+Per-symbol history files for long ranges.
+
+Every (interval, symbol) is one .npy file with a float64 array of shape
+(bars, 6) in Fortran order, so each column (epoch seconds, open, high, low,
+close, volume) is contiguous on disk. The server maps the files read-only and
+cuts a range out of them with a binary search over the timestamp column, a
+multi-year request costs a slice of the file instead of a download. A JSON
+file next to it keeps the timezone of the bars and the period of the first
+backfill. Both are replaced atomically, readers never see half a file.
+
+services/backfill.py writes the files.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from services.range_cache import INTERVAL_MINUTES, INTRADAY_MINUTES, period_days, slice_period
+
+COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+# the column order of yfinance frames, the archive answers with the same layout
+FRAME_COLUMNS = [('Close', 4), ('High', 2), ('Low', 3), ('Open', 1), ('Volume', 5)]
+
+SYMBOL_PATTERN = re.compile(r'[A-Za-z0-9^][A-Za-z0-9.^=_-]*')
+# sessions before the start of a period that are read so slice_period can cut it exactly
+SLICE_MARGIN_DAYS = 7
+
+
+class _ArchivedBars:
+    """One mapped version of an archive file, never changed after it is opened."""
+
+    def __init__(self, values, meta, file_state):
+        self.values = values
+        self.meta = meta
+        self.file_state = file_state
+
+    @property
+    def timestamps(self):
+        return self.values[:, 0]
+
+
+def frame_to_columns(stock_data):
+    """Convert a yfinance shaped frame into the (bars, 6) float64 array of the archive."""
+    frame = stock_data
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.copy()
+        frame.columns = frame.columns.get_level_values(0)
+
+    index = frame.index
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    values = np.empty((len(frame), len(COLUMNS)), dtype=np.float64, order='F')
+    values[:, 0] = index.as_unit('s').asi8
+    for position, name in enumerate(('Open', 'High', 'Low', 'Close', 'Volume'), start=1):
+        if name in frame.columns:
+            values[:, position] = pd.to_numeric(frame[name], errors='coerce').to_numpy(dtype=np.float64)
+        else:
+            values[:, position] = np.nan
+    return values
+
+
+def columns_to_frame(values, symbol, interval, timezone):
+    """Build a yfinance shaped frame from rows of the archive."""
+    index = pd.DatetimeIndex(pd.to_datetime(values[:, 0].astype(np.int64), unit='s')).as_unit('us')
+    if timezone is not None:
+        index = index.tz_localize('UTC').tz_convert(timezone)
+    index.name = 'Datetime' if INTERVAL_MINUTES.get(interval, INTRADAY_MINUTES) < INTRADAY_MINUTES else 'Date'
+    columns = pd.MultiIndex.from_product([[name for name, _ in FRAME_COLUMNS], [symbol]], names=['Price', 'Ticker'])
+    return pd.DataFrame(values[:, [position for _, position in FRAME_COLUMNS]], index=index, columns=columns)
+
+
+class BarArchive:
+    """
+    Directory of archived bars, {root}/{interval}/{SYMBOL}.npy plus {SYMBOL}.json.
+
+    Opened files stay mapped while their mtime and size do not change, a file
+    replaced by the backfill is mapped again on the next read.
+    """
+
+    def __init__(self, root, max_open=256):
+        self.root = root
+        self._open = LRUCache(maxsize=max_open)
+        self._lock = threading.Lock()
+        self._stats = {"slices": 0, "misses": 0}
+
+    def path(self, symbol, interval):
+        """Return the path of the .npy file of a symbol, raises ValueError for names that are no file name."""
+        if interval not in INTERVAL_MINUTES:
+            raise ValueError(f"Unknown interval '{interval}'")
+        if not SYMBOL_PATTERN.fullmatch(symbol):
+            raise ValueError(f"Symbol '{symbol}' can not be archived")
+        return os.path.join(self.root, interval, f"{symbol.upper()}.npy")
+
+    def read(self, symbol, interval):
+        """Return the mapped bars of a symbol, or None if it has no file."""
+        path = self.path(symbol, interval)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        key = (symbol.upper(), interval)
+        with self._lock:
+            archived = self._open.get(key)
+        if archived is not None and archived.file_state == file_state:
+            return archived
+
+        values = np.load(path, mmap_mode='r')
+        meta = _read_meta(_meta_path(path))
+        archived = _ArchivedBars(values, meta, file_state)
+        with self._lock:
+            self._open[key] = archived
+        return archived
+
+    def last_timestamp(self, symbol, interval):
+        """Return the time of the last archived bar, or None if there is none."""
+        archived = self.read(symbol, interval)
+        if archived is None or len(archived.values) == 0:
+            return None
+        return columns_to_frame(archived.values[-1:], symbol, interval, archived.meta.get("timezone")).index[0]
+
+    def updated_at(self, symbol, interval):
+        archived = self.read(symbol, interval)
+        return archived.meta.get("updated_at") if archived is not None else None
+
+    def covers(self, archived, period):
+        """Whether the first backfill of a file reached back at least as far as period."""
+        archived_period = archived.meta.get("period")
+        if archived_period == 'max':
+            return True
+        if period == 'max' or archived_period is None:
+            return False
+        archived_days, days = period_days(archived_period), period_days(period)
+        return archived_days is not None and days is not None and archived_days >= days
+
+    def frame(self, symbol, interval, period):
+        """Return the archived bars of a period as a yfinance shaped frame, None if the archive does not cover it."""
+        archived = self.read(symbol, interval)
+        days = period_days(period)
+        if archived is None or len(archived.values) == 0 or days is None or not self.covers(archived, period):
+            self._count("misses")
+            return None
+
+        start = 0
+        if days != math.inf:
+            # naive bars hold wall time, the margin also covers the offset of their timezone
+            cutoff = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=days + SLICE_MARGIN_DAYS)
+            start = int(np.searchsorted(archived.timestamps, cutoff.timestamp()))
+
+        # only the slice is copied out of the mapped file
+        stock_data = slice_period(
+            columns_to_frame(archived.values[start:], symbol, interval, archived.meta.get("timezone")), period
+        )
+        if stock_data.empty:
+            # the archive ends before the period starts
+            self._count("misses")
+            return None
+        self._count("slices")
+        return stock_data
+
+    def write(self, symbol, interval, stock_data, period):
+        """
+        Merge downloaded bars into the file of a symbol and return the number of new bars.
+
+        Archived bars from the first downloaded one on are replaced, the last
+        archived bar may have been in progress when it was written.
+        """
+        path = self.path(symbol, interval)
+        new_values = frame_to_columns(stock_data)
+        archived = self.read(symbol, interval)
+        meta = dict(archived.meta) if archived is not None else {"symbol": symbol.upper(), "interval": interval, "period": period}
+        index = stock_data.index
+        meta["timezone"] = str(index.tz) if index.tz is not None else None
+
+        added = len(new_values)
+        if archived is not None and len(archived.values):
+            keep = archived.values[archived.timestamps < new_values[0, 0]] if len(new_values) else archived.values
+            added = len(new_values) - (len(archived.values) - len(keep))
+            new_values = np.concatenate([keep, new_values])
+        new_values = np.asfortranarray(new_values)
+        meta.update(bars=len(new_values), updated_at=time.time())
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # data first, a new meta file never describes an old data file
+        _replace_file(path, lambda file: np.save(file, new_values))
+        _replace_file(_meta_path(path), lambda file: file.write(json.dumps(meta).encode('utf-8')))
+        return added
+
+    def stats(self):
+        with self._lock:
+            return {"root": self.root, "open_files": len(self._open), **self._stats}
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+
+def _meta_path(path):
+    return path[:-len('.npy')] + '.json'
+
+
+def _read_meta(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _replace_file(path, write):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        write(file)
+    os.replace(temporary, path)
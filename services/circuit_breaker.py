@@ -0,0 +1,108 @@
+# services/circuit_breaker.py
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the circuit is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and every call
+    fails fast with CircuitOpenError. When the cooldown has passed one probe call
+    is let through (half open), its success closes the circuit and its failure
+    opens it again with a doubled cooldown, up to max_cooldown. The backoff so
+    happens between calls instead of in a sleeping worker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, cooldown=15, max_cooldown=300, on_state_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.on_state_change = on_state_change
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._cooldown = cooldown
+        self._opened_at = None
+        self._probe_running = False
+
+    def call(self, fn, *args, **kwargs):
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._record_failure()
+            raise
+        self._record_success()
+        return result
+
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "cooldown_seconds": self._cooldown,
+                "retry_after_seconds": self._retry_after() if self._state != self.CLOSED else 0,
+            }
+
+    def _before_call(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and self._retry_after() <= 0:
+                self._set_state(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN and not self._probe_running:
+                self._probe_running = True
+                return
+            raise CircuitOpenError(self.name, max(self._retry_after(), 1))
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_running = False
+            self._cooldown = self.base_cooldown
+            if self._state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN:
+                # the probe failed, wait longer before the next one
+                self._probe_running = False
+                self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+                self._open()
+            elif self._state == self.CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._set_state(self.OPEN)
+
+    def _retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return self._opened_at + self._cooldown - time.monotonic()
+
+    def _set_state(self, state):
+        self._state = state
+        if self.on_state_change is not None:
+            self.on_state_change(state)
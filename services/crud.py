@@ -1,5 +1,6 @@
 # services/crud.py
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
 from db import models 
 
 def create_user(db: Session, nickname, email, password):
@@ -79,8 +80,219 @@ def remove_favorite_stock_from_user(db: Session, user_id: int, stock_name: str):
 def get_user_favorite_stocks(db: Session, user_id: int):
     return db.query(models.FavoriteStock).filter(models.FavoriteStock.user_id == user_id).all()
 
+def get_user_watchlist(db: Session, user_id: int):
+    """
+    Returns (stock_name, stock_double) rows of a user's favorites with one query,
+    or None if the user does not exist.
+    """
+    # the outer join keeps a user without favorites apart from a missing user
+    rows = db.query(models.User.id, models.FavoriteStock.stock_name, models.FavoriteStock.stock_double).outerjoin(
+        models.FavoriteStock, models.FavoriteStock.user_id == models.User.id
+    ).filter(models.User.id == user_id).order_by(models.FavoriteStock.stock_name).all()
+    if not rows:
+        return None
+    return [(row.stock_name, row.stock_double) for row in rows if row.stock_name is not None]
+
+def get_all_favorite_stock_names(db: Session):
+    """
+    Returns the distinct stock names that any user has in their favorites.
+    """
+    rows = db.query(models.FavoriteStock.stock_name).distinct().all()
+    return [row.stock_name for row in rows]
+
 def get_user_favorite_stock_by_name(db: Session, user_id: int, stock_name: str):
     return db.query(models.FavoriteStock).filter(
         models.FavoriteStock.user_id == user_id,
         models.FavoriteStock.stock_name == stock_name
-    ).first()
\ No newline at end of file
+    ).first()
+
+# ----------------------- BATCH FAVORITE STOCK OPERATIONS -----------------------
+
+MAX_FAVORITE_STOCKS_BATCH = 200
+
+def upsert_insert(db: Session):
+    """
+    Returns the dialect specific insert() that supports ON CONFLICT upserts.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise Exception(f"Bulk upsert is not supported for the {dialect} dialect")
+
+def parse_favorite_stocks(favorite_stocks):
+    """
+    Turns [name, double] pairs (or plain names) into {name: double}, the last pair of a name wins.
+
+    Raises ValueError for malformed pairs, names longer than 5 characters or too many stocks.
+    """
+    if len(favorite_stocks) > MAX_FAVORITE_STOCKS_BATCH:
+        raise ValueError(f"At most {MAX_FAVORITE_STOCKS_BATCH} favorite stocks can be sent at once.")
+
+    parsed = {}
+    for item in favorite_stocks:
+        if isinstance(item, str):
+            stock_name, stock_double = item, None
+        elif isinstance(item, (list, tuple)) and 1 <= len(item) <= 2 and isinstance(item[0], str):
+            stock_name, stock_double = item[0], (item[1] if len(item) == 2 else None)
+        else:
+            raise ValueError(f"Invalid favorite stock {item!r}, expected [name, double].")
+
+        if not stock_name or len(stock_name) > 5:
+            raise ValueError(f"Invalid stock name {stock_name!r}, it must be 1 to 5 characters.")
+        if stock_double is not None and (isinstance(stock_double, bool) or not isinstance(stock_double, (int, float))):
+            raise ValueError(f"Invalid double {stock_double!r} for stock '{stock_name}'.")
+        parsed[stock_name] = float(stock_double) if stock_double is not None else None
+    return parsed
+
+def _upsert_favorite_stocks(db: Session, user_id: int, favorites: dict):
+    # one INSERT ... ON CONFLICT for all of them, rows whose double did not change are not rewritten
+    if not favorites:
+        return
+    insert = upsert_insert(db)
+    statement = insert(models.FavoriteStock).values([
+        {"user_id": user_id, "stock_name": stock_name, "stock_double": stock_double}
+        for stock_name, stock_double in favorites.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "stock_name"],
+        set_={"stock_double": statement.excluded.stock_double},
+        where=models.FavoriteStock.stock_double.is_distinct_from(statement.excluded.stock_double)
+    )
+    db.execute(statement)
+
+def _user_exists(db: Session, user_id: int):
+    return db.query(models.User.id).filter(models.User.id == user_id).first() is not None
+
+def replace_user_favorite_stocks(db: Session, user_id: int, new_favorite_stocks: list):
+    """
+    Replaces all favorite stocks of a user in one transaction.
+
+    Only the difference is written: one delete of the names that are gone and one
+    upsert (on unique_user_stock) of the new or changed ones, then the result is
+    read back. Returns the favorite stocks, or None if the user does not exist.
+    Raises ValueError if new_favorite_stocks is malformed.
+    """
+    favorites = parse_favorite_stocks(new_favorite_stocks)
+    if not _user_exists(db, user_id):
+        return None
+
+    try:
+        removed = db.query(models.FavoriteStock).filter(models.FavoriteStock.user_id == user_id)
+        if favorites:
+            removed = removed.filter(models.FavoriteStock.stock_name.notin_(list(favorites)))
+        removed.delete(synchronize_session=False)
+        _upsert_favorite_stocks(db, user_id, favorites)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return get_user_favorite_stocks(db, user_id)
+
+def add_favorite_stocks_to_user(db: Session, user_id: int, favorite_stocks: list):
+    """
+    Adds many favorite stocks to a user with one upsert, existing ones get the new double.
+
+    Returns the added or updated favorite stocks, or None if the user does not exist.
+    Raises ValueError if favorite_stocks is malformed.
+    """
+    favorites = parse_favorite_stocks(favorite_stocks)
+    if not _user_exists(db, user_id):
+        return None
+
+    try:
+        _upsert_favorite_stocks(db, user_id, favorites)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if not favorites:
+        return []
+    return db.query(models.FavoriteStock).filter(
+        models.FavoriteStock.user_id == user_id,
+        models.FavoriteStock.stock_name.in_(list(favorites))
+    ).all()
+
+def remove_favorite_stocks_from_user(db: Session, user_id: int, stock_names: list):
+    """
+    Removes many favorite stocks from a user with one delete.
+    Returns the number of removed stocks, or None if the user does not exist.
+    """
+    if len(stock_names) > MAX_FAVORITE_STOCKS_BATCH:
+        raise ValueError(f"At most {MAX_FAVORITE_STOCKS_BATCH} favorite stocks can be removed at once.")
+    if not _user_exists(db, user_id):
+        return None
+    if not stock_names:
+        return 0
+
+    try:
+        removed = db.query(models.FavoriteStock).filter(
+            models.FavoriteStock.user_id == user_id,
+            models.FavoriteStock.stock_name.in_(list(stock_names))
+        ).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return removed
+
+# ----------------------- PRICE BAR STORE OPERATIONS -----------------------
+
+# bind parameters one statement may carry, SQLite before 3.32 stops at 999
+MAX_BIND_PARAMETERS = {"postgresql": 65535, "sqlite": 999}
+
+def get_price_bars(db: Session, symbol: str, interval: str, start=None):
+    """
+    Returns the stored bars for a symbol and interval from start onwards, oldest first.
+    """
+    query = db.query(models.PriceBar).filter(
+        models.PriceBar.symbol == symbol,
+        models.PriceBar.interval == interval
+    )
+    if start is not None:
+        query = query.filter(models.PriceBar.timestamp >= start)
+    return query.order_by(models.PriceBar.timestamp).all()
+
+def get_latest_price_bars(db: Session, symbol: str, interval: str, limit: int):
+    """
+    Returns the most recent `limit` stored bars for a symbol and interval, oldest first.
+    """
+    bars = db.query(models.PriceBar).filter(
+        models.PriceBar.symbol == symbol,
+        models.PriceBar.interval == interval
+    ).order_by(models.PriceBar.timestamp.desc()).limit(limit).all()
+    return list(reversed(bars))
+
+def upsert_price_bars(db: Session, bars: list):
+    """
+    Inserts or updates many bars in one statement.
+
+    Each bar is a dict with symbol, interval, timestamp, open, high, low, close and volume.
+    """
+    if not bars:
+        return 0
+
+    insert = upsert_insert(db)
+    # every row binds one parameter per column, chunked to stay below the limit of the database
+    chunk_size = MAX_BIND_PARAMETERS[db.get_bind().dialect.name] // len(bars[0])
+
+    try:
+        for chunk_start in range(0, len(bars), chunk_size):
+            statement = insert(models.PriceBar).values(bars[chunk_start:chunk_start + chunk_size])
+            statement = statement.on_conflict_do_update(
+                index_elements=["symbol", "interval", "timestamp"],
+                set_={
+                    "open": statement.excluded.open,
+                    "high": statement.excluded.high,
+                    "low": statement.excluded.low,
+                    "close": statement.excluded.close,
+                    "volume": statement.excluded.volume,
+                }
+            )
+            db.execute(statement)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(bars)
@@ -0,0 +1,68 @@
+# services/downsampling.py
+import numpy as np
+
+# LTTB keeps the first and the last point and one point per bucket in between
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, max_points, passes=2):
+    """
+    Positions of the rows Largest-Triangle-Three-Buckets keeps from a series.
+
+    The rows between the first and the last one are split into max_points - 2
+    buckets and every bucket keeps the row that spans the largest triangle with
+    the row kept in the previous bucket and the average of the next bucket.
+    Plain LTTB walks the buckets one by one, because each pick needs the one
+    before it. Here every bucket is solved at once on a padded (buckets x width)
+    array: the first pass anchors on the average of the previous bucket, every
+    further pass on the rows the pass before picked, which is LTTB again for
+    most buckets after two passes.
+    """
+    length = len(y)
+    if max_points >= length or length <= MIN_POINTS:
+        return np.arange(length)
+    max_points = max(max_points, MIN_POINTS)
+
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x[0]
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, length - 1, max_points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    buckets = np.arange(len(starts))
+    width = int((ends - starts).max())
+    positions = starts[:, None] + np.arange(width)[None, :]
+    in_bucket = positions < ends[:, None]
+    positions = np.minimum(positions, length - 1)
+
+    bucket_x = x[positions]
+    bucket_y = y[positions]
+    valid = in_bucket & np.isfinite(bucket_y)
+    counts = valid.sum(axis=1)
+    mean_x = np.where(in_bucket, bucket_x, 0).sum(axis=1) / in_bucket.sum(axis=1)
+    mean_y = np.where(valid, bucket_y, 0).sum(axis=1) / np.maximum(counts, 1)
+    if not counts.all():
+        # buckets without a value borrow the line between their neighbours
+        filled = counts > 0
+        if not filled.any():
+            return np.concatenate([[0], starts, [length - 1]])
+        mean_y = np.interp(mean_x, mean_x[filled], mean_y[filled])
+
+    first_y = y[0] if np.isfinite(y[0]) else mean_y[0]
+    last_y = y[-1] if np.isfinite(y[-1]) else mean_y[-1]
+    # the right anchor is the average of the next bucket, the last bucket looks at the last row
+    next_x = np.concatenate([mean_x[1:], [x[-1]]])
+    next_y = np.concatenate([mean_y[1:], [last_y]])
+    anchor_x, anchor_y = mean_x, mean_y
+    for _ in range(max(passes, 1)):
+        # the left anchor is what the previous bucket kept, the first bucket looks at the first row
+        left_x = np.concatenate([[x[0]], anchor_x[:-1]])
+        left_y = np.concatenate([[first_y], anchor_y[:-1]])
+        area = np.abs(
+            (left_x - next_x)[:, None] * (bucket_y - left_y[:, None])
+            - (left_x[:, None] - bucket_x) * (next_y - left_y)[:, None]
+        )
+        area = np.where(valid, area, -np.inf)
+        chosen = positions[buckets, area.argmax(axis=1)]
+        anchor_x, anchor_y = x[chosen], np.where(counts > 0, y[chosen], mean_y)
+    return np.concatenate([[0], chosen, [length - 1]])
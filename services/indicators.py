@@ -0,0 +1,300 @@
+# services/indicators.py
+import re
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+DEFAULT_WINDOWS = {'sma': 20, 'ema': 20, 'rsi': 14, 'bbands': 20}
+MAX_WINDOW = 500
+BOLLINGER_WIDTH = 2
+
+
+class Indicator:
+    """
+    An indicator over the columns of a frame.
+
+    compute() runs over whole arrays at once and also returns the state after
+    the last bar, advance() continues from such a state over new bars only, so
+    a new bar costs a few values instead of the whole window again.
+    """
+
+    fields = ("value",)
+
+    def __init__(self, name, window=None):
+        self.name = name
+        self.window = window
+
+    def compute(self, columns):
+        raise NotImplementedError
+
+    def advance(self, state, columns):
+        raise NotImplementedError
+
+
+class _WindowIndicator(Indicator):
+    # the inputs of the last window - 1 bars are all it needs to continue
+    inputs = ("close",)
+
+    def compute(self, columns):
+        outputs = self._compute(columns)
+        keep = self.window - 1
+        state = {key: columns[key][len(columns[key]) - keep:] if keep else columns[key][:0] for key in self.inputs}
+        return outputs, state
+
+    def advance(self, state, columns):
+        combined = {key: np.concatenate([state[key], columns[key]]) for key in self.inputs}
+        outputs, state = self.compute(combined)
+        skip = len(combined[self.inputs[0]]) - len(columns[self.inputs[0]])
+        return {field: values[skip:] for field, values in outputs.items()}, state
+
+
+class SimpleMovingAverage(_WindowIndicator):
+    def _compute(self, columns):
+        close = pd.Series(columns["close"])
+        return {"value": close.rolling(self.window, min_periods=self.window).mean().to_numpy()}
+
+
+class BollingerBands(_WindowIndicator):
+    fields = ("upper", "middle", "lower")
+
+    def _compute(self, columns):
+        rolling = pd.Series(columns["close"]).rolling(self.window, min_periods=self.window)
+        middle = rolling.mean().to_numpy()
+        width = BOLLINGER_WIDTH * rolling.std(ddof=0).to_numpy()
+        return {"upper": middle + width, "middle": middle, "lower": middle - width}
+
+
+def _ewm(values, alpha, start=None):
+    """Recursive exponential average of values, continuing from start when given."""
+    if start is None:
+        return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    # with adjust=False the first value seeds the average, so the state goes in front
+    return pd.Series(np.concatenate([[start], values])).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def _mask_warmup(values, seen_before, window):
+    # the first window - 1 values of an exponential average are not meaningful yet
+    positions = seen_before + np.arange(1, len(values) + 1)
+    return np.where(positions >= window, values, np.nan)
+
+
+class ExponentialMovingAverage(Indicator):
+    def compute(self, columns):
+        return self.advance(None, columns)
+
+    def advance(self, state, columns):
+        close = columns["close"]
+        alpha = 2 / (self.window + 1)
+        raw = _ewm(close, alpha, None if state is None else state["ema"])
+        seen = 0 if state is None else state["seen"]
+        outputs = {"value": _mask_warmup(raw, seen, self.window)}
+        if len(raw) == 0:
+            return outputs, state
+        return outputs, {"ema": raw[-1], "seen": seen + len(raw)}
+
+
+class RelativeStrengthIndex(Indicator):
+    """RSI with Wilder's smoothing of the average gain and loss."""
+
+    def compute(self, columns):
+        return self.advance(None, columns)
+
+    def advance(self, state, columns):
+        close = columns["close"]
+        if len(close) == 0:
+            return {"value": close.copy()}, state
+        if state is None:
+            # the first bar has no change, it only seeds the next one
+            outputs, state = self.advance({"close": close[0], "gain": None, "loss": None, "seen": 0}, {"close": close[1:]})
+            return {"value": np.concatenate([[np.nan], outputs["value"]])}, state
+
+        delta = np.diff(np.concatenate([[state["close"]], close]))
+        alpha = 1 / self.window
+        gain = _ewm(np.clip(delta, 0, None), alpha, state["gain"])
+        loss = _ewm(np.clip(-delta, 0, None), alpha, state["loss"])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100 - 100 / (1 + gain / loss)
+        rsi = _mask_warmup(rsi, state["seen"], self.window)
+        return {"value": rsi}, {"close": close[-1], "gain": gain[-1], "loss": loss[-1], "seen": state["seen"] + len(close)}
+
+
+class VolumeWeightedAveragePrice(Indicator):
+    """
+    VWAP of the typical price. Intraday bars start over every session, longer
+    bars are anchored to the first bar of the data.
+    """
+
+    def compute(self, columns):
+        return self.advance(None, columns)
+
+    def advance(self, state, columns):
+        typical = (columns["high"] + columns["low"] + columns["close"]) / 3
+        volume = np.nan_to_num(columns["volume"])
+        price_volume = np.nan_to_num(typical * volume)
+        session = columns["session"]
+        if len(session) == 0:
+            return {"value": typical}, state
+
+        cumulative_pv = pd.Series(price_volume).groupby(session).cumsum().to_numpy()
+        cumulative_volume = pd.Series(volume).groupby(session).cumsum().to_numpy()
+        if state is not None:
+            # bars of the session that was already running continue its sums
+            same_session = session == state["session"]
+            cumulative_pv = cumulative_pv + np.where(same_session, state["pv"], 0)
+            cumulative_volume = cumulative_volume + np.where(same_session, state["volume"], 0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = np.where(cumulative_volume > 0, cumulative_pv / cumulative_volume, np.nan)
+        return {"value": vwap}, {"session": session[-1], "pv": cumulative_pv[-1], "volume": cumulative_volume[-1]}
+
+
+INDICATORS = {
+    'sma': SimpleMovingAverage,
+    'ema': ExponentialMovingAverage,
+    'rsi': RelativeStrengthIndex,
+    'bbands': BollingerBands,
+    'vwap': VolumeWeightedAveragePrice,
+}
+
+
+def parse_indicator(name):
+    """Turn a name like sma20, rsi14, bbands or vwap into an Indicator, raises ValueError for unknown names."""
+    match = re.fullmatch(r'([a-z]+)(\d*)', name.strip().lower())
+    if not match or match.group(1) not in INDICATORS:
+        raise ValueError(f"Unknown indicator '{name}', expected one of {', '.join(INDICATORS)}")
+    kind, window = match.group(1), match.group(2)
+    if kind == 'vwap':
+        if window:
+            raise ValueError("vwap does not take a window")
+        return VolumeWeightedAveragePrice('vwap')
+
+    window = int(window) if window else DEFAULT_WINDOWS[kind]
+    if not 1 <= window <= MAX_WINDOW:
+        raise ValueError(f"The window of '{name}' must be between 1 and {MAX_WINDOW}")
+    return INDICATORS[kind](f"{kind}{window}", window)
+
+
+class _Series:
+    def __init__(self, timestamps, outputs, state, frame):
+        self.timestamps = timestamps
+        self.outputs = outputs
+        # state as of the bar before the last one, the last bar may still be in progress
+        self.state = state
+        self.frame = frame
+
+
+def _concat_outputs(*parts):
+    return {field: np.concatenate([part[field] for part in parts]) for field in parts[0]}
+
+
+def _slice_inputs(columns, start, end=None):
+    return {key: values[start:end] for key, values in columns.items()}
+
+
+class IndicatorEngine:
+    """
+    Indicator values per (symbol, interval, indicator), kept up to date incrementally.
+
+    When the frame of a symbol was refreshed, the bars after the last computed one
+    (and that last one again, it may have changed) are fed to advance(). The whole
+    series is only computed again when the new frame does not continue the cached
+    one, for example when it reaches further back.
+    """
+
+    def __init__(self, maxsize=2000, max_bars=20000):
+        self.max_bars = max_bars
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stats = {"computed": 0, "advanced": 0, "reused": 0}
+
+    def series(self, key, indicator, frame, timestamps, columns):
+        """
+        Return (timestamps, {field: values}) of an indicator over a frame.
+
+        timestamps are the int64 nanoseconds of the frame index and columns the
+        input arrays of the frame, the cached series may reach further back.
+        """
+        cache_key = (*key, indicator.name)
+        with self._lock:
+            entry = self._cache.get(cache_key)
+
+        if entry is not None and entry.frame() is frame:
+            self._count("reused")
+        elif entry is not None and self._continues(entry, timestamps):
+            entry = self._advance(entry, indicator, frame, timestamps, columns)
+            self._count("advanced")
+        else:
+            entry = self._compute(indicator, frame, timestamps, columns)
+            self._count("computed")
+
+        with self._lock:
+            self._cache[cache_key] = entry
+        return entry.timestamps, entry.outputs
+
+    def stats(self):
+        with self._lock:
+            return {"series": len(self._cache), **self._stats}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _compute(self, indicator, frame, timestamps, columns):
+        if len(timestamps) == 0:
+            outputs = {field: np.array([], dtype=np.float64) for field in indicator.fields}
+            return _Series(timestamps, outputs, None, weakref.ref(frame))
+        outputs, state = indicator.compute(_slice_inputs(columns, 0, -1))
+        last_outputs, _ = indicator.advance(state, _slice_inputs(columns, -1))
+        return _Series(timestamps, _concat_outputs(outputs, last_outputs), state, weakref.ref(frame))
+
+    def _continues(self, entry, timestamps):
+        """True if the frame holds the cached bars from its start on, followed by new bars only."""
+        if entry.state is None or len(timestamps) == 0:
+            return False
+        last = entry.timestamps[-1]
+        position = np.searchsorted(timestamps, last)
+        if position == len(timestamps) or timestamps[position] != last:
+            return False
+        start = np.searchsorted(entry.timestamps, timestamps[0])
+        if start == len(entry.timestamps) or entry.timestamps[start] != timestamps[0]:
+            return False
+        # no bar went missing in between
+        return len(entry.timestamps) - start == position + 1
+
+    def _advance(self, entry, indicator, frame, timestamps, columns):
+        position = int(np.searchsorted(timestamps, entry.timestamps[-1]))
+        kept = {field: values[:-1] for field, values in entry.outputs.items()}
+        state = entry.state
+        parts = [kept]
+        if len(timestamps) - position > 1:
+            outputs, state = indicator.advance(state, _slice_inputs(columns, position, -1))
+            parts.append(outputs)
+        last_outputs, _ = indicator.advance(state, _slice_inputs(columns, -1))
+        parts.append(last_outputs)
+
+        merged_timestamps = np.concatenate([entry.timestamps[:-1], timestamps[position:]])
+        outputs = _concat_outputs(*parts)
+        if len(merged_timestamps) > self.max_bars:
+            merged_timestamps = merged_timestamps[-self.max_bars:]
+            outputs = {field: values[-self.max_bars:] for field, values in outputs.items()}
+        return _Series(merged_timestamps, outputs, state, weakref.ref(frame))
+
+
+def select_range(timestamps, outputs, wanted):
+    """Values of a cached series at the wanted timestamps, NaN where the series has none."""
+    start = np.searchsorted(timestamps, wanted[0]) if len(wanted) else 0
+    end = start + len(wanted)
+    if end <= len(timestamps) and np.array_equal(timestamps[start:end], wanted):
+        return {field: values[start:end] for field, values in outputs.items()}
+    positions = pd.Index(timestamps).get_indexer(wanted)
+    return {
+        field: np.where(positions >= 0, values[np.clip(positions, 0, None)] if len(values) else np.nan, np.nan)
+        for field, values in outputs.items()
+    }
@@ -0,0 +1,389 @@
+# services/providers.py
+"""
+Market data providers behind fetch_stock_data.
+
+The provider is selected with the MARKET_DATA_PROVIDER environment variable:
+
+*   yfinance (default): downloads from Yahoo Finance
+*   replay: reads recorded fixtures from REPLAY_FIXTURES_DIR, one
+    {SYMBOL}_{interval}.csv or .parquet file per symbol and interval
+*   synthetic: generates deterministic bars, SYNTHETIC_LATENCY_MS,
+    SYNTHETIC_FAILURE_RATE and SYNTHETIC_SEED control its behaviour
+
+Every provider answers download() with frames shaped like yfinance.download,
+so the callers do not need to know which one is used.
+"""
+
+import argparse
+import math
+import os
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+import yfinance
+
+from services.range_cache import INTERVAL_MINUTES, period_days, slice_period
+
+PRICE_COLUMNS = ['Close', 'High', 'Low', 'Open', 'Volume']
+MARKET_TIMEZONE = 'America/New_York'
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+SESSION_MINUTES = 390
+
+# intervals longer than a day are built from daily bars
+DAILY_RESAMPLE_RULES = {
+    '5d': '5B',
+    '1wk': 'W-MON',
+    '1mo': 'MS',
+    '3mo': 'QS',
+}
+
+
+class MarketDataProvider:
+    """
+    Base class of the providers.
+
+    Subclasses implement history() for one symbol, this class assembles the
+    yfinance column layout for single and multi-ticker downloads.
+    """
+
+    name = None
+
+    def history(self, symbol, interval, period=None, start=None):
+        """Return a frame with Open/High/Low/Close/Volume columns, empty if there is no data."""
+        raise NotImplementedError
+
+    def download(self, tickers, interval='1d', period=None, start=None, group_by='column', progress=False, **kwargs):
+        if isinstance(tickers, str):
+            frame = self.history(tickers, interval, period=period, start=start)
+            return _with_ticker_level(frame, tickers)
+
+        frames = {}
+        for symbol in tickers:
+            frame = self.history(symbol, interval, period=period, start=start)
+            if not frame.empty:
+                frames[symbol] = frame[[c for c in PRICE_COLUMNS if c in frame.columns]]
+        if not frames:
+            return pd.DataFrame()
+
+        combined = pd.concat(frames, axis=1, names=['Ticker', 'Price'])
+        if group_by != 'ticker':
+            combined = combined.swaplevel(axis=1).sort_index(axis=1)
+            combined.columns.names = ['Price', 'Ticker']
+        return combined
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Downloads from Yahoo Finance."""
+
+    name = 'yfinance'
+
+    def history(self, symbol, interval, period=None, start=None):
+        frame = self.download(symbol, interval, period=period, start=start)
+        return _flatten(frame)
+
+    def download(self, tickers, interval='1d', period=None, start=None, group_by='column', progress=False, **kwargs):
+        date_range = {'start': start} if start is not None else {'period': period}
+        return yfinance.download(
+            tickers=tickers,
+            interval=interval,
+            group_by=group_by,
+            progress=progress,
+            **date_range,
+            **kwargs
+        )
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Replays recorded fixtures.
+
+    Periods are cut relative to the last recorded bar, so a recording answers
+    the same way no matter when it is replayed.
+    """
+
+    name = 'replay'
+
+    def __init__(self, fixtures_dir):
+        self.fixtures_dir = fixtures_dir
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def history(self, symbol, interval, period=None, start=None):
+        frame = self._load(symbol, interval)
+        if frame is None or frame.empty:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+        if start is not None:
+            return frame[frame.index >= _align_start(start, frame.index)]
+        return slice_period(frame, period or '1mo', now=frame.index[-1])
+
+    def _load(self, symbol, interval):
+        key = (symbol, interval)
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+
+        frame = None
+        for extension in ('.parquet', '.csv'):
+            path = os.path.join(self.fixtures_dir, f"{symbol}_{interval}{extension}")
+            if os.path.exists(path):
+                frame = read_fixture(path, interval)
+                break
+
+        with self._lock:
+            self._frames[key] = frame
+        return frame
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Generates realistic bars without the network.
+
+    Prices are a deterministic function of (seed, symbol, session), so repeated
+    requests and overlapping ranges always agree. Intraday bars are cut out of a
+    one-minute path per session that ends at that session's daily close.
+    """
+
+    name = 'synthetic'
+
+    EPOCH = pd.Timestamp('2000-01-03')
+
+    def __init__(self, latency_ms=0, latency_jitter=0.5, failure_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._closes = {}
+        self._lock = threading.Lock()
+
+    def download(self, tickers, interval='1d', period=None, start=None, group_by='column', progress=False, **kwargs):
+        self._simulate_upstream()
+        return super().download(tickers, interval, period=period, start=start, group_by=group_by)
+
+    def history(self, symbol, interval, period=None, start=None):
+        now = pd.Timestamp.now(tz=MARKET_TIMEZONE)
+        sessions = self._sessions(now, period or '1mo', start)
+        if len(sessions) == 0:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+
+        minutes = INTERVAL_MINUTES.get(interval, 1440)
+        if minutes < 1440:
+            frame = self._intraday_bars(symbol, sessions, minutes)
+            frame = frame[frame.index <= now]
+            if start is not None:
+                frame = frame[frame.index >= _align_start(start, frame.index)]
+            return frame
+
+        frame = self._daily_bars(symbol, sessions)
+        if interval in DAILY_RESAMPLE_RULES:
+            frame = frame.resample(DAILY_RESAMPLE_RULES[interval]).agg(
+                {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+            ).dropna(subset=['Close'])
+        return frame
+
+    def _simulate_upstream(self):
+        with self._lock:
+            jitter = self._random.uniform(1 - self.latency_jitter, 1 + self.latency_jitter)
+            failed = self._random.random() < self.failure_rate
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms * jitter / 1000)
+        if failed:
+            raise RuntimeError("Synthetic upstream failure")
+
+    def _sessions(self, now, period, start):
+        # sessions that have opened by now
+        last_session = now.tz_localize(None).normalize()
+        if now.tz_localize(None) - last_session < SESSION_OPEN:
+            last_session -= pd.Timedelta(days=1)
+        if start is not None:
+            first = max(pd.Timestamp(start).tz_localize(None).normalize(), self.EPOCH)
+            return pd.bdate_range(first, last_session)
+
+        days = period_days(period)
+        if days is None or days == math.inf:
+            first = self.EPOCH
+        else:
+            # a week of margin, slice_period cuts the exact period below
+            first = max(last_session - pd.Timedelta(days=days + 7), self.EPOCH)
+        sessions = pd.bdate_range(first, last_session)
+        sessions = pd.Series(sessions, index=sessions)
+        return pd.DatetimeIndex(slice_period(sessions, period, now=last_session).index)
+
+    def _symbol_seed(self, symbol):
+        return zlib.crc32(f"{self.seed}:{symbol}".encode('utf-8'))
+
+    def _daily_closes(self, symbol, count):
+        """Closes of the first `count` sessions after the epoch, a geometric random walk."""
+        with self._lock:
+            closes = self._closes.get(symbol)
+        if closes is None or len(closes) < count:
+            rng = np.random.default_rng(self._symbol_seed(symbol))
+            size = max(count, 10_000)
+            start_price = 20 + rng.random() * 480
+            drift, volatility = 0.0002, 0.01 + rng.random() * 0.015
+            closes = start_price * np.exp(np.cumsum(rng.normal(drift, volatility, size)))
+            with self._lock:
+                self._closes[symbol] = closes
+        return closes
+
+    def _session_paths(self, symbol, sessions):
+        """One-minute price paths and volumes of the sessions.
+
+        Returns paths of shape (sessions, SESSION_MINUTES + 1) and the traded
+        volume per minute of shape (sessions, SESSION_MINUTES).
+        """
+        indexes = np.busday_count(np.datetime64(self.EPOCH.date()), sessions.values.astype('datetime64[D]'))
+        closes = self._daily_closes(symbol, int(indexes[-1]) + 1)
+        symbol_seed = self._symbol_seed(symbol)
+        base_volume = 1e5 + np.random.default_rng(symbol_seed).random() * 5e6
+
+        minutes = np.arange(SESSION_MINUTES)
+        # busier around the open and the close
+        profile = 1 + 2 * ((minutes - SESSION_MINUTES / 2) / (SESSION_MINUTES / 2)) ** 2
+        profile = profile / profile.sum()
+
+        paths = np.empty((len(sessions), SESSION_MINUTES + 1))
+        daily_volumes = np.empty(len(sessions))
+        steps = np.linspace(0.0, 1.0, SESSION_MINUTES + 1)
+        for row, index in enumerate(indexes):
+            rng = np.random.default_rng([symbol_seed, int(index)])
+            previous_close = closes[index - 1] if index > 0 else closes[0]
+            # overnight gap, then a brownian bridge from the open to the close
+            open_price = previous_close * np.exp(rng.normal(0, 0.004))
+            walk = np.concatenate([[0.0], np.cumsum(rng.normal(0, 0.0008, SESSION_MINUTES))])
+            bridge = walk - steps * walk[-1]
+            paths[row] = np.exp(np.log(open_price) + steps * (np.log(closes[index]) - np.log(open_price)) + bridge)
+            daily_volumes[row] = base_volume * np.exp(rng.normal(0, 0.3))
+        return paths, daily_volumes[:, None] * profile[None, :]
+
+    def _intraday_bars(self, symbol, sessions, minutes):
+        paths, volumes = self._session_paths(symbol, sessions)
+        starts = np.arange(0, SESSION_MINUTES, minutes)
+        ends = np.minimum(starts + minutes, SESSION_MINUTES)
+
+        opens = paths[:, starts]
+        closes = paths[:, ends]
+        highs = np.maximum.reduceat(paths[:, :-1], starts, axis=1)
+        lows = np.minimum.reduceat(paths[:, :-1], starts, axis=1)
+        highs = np.maximum(highs, closes)
+        lows = np.minimum(lows, closes)
+        bar_volumes = np.round(np.add.reduceat(volumes, starts, axis=1))
+
+        offsets = pd.to_timedelta(starts, unit='min') + SESSION_OPEN
+        index = pd.DatetimeIndex(
+            [session + offset for session in sessions for offset in offsets], name='Datetime'
+        ).tz_localize(MARKET_TIMEZONE)
+        return pd.DataFrame({
+            'Close': closes.ravel(),
+            'High': highs.ravel(),
+            'Low': lows.ravel(),
+            'Open': opens.ravel(),
+            'Volume': bar_volumes.ravel(),
+        }, index=index)
+
+    def _daily_bars(self, symbol, sessions):
+        paths, volumes = self._session_paths(symbol, sessions)
+        return pd.DataFrame({
+            'Close': paths[:, -1],
+            'High': paths.max(axis=1),
+            'Low': paths.min(axis=1),
+            'Open': paths[:, 0],
+            'Volume': np.round(volumes.sum(axis=1)),
+        }, index=pd.DatetimeIndex(sessions, name='Date'))
+
+
+def read_fixture(path, interval):
+    """Read a recorded fixture into a flat OHLCV frame."""
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path, index_col=0)
+    if INTERVAL_MINUTES.get(interval, 1440) < 1440:
+        frame.index = pd.to_datetime(frame.index, utc=True).tz_convert(MARKET_TIMEZONE)
+        frame.index.name = 'Datetime'
+    else:
+        frame.index = pd.to_datetime(frame.index)
+        frame.index.name = 'Date'
+    return frame.sort_index()
+
+
+def record_fixture(symbol, interval, period, fixtures_dir, file_format='csv'):
+    """Download one symbol from yfinance and save it as a replay fixture."""
+    frame = YFinanceProvider().history(symbol, interval, period=period)
+    if frame.empty:
+        raise ValueError(f"No data returned for {symbol} with interval={interval}, period={period}")
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f"{symbol}_{interval}.{file_format}")
+    if file_format == 'parquet':
+        frame.to_parquet(path)
+    else:
+        frame.to_csv(path)
+    return path
+
+
+def create_provider(name=None):
+    """Create the provider named by MARKET_DATA_PROVIDER."""
+    name = (name or os.environ.get("MARKET_DATA_PROVIDER") or 'yfinance').lower()
+    if name == 'yfinance':
+        return YFinanceProvider()
+    if name == 'replay':
+        fixtures_dir = os.environ.get("REPLAY_FIXTURES_DIR")
+        if not fixtures_dir:
+            raise ValueError("REPLAY_FIXTURES_DIR must be set for the replay market data provider")
+        return ReplayProvider(fixtures_dir)
+    if name == 'synthetic':
+        return SyntheticProvider(
+            latency_ms=float(os.environ.get("SYNTHETIC_LATENCY_MS", 0)),
+            latency_jitter=float(os.environ.get("SYNTHETIC_LATENCY_JITTER", 0.5)),
+            failure_rate=float(os.environ.get("SYNTHETIC_FAILURE_RATE", 0)),
+            seed=int(os.environ.get("SYNTHETIC_SEED", 0)),
+        )
+    raise ValueError(f"Unknown market data provider: {name}")
+
+
+def _flatten(frame):
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.copy()
+        frame.columns = frame.columns.get_level_values(0)
+    return frame
+
+
+def _with_ticker_level(frame, symbol):
+    if frame.empty:
+        return pd.DataFrame()
+    frame = frame[[c for c in PRICE_COLUMNS if c in frame.columns]].copy()
+    frame.columns = pd.MultiIndex.from_product([frame.columns, [symbol]], names=['Price', 'Ticker'])
+    return frame
+
+
+def _align_start(start, index):
+    start = pd.Timestamp(start)
+    if index.tz is not None and start.tz is None:
+        start = start.tz_localize(index.tz)
+    elif index.tz is None and start.tz is not None:
+        start = start.tz_localize(None)
+    return start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record yfinance data as replay fixtures.")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", default="1d")
+    parser.add_argument("--period", default="2mo")
+    parser.add_argument("--out", default=os.environ.get("REPLAY_FIXTURES_DIR", "fixtures"))
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+
+    for symbol in args.symbols:
+        try:
+            print(record_fixture(symbol, args.interval, args.period, args.out, args.format))
+        except Exception as e:
+            print(f"Error recording {symbol}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# services/quote_stream.py
+import asyncio
+import json
+import queue
+import threading
+
+
+class Subscription:
+    """The symbols one client watches and the queue its events are delivered through."""
+
+    def __init__(self, symbols, max_queue=100):
+        self.symbols = list(symbols)
+        self.events = queue.Queue(maxsize=max_queue)
+        self.closed = False
+        # (loop, asyncio.Event) of a subscriber waiting in get_async
+        self._wakeup = None
+
+    def get(self, timeout):
+        """Return the next (event, data) pair, or None if nothing arrived before timeout."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def get_async(self, timeout):
+        """Like get() for subscribers on an event loop, the wait holds no thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return self.events.get_nowait()
+            except queue.Empty:
+                pass
+            if self.closed:
+                return None
+            wakeup = asyncio.Event()
+            self._wakeup = (loop, wakeup)
+            try:
+                # an event offered before the wakeup was set is picked up here
+                if not self.events.empty():
+                    continue
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._wakeup = None
+
+    def notify(self):
+        """Wake a subscriber waiting in get_async, called from any thread."""
+        wakeup = self._wakeup
+        if wakeup is None:
+            return
+        loop, event = wakeup
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # the loop of the subscriber is closed
+            pass
+
+
+class QuoteHub:
+    """
+    Shares one upstream refresh loop between every stream subscriber.
+
+    Each refresh downloads the watched symbols once, compares the bars with the
+    ones already published and sends only the new or changed bars to the
+    subscribers of that symbol. The upstream work grows with the number of
+    watched symbols, not with the number of clients.
+
+    Bars are keyed by "YYYY-MM-DD HH:MM:SS" timestamps and the date of the newest
+    one is the session of a symbol. The newest session of any watched symbol is
+    the current one: a snapshot of an older session is downloaded again before
+    it is sent to a new subscriber, and a refresh that moves a symbol to a new
+    session sends a "snapshot" that replaces the bars of the previous day.
+    """
+
+    def __init__(self, fetch_bars, load_snapshot=None, refresh_seconds=15):
+        # fetch_bars(symbols) downloads and returns {symbol: {timestamp: bar}} for the symbols it could load,
+        # load_snapshot(symbols) returns the same but may answer from a cache
+        self.fetch_bars = fetch_bars
+        self.load_snapshot = load_snapshot or fetch_bars
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._bars = {}
+        # symbol -> session of its bars, and the current session when it was last downloaded
+        self._sessions = {}
+        self._downloaded = {}
+        self._current_session = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def subscribe(self, symbols):
+        """Register a subscriber, its first events are the snapshots of its symbols."""
+        subscription = Subscription(symbols)
+
+        with self._lock:
+            missing = [symbol for symbol in subscription.symbols if symbol not in self._bars]
+        if missing:
+            self._store(self.load_snapshot(missing), publish=False)
+        with self._lock:
+            # kept or cached bars of a previous trading day are not sent as the snapshot of today
+            stale = [symbol for symbol in subscription.symbols if self._is_stale(symbol)]
+        if stale:
+            self._store(self.fetch_bars(stale), publish=False, downloaded=True)
+
+        with self._lock:
+            for symbol in subscription.symbols:
+                self._subscribers.setdefault(symbol, set()).add(subscription)
+                bars = self._bars.get(symbol)
+                if bars is None:
+                    self._offer(subscription, "error", {"symbol": symbol, "error": f"No data available for {symbol}"})
+                else:
+                    self._offer(subscription, "snapshot", {"symbol": symbol, "bars": dict(bars)})
+            self._ensure_running()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        subscription.notify()
+        with self._lock:
+            for symbol in subscription.symbols:
+                subscribers = self._subscribers.get(symbol)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    # nobody watches it anymore, stop refreshing it
+                    del self._subscribers[symbol]
+                    self._bars.pop(symbol, None)
+                    self._sessions.pop(symbol, None)
+                    self._downloaded.pop(symbol, None)
+
+    def watched_symbols(self):
+        with self._lock:
+            return sorted(self._subscribers)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+    def refresh(self):
+        """Download the watched symbols once and publish what changed."""
+        symbols = self.watched_symbols()
+        if symbols:
+            self._store(self.fetch_bars(symbols), publish=True, downloaded=True)
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="quote-hub", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.refresh_seconds):
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Quote stream refresh failed: {e}")
+
+    def _is_stale(self, symbol):
+        # a symbol that was downloaded in the current session and is still behind did not trade today
+        session = self._sessions.get(symbol)
+        return (
+            session is not None and session < self._current_session
+            and self._downloaded.get(symbol) != self._current_session
+        )
+
+    def _store(self, bars_by_symbol, publish, downloaded=False):
+        with self._lock:
+            for symbol, bars in bars_by_symbol.items():
+                if not bars or (publish and symbol not in self._subscribers):
+                    continue
+                session = bar_session(bars)
+                previous_session = self._sessions.get(symbol)
+                if previous_session is not None and session < previous_session:
+                    # an older copy, from a cache that has not seen the new session yet
+                    continue
+                previous = self._bars.get(symbol)
+                self._bars[symbol] = bars
+                self._sessions[symbol] = session
+                if self._current_session is None or session > self._current_session:
+                    self._current_session = session
+                if downloaded:
+                    self._downloaded[symbol] = self._current_session
+                if not publish:
+                    continue
+
+                if previous is None or session != previous_session:
+                    # the symbol had no data when its subscribers joined, or the trading day rolled over
+                    event, changed = "snapshot", bars
+                else:
+                    event = "bars"
+                    changed = {
+                        timestamp: bar for timestamp, bar in bars.items()
+                        if previous.get(timestamp) != bar
+                    }
+                if changed:
+                    for subscription in list(self._subscribers[symbol]):
+                        self._offer(subscription, event, {"symbol": symbol, "bars": dict(changed)})
+
+    def _offer(self, subscription, event, data):
+        try:
+            subscription.events.put_nowait((event, data))
+        except queue.Full:
+            # a client that does not read its events is dropped instead of buffering forever
+            subscription.closed = True
+        subscription.notify()
+
+
+def bar_session(bars):
+    """The date of the newest bar of {timestamp: bar}, the trading session the bars belong to."""
+    return max(bars)[:10]
+
+
+def format_sse(event, data):
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
@@ -0,0 +1,209 @@
+# services/range_cache.py
+import datetime
+import math
+import re
+
+import pandas as pd
+
+# Calendar days covered by a period. Periods in days count trading days upstream,
+# so they are widened to the calendar days they can span.
+FIXED_PERIOD_DAYS = {
+    '1wk': 7,
+    'max': math.inf,
+}
+
+INTERVAL_MINUTES = {
+    '1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30,
+    '60m': 60, '90m': 90, '1h': 60,
+    '1d': 1440, '5d': 7200, '1wk': 10080,
+}
+
+INTRADAY_MINUTES = 1440
+
+OHLCV_AGGREGATION = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum',
+}
+
+
+def period_days(period, now=None):
+    """Return the calendar days a yfinance period covers, or None if it is unknown."""
+    if period in FIXED_PERIOD_DAYS:
+        return FIXED_PERIOD_DAYS[period]
+    if period == 'ytd':
+        now = now or datetime.datetime.now()
+        return (now - datetime.datetime(now.year, 1, 1)).days + 1
+    match = re.fullmatch(r'(\d+)(d|mo|y)', period)
+    if not match:
+        return None
+    amount, unit = int(match.group(1)), match.group(2)
+    if unit == 'd':
+        # five trading days per week, plus the weekend before the first one
+        return math.ceil(amount * 7 / 5) + 2
+    if unit == 'mo':
+        return amount * 31
+    return amount * 366
+
+
+def is_derivable(source_interval, source_period, interval, period):
+    """Whether (interval, period) can be cut out of data cached for (source_interval, source_period)."""
+    if (source_interval, source_period) == (interval, period):
+        return True
+
+    source_days = period_days(source_period)
+    days = period_days(period)
+    if source_days is None or days is None or source_days < days:
+        return False
+    if period == 'max' and source_period != 'max':
+        return False
+
+    return source_interval == interval or can_resample(source_interval, interval)
+
+
+def can_resample(source_interval, interval):
+    """Whether intraday bars of interval can be rebuilt from finer source_interval bars."""
+    source_minutes = INTERVAL_MINUTES.get(source_interval)
+    minutes = INTERVAL_MINUTES.get(interval)
+    if source_minutes is None or minutes is None:
+        return False
+    return minutes < INTRADAY_MINUTES and minutes > source_minutes and minutes % source_minutes == 0
+
+
+def slice_period(stock_data, period, now=None):
+    """Keep the rows of a frame that fall into a shorter period ending at now."""
+    if period == 'max' or stock_data.empty:
+        return stock_data
+
+    match = re.fullmatch(r'(\d+)d', period)
+    if match:
+        # trading day periods keep the last N sessions, like the upstream does
+        dates = stock_data.index.normalize()
+        sessions = dates.unique()[-int(match.group(1)):]
+        return stock_data[dates.isin(sessions)]
+
+    index = stock_data.index
+    now = pd.Timestamp.now(tz=index.tz) if now is None else pd.Timestamp(now)
+    if period == 'ytd':
+        start = pd.Timestamp(year=now.year, month=1, day=1, tz=index.tz)
+    elif period == '1wk':
+        start = now - pd.Timedelta(weeks=1)
+    else:
+        match = re.fullmatch(r'(\d+)(mo|y)', period)
+        if not match:
+            return stock_data
+        amount, unit = int(match.group(1)), match.group(2)
+        start = now - (pd.DateOffset(months=amount) if unit == 'mo' else pd.DateOffset(years=amount))
+    if index.tz is None:
+        # daily bars are dated at midnight, so compare whole days
+        start = start.normalize()
+    return stock_data[index >= start]
+
+
+def resample_ohlcv(stock_data, interval):
+    """Aggregate intraday bars into coarser bars aligned to the session open."""
+    if stock_data.empty:
+        return stock_data
+
+    columns = stock_data.columns
+    flat = stock_data.copy()
+    if isinstance(columns, pd.MultiIndex):
+        flat.columns = columns.get_level_values(0)
+
+    index = flat.index
+    # align the buckets to the earliest bar of a day instead of midnight
+    origin = index[0].normalize() + (index - index.normalize()).min()
+    aggregation = {column: OHLCV_AGGREGATION.get(column, 'last') for column in flat.columns}
+    resampled = flat.resample(f"{INTERVAL_MINUTES[interval]}min", origin=origin).agg(aggregation)
+    if 'Close' in resampled.columns:
+        resampled = resampled.dropna(subset=['Close'])
+    else:
+        resampled = resampled.dropna(how='all')
+
+    if isinstance(columns, pd.MultiIndex):
+        # put the ticker level back, single-ticker frames have one ticker only
+        resampled.columns = pd.MultiIndex.from_product(
+            [resampled.columns, [columns.get_level_values(1)[0]]], names=columns.names
+        )
+    return resampled
+
+
+def derivation_epoch(source_interval, source_period, interval, period, now=None):
+    """
+    Return the time step the cut of (interval, period) out of an unchanged source
+    frame belongs to, None when the cut only depends on the frame.
+
+    Calendar periods start relative to now, so their cut moves while the frame
+    stays the same. Steps of at most 15 minutes follow bar boundaries and the
+    midnight of any timezone.
+    """
+    if (source_interval, source_period) == (interval, period) or period == 'max' or re.fullmatch(r'\d+d', period):
+        return None
+    step = min(INTERVAL_MINUTES.get(source_interval, 15), 15)
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+    return now.floor(f"{step}min")
+
+
+def derive_stock_data(stock_data, source_interval, source_period, interval, period):
+    """Cut (interval, period) out of a frame downloaded for (source_interval, source_period)."""
+    if stock_data is None or (source_interval, source_period) == (interval, period):
+        return stock_data
+
+    derived = slice_period(stock_data, period)
+    if source_interval != interval:
+        derived = resample_ohlcv(derived, interval)
+    if derived.empty:
+        return None
+    return derived
+
+
+class RangeCache:
+    """
+    Serves (symbol, interval, period) from any cached superset of it.
+
+    The entries live in the existing "{symbol}_{interval}_{period}" keyed cache,
+    this class only knows which cached entries can answer a request and which
+    range should be downloaded when none can.
+    """
+
+    def __init__(self, cache, common_fetches):
+        self.cache = cache
+        # the widest (interval, period) the frontend requests, preferred when downloading
+        self.common_fetches = list(common_fetches)
+        self._periods = ['1d', '5d', '1wk', '1mo', '2mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max']
+
+    def get(self, symbol, interval, period):
+        """Return the cached or derived frame, or None when no cached superset exists."""
+        source = self.find_source(symbol, interval, period)
+        if source is None:
+            return None
+        source_interval, source_period, stock_data = source
+        return derive_stock_data(stock_data, source_interval, source_period, interval, period)
+
+    def find_source(self, symbol, interval, period):
+        """Return (interval, period, frame) of a cached entry that covers the request."""
+        exact = self.cache.get(f"{symbol}_{interval}_{period}")
+        if exact is not None:
+            return interval, period, exact
+
+        for source_interval in self._source_intervals(interval):
+            for source_period in self._periods:
+                if not is_derivable(source_interval, source_period, interval, period):
+                    continue
+                stock_data = self.cache.get(f"{symbol}_{source_interval}_{source_period}")
+                if stock_data is not None:
+                    return source_interval, source_period, stock_data
+        return None
+
+    def fetch_plan(self, interval, period):
+        """Return the (interval, period) to download so the request can be derived from it."""
+        for fetch_interval, fetch_period in self.common_fetches:
+            if is_derivable(fetch_interval, fetch_period, interval, period):
+                return fetch_interval, fetch_period
+        return interval, period
+
+    def _source_intervals(self, interval):
+        # same interval first, slicing is cheaper than resampling
+        return [interval] + [source for source in INTERVAL_MINUTES if can_resample(source, interval)]
@@ -0,0 +1,127 @@
+# services/resp_standin.py
+"""
+In-memory stand-in for a Redis server, for running the redis shared cache locally.
+
+It speaks enough of the Redis protocol for services/shared_cache.py: PING,
+GET, SET with EX/PX and NX/XX, DEL, SCAN with MATCH and FLUSHDB.
+
+Run from the project root:
+    python -m services.resp_standin --port 6380
+    SHARED_CACHE_BACKEND=redis SHARED_CACHE_URL=redis://127.0.0.1:6380/0 python services/server.py
+"""
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """Threaded TCP server holding the keys of every client in one dict."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _RespHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self._execute(command))
+            self.wfile.flush()
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if line[:1] != b"*":
+            # inline command, as typed in telnet
+            return line.strip().split()
+        arguments = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def _execute(self, command):
+        name = command[0].upper().decode("ascii", "replace")
+        arguments = command[1:]
+        server = self.server
+        with server.lock:
+            if name == "PING":
+                return b"+PONG\r\n"
+            if name in ("SELECT", "AUTH"):
+                return b"+OK\r\n"
+            if name == "GET":
+                return _bulk(server.lookup(arguments[0]))
+            if name == "SET":
+                expires_at = None
+                options = [argument.upper() for argument in arguments[2:]]
+                exists = server.lookup(arguments[0]) is not None
+                if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                    return _bulk(None)
+                if b"PX" in options:
+                    expires_at = time.monotonic() + int(arguments[2 + options.index(b"PX") + 1]) / 1000
+                elif b"EX" in options:
+                    expires_at = time.monotonic() + int(arguments[2 + options.index(b"EX") + 1])
+                server.data[arguments[0]] = (arguments[1], expires_at)
+                return b"+OK\r\n"
+            if name == "DEL":
+                deleted = 0
+                for key in arguments:
+                    if server.lookup(key) is not None:
+                        del server.data[key]
+                        deleted += 1
+                return b":%d\r\n" % deleted
+            if name == "SCAN":
+                # the whole key space in one page, cursor 0 ends the scan
+                options = [argument.upper() for argument in arguments[1:]]
+                pattern = arguments[1 + options.index(b"MATCH") + 1] if b"MATCH" in options else b"*"
+                keys = [key for key in list(server.data) if server.lookup(key) is not None and fnmatch.fnmatchcase(key, pattern)]
+                return b"*2\r\n" + _bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(_bulk(key) for key in keys)
+            if name == "FLUSHDB":
+                server.data.clear()
+                return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name.encode("utf-8")
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory Redis protocol stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+
+    with RespStandIn((args.host, args.port)) as server:
+        print(f"Redis protocol stand-in listening on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
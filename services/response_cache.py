@@ -0,0 +1,62 @@
+# services/response_cache.py
+import gzip
+import hashlib
+import threading
+
+import pandas as pd
+from cachetools import TTLCache
+
+# responses smaller than this are not worth the gzip header and cpu time
+MIN_GZIP_SIZE = 512
+
+
+def frame_content_hash(stock_data):
+    """Return a hash of the index and values of a frame, used as ETag."""
+    row_hashes = pd.util.hash_pandas_object(stock_data, index=True).to_numpy()
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update(",".join(map(str, stock_data.columns)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EncodedResponse:
+    """The encoded body of a response together with its gzip compressed form."""
+
+    def __init__(self, etag, body, compress_level=6, mimetype="application/json"):
+        self.etag = etag
+        self.body = body
+        self.mimetype = mimetype
+        self.gzipped = gzip.compress(body, compresslevel=compress_level) if len(body) >= MIN_GZIP_SIZE else None
+
+
+class ResponseCache:
+    """
+    Caches the final response bytes per (symbol, interval, period) and content hash.
+
+    An entry is only used while the hash of the frame it was built from matches,
+    so refreshed data is never answered with an older body.
+    """
+
+    def __init__(self, maxsize=500, ttl=300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry.etag == etag:
+            return entry
+        return None
+
+    def put(self, key, etag, body, mimetype="application/json"):
+        entry = EncodedResponse(etag, body, mimetype=mimetype)
+        with self._lock:
+            self._cache[key] = entry
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
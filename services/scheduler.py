@@ -0,0 +1,174 @@
+# services/scheduler.py
+import concurrent.futures
+import datetime
+import random
+import threading
+import time
+
+
+class CacheWarmer:
+    """
+    Background scheduler that refreshes stock data ahead of the cache expiry.
+
+    Every cycle the symbols are split into batches per (interval, period) pair and
+    the batches are spread over the polling interval with some jitter, so the
+    upstream sees a steady trickle instead of one burst. At most max_concurrency
+    batches run at the same time.
+
+    With a lease every worker process runs the scheduler thread, but only the
+    one holding the lease refreshes, the others check again every interval and
+    take over when the holder stops renewing it.
+    """
+
+    def __init__(self, refresh_batch, get_symbols, interval_seconds, interval_periods,
+                 batch_size=10, max_concurrency=2, jitter=0.5, lease=None):
+        # refresh_batch(symbols, interval, period) returns {symbol: data} for the symbols it refreshed
+        self.refresh_batch = refresh_batch
+        # lease() takes or renews the lease and returns whether this process holds it
+        self.lease = lease
+        self.get_symbols = get_symbols
+        self.interval_seconds = interval_seconds
+        self.interval_periods = interval_periods
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._slots = threading.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._key_status = {}
+        self._cycle_status = {
+            "leader": lease is None,
+            "cycles": 0,
+            "last_cycle_started": None,
+            "last_cycle_finished": None,
+            "last_cycle_error": None,
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        print(f"Cache warmer started with interval={self.interval_seconds}s")
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        """Return the cycle state and the last refresh time and failures per cache key."""
+        with self._lock:
+            return {
+                "running": self.is_running(),
+                "interval_seconds": self.interval_seconds,
+                **self._cycle_status,
+                "keys": {key: dict(value) for key, value in self._key_status.items()},
+            }
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            cycle_started = time.monotonic()
+            if not self._hold_lease():
+                self._stop_event.wait(self.interval_seconds)
+                continue
+            try:
+                self.run_cycle()
+            except Exception as e:
+                print(f"Cache warmer cycle failed: {e}")
+                with self._lock:
+                    self._cycle_status["last_cycle_error"] = str(e)
+            remaining = self.interval_seconds - (time.monotonic() - cycle_started)
+            self._stop_event.wait(max(remaining, 0))
+
+    def _hold_lease(self):
+        if self.lease is None:
+            return True
+        try:
+            leader = bool(self.lease())
+        except Exception as e:
+            # without the lease nobody may be refreshing, but two warmers would double the upstream load
+            print(f"Cache warmer could not take its lease: {e}")
+            leader = False
+        with self._lock:
+            if leader != self._cycle_status["leader"]:
+                print(f"Cache warmer {'took' if leader else 'lost'} the lease")
+            self._cycle_status["leader"] = leader
+        return leader
+
+    def run_cycle(self):
+        """Refresh every (symbol, interval, period) once, spread over the polling interval."""
+        with self._lock:
+            self._cycle_status["last_cycle_started"] = _now_iso()
+            self._cycle_status["last_cycle_error"] = None
+
+        symbols = list(dict.fromkeys(self.get_symbols()))
+        jobs = [
+            (symbols[i:i + self.batch_size], interval, period)
+            for interval, period in self.interval_periods
+            for i in range(0, len(symbols), self.batch_size)
+        ]
+
+        if jobs:
+            slot_seconds = self.interval_seconds / len(jobs)
+            cycle_started = time.monotonic()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                for position, job in enumerate(jobs):
+                    offset = position * slot_seconds + random.uniform(0, slot_seconds * self.jitter)
+                    if self._stop_event.wait(max(cycle_started + offset - time.monotonic(), 0)):
+                        break
+                    # block instead of queueing when the previous batches are still running
+                    self._slots.acquire()
+                    pool.submit(self._refresh_job, *job)
+
+        with self._lock:
+            self._cycle_status["cycles"] += 1
+            self._cycle_status["last_cycle_finished"] = _now_iso()
+
+    def _refresh_job(self, symbols, interval, period):
+        try:
+            try:
+                refreshed = self.refresh_batch(symbols, interval, period)
+                error = None
+            except Exception as e:
+                refreshed = {}
+                error = str(e)
+                print(f"Cache warmer failed for {len(symbols)} symbols ({interval}, {period}): {error}")
+
+            for symbol in symbols:
+                if symbol in refreshed:
+                    self._record(symbol, interval, period, None)
+                else:
+                    self._record(symbol, interval, period, error or "No data returned")
+        finally:
+            self._slots.release()
+
+    def _record(self, symbol, interval, period, error):
+        key = f"{symbol}_{interval}_{period}"
+        with self._lock:
+            entry = self._key_status.setdefault(key, {
+                "last_refresh": None,
+                "last_attempt": None,
+                "last_error": None,
+                "consecutive_failures": 0,
+                "total_failures": 0,
+            })
+            entry["last_attempt"] = _now_iso()
+            if error is None:
+                entry["last_refresh"] = entry["last_attempt"]
+                entry["last_error"] = None
+                entry["consecutive_failures"] = 0
+            else:
+                entry["last_error"] = error
+                entry["consecutive_failures"] += 1
+                entry["total_failures"] += 1
+
+
+def _now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
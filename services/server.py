@@ -6,14 +6,43 @@ import os
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, PROJECT_ROOT)
 
-from flask import Flask, json, request, jsonify 
+from flask import Flask, json, request, jsonify, g, stream_with_context
 from flask_cors import CORS
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
-from db.database import get_db, create_database, run_migrations
+from db.database import SessionLocal, engine, session_scope, create_database, run_migrations
 from services import crud
-import yfinance
-from cachetools import TTLCache
+from services.scheduler import CacheWarmer
+from services.singleflight import SingleFlight
+from services.range_cache import (
+    RangeCache, derivation_epoch, derive_stock_data, slice_period, INTERVAL_MINUTES, INTRADAY_MINUTES
+)
+from services.response_cache import ResponseCache, frame_content_hash
+from services.providers import create_provider
+from services.quote_stream import QuoteHub, format_sse
+from services.admission import AdmissionQueue, QueueFull, TokenBucketLimiter, INTERACTIVE, BACKGROUND
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from services.shared_cache import TieredCache, create_shared_backend
+from services.symbol_catalog import SymbolCatalog
+from services.bar_archive import BarArchive
+from services.indicators import IndicatorEngine, parse_indicator, select_range
+from services.downsampling import lttb_indices, MIN_POINTS
+from services.wire_format import (
+    JSON_MIMETYPE, MSGPACK_MIMETYPE, integral_or_float, negotiate_format, packb, round_significant
+)
+from services.metrics import (
+    Counter, Gauge, Histogram, InstrumentedThreadPoolExecutor, InstrumentedTTLCache, render_metrics
+)
+import pandas as pd
+import numpy as np
 import concurrent.futures
+import datetime
+import hashlib
+import threading
+from contextlib import contextmanager
+import re
+import socket
+import time
 
 #create_database() # 1 time run
 #run_migrations() # run as much as needed
@@ -23,24 +52,175 @@ CORS(app, origins=[os.environ.get("FRONT_ORIGINS")])
 
 SERVICE_STOCK_LIST_FILE = os.environ.get("STOCK_LIST_PATH")
 app.config['POLLING_INTERVAL_SECONDS'] = os.environ.get("POLLING_INTERVAL_SECONDS")
+app.config['WARMER_MAX_CONCURRENCY'] = int(os.environ.get("WARMER_MAX_CONCURRENCY", 2))
+app.config['QUOTE_STREAM_INTERVAL_SECONDS'] = int(os.environ.get("QUOTE_STREAM_INTERVAL_SECONDS", 15))
+app.config['UPSTREAM_WORKERS'] = int(os.environ.get("UPSTREAM_WORKERS", 10))
+app.config['UPSTREAM_QUEUE_SIZE'] = int(os.environ.get("UPSTREAM_QUEUE_SIZE", 50))
+app.config['RATE_LIMIT_PER_SECOND'] = float(os.environ.get("RATE_LIMIT_PER_SECOND", 20))
+app.config['RATE_LIMIT_BURST'] = int(os.environ.get("RATE_LIMIT_BURST", 100))
+app.config['STALE_CACHE_TTL_SECONDS'] = int(os.environ.get("STALE_CACHE_TTL_SECONDS", 1800))
+app.config['CIRCUIT_FAILURE_THRESHOLD'] = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+app.config['CIRCUIT_COOLDOWN_SECONDS'] = int(os.environ.get("CIRCUIT_COOLDOWN_SECONDS", 15))
+app.config['SHARED_CACHE_L1_SIZE'] = int(os.environ.get("SHARED_CACHE_L1_SIZE", 100))
+app.config['SHARED_CACHE_CHECK_SECONDS'] = float(os.environ.get("SHARED_CACHE_CHECK_SECONDS", 1))
+app.config['SYMBOL_CATALOG_CHECK_SECONDS'] = float(os.environ.get("SYMBOL_CATALOG_CHECK_SECONDS", 1))
+app.config['VALIDATE_FAVORITE_SYMBOLS'] = os.environ.get("VALIDATE_FAVORITE_SYMBOLS", "true").lower() in ("1", "true", "yes")
+app.config['BAR_ARCHIVE_DIR'] = os.environ.get("BAR_ARCHIVE_DIR")
 
-def read_stock_list_from_file(filepath):
-    """Read the stock symbols from the json file."""
-    try:
-        with open(filepath, 'r') as file:
-            json_string = file.read()
-            stock_ticker_list = json.loads(json_string)
-            return stock_ticker_list
-    except FileNotFoundError:
-        print(f"Error: File not found at path: {filepath}")
-        return None
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from file: {filepath}.  Please ensure it's valid JSON.")
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred while reading stock list file: {e}")
+# ----------------------- METRICS -----------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Latency of the API endpoints.", ["endpoint", "method", "status"]
+)
+STOCK_STAGE_SECONDS = Histogram(
+    "stock_stage_duration_seconds", "Time spent in each stage of the stock endpoints.", ["stage"]
+)
+STOCK_CACHE_LOOKUPS = Counter(
+    "stock_cache_lookups_total", "Stock cache lookups by result (hit, derived or miss).", ["result"]
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total", "Encoded response cache lookups by result.", ["result"]
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total", "Cache entries dropped because the cache was full (size) or expired (ttl).", ["cache", "reason"]
+)
+CACHE_ENTRIES = Gauge("cache_entries", "Entries held by a cache.", ["cache"])
+EXECUTOR_QUEUED = Gauge("executor_queued_tasks", "Tasks waiting for an executor worker.", ["executor"])
+EXECUTOR_ACTIVE = Gauge("executor_active_workers", "Executor workers running a task.", ["executor"])
+EXECUTOR_QUEUE_WAIT = Histogram(
+    "executor_queue_wait_seconds", "Time tasks waited for an executor worker.", ["executor"]
+)
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total", "Market data provider calls by kind and outcome.", ["kind", "outcome"]
+)
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Market data provider calls that were retried.", ["kind"])
+UPSTREAM_FAILURES = Counter(
+    "upstream_failures_total", "Market data fetches that failed after every retry.", ["kind"]
+)
+COALESCED_FETCHES = Gauge("stock_fetches_coalesced", "Stock fetches that waited on an identical fetch in flight.")
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Upstream fetches not admitted because the queue was full.", ["queue", "priority"]
+)
+RATE_LIMITED = Counter("rate_limited_requests_total", "Requests answered with 429 by the rate limiter.", ["endpoint"])
+STALE_RESPONSES = Counter("stale_responses_total", "Responses served from expired cache entries.", ["endpoint"])
+CIRCUIT_STATE = Gauge("circuit_breaker_open", "1 while the circuit of an upstream is open or half open.", ["circuit"])
+SHARED_CACHE_ERRORS = Counter("shared_cache_errors_total", "Failed calls to the shared cache backend.", ["backend"])
+DB_CHECKOUT_SECONDS = Histogram(
+    "db_session_checkout_seconds", "Time to get a database connection for a session.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Connections of the database pool by state.", ["state"])
+DB_POOL_UTILIZATION = Gauge(
+    "db_pool_utilization", "Checked out connections divided by the pool size, above 1 while overflowing."
+)
+
+# sqlite memory databases use a pool without these counters
+if hasattr(engine.pool, "checkedout"):
+    DB_POOL_CONNECTIONS.labels("size").set_function(engine.pool.size)
+    DB_POOL_CONNECTIONS.labels("checked_out").set_function(engine.pool.checkedout)
+    DB_POOL_CONNECTIONS.labels("checked_in").set_function(engine.pool.checkedin)
+    DB_POOL_CONNECTIONS.labels("overflow").set_function(lambda: max(engine.pool.overflow(), 0))
+    DB_POOL_UTILIZATION.set_function(lambda: engine.pool.checkedout() / max(engine.pool.size(), 1))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+# Expensive endpoints get a token bucket per client address (and user), the rest is not limited
+RATE_LIMITED_ENDPOINTS = {
+    "get_stock_price", "get_stock_price_batch", "get_stock_indicators", "stream_quotes", "get_user_portfolio", "login_user"
+}
+rate_limiter = TokenBucketLimiter(app.config['RATE_LIMIT_PER_SECOND'], app.config['RATE_LIMIT_BURST'])
+
+def client_rate_limit_key(remote_addr, user_id=None):
+    """
+    Bucket of a caller. The requests carry no authenticated identity, so the
+    bucket is the client address, the user id of the URL only splits it further:
+    a client can not get a fresh bucket by asking for another user's data.
+    """
+    key = f"ip:{remote_addr}"
+    return key if user_id is None else f"{key}:user:{user_id}"
+
+def rate_limit_key():
+    # behind a proxy, wrap the app in werkzeug's ProxyFix so this is the client address
+    return client_rate_limit_key(request.remote_addr, (request.view_args or {}).get("user_id"))
+
+def too_many_requests(message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+@app.before_request
+def apply_rate_limit():
+    if request.endpoint not in RATE_LIMITED_ENDPOINTS:
         return None
-    
+    retry_after = rate_limiter.acquire(rate_limit_key())
+    if retry_after:
+        RATE_LIMITED.labels(request.url_rule.rule).inc()
+        return too_many_requests("Too many requests, slow down.", retry_after)
+    return None
+
+@app.after_request
+def observe_request_latency(response):
+    started = g.get("request_started")
+    if started is not None:
+        # the route template keeps the label count bounded, /stock/<symbol> not /stock/AAPL
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+def checkout_connection(db_session):
+    """Take the connection of a session from the pool now, recording how long the checkout waited."""
+    started = time.perf_counter()
+    db_session.connection()
+    DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+def get_request_db():
+    """Session of the current request, created on first use and closed by close_request_db."""
+    if "db_session" not in g:
+        db_session = SessionLocal()
+        g.db_session = db_session
+        checkout_connection(db_session)
+    return g.db_session
+
+@app.teardown_appcontext
+def close_request_db(exception):
+    # runs for every request however the handler returned, so the connection always goes back to the pool
+    db_session = g.pop("db_session", None)
+    if db_session is not None:
+        db_session.close()
+
+@contextmanager
+def db_session_scope():
+    """Session for work outside a request (the store, the cache warmer, worker threads)."""
+    with session_scope() as db_session:
+        checkout_connection(db_session)
+        yield db_session
+
+def encode_json(data):
+    """Encode data to the compact JSON bytes that jsonify sends."""
+    return (app.json.dumps(data, separators=(",", ":")) + "\n").encode("utf-8")
+
+# Loaded once, read again when the file changes
+symbol_catalog = SymbolCatalog(
+    SERVICE_STOCK_LIST_FILE, encode=encode_json, check_seconds=app.config['SYMBOL_CATALOG_CHECK_SECONDS']
+)
+
+def check_known_symbols(favorite_stocks):
+    """
+    Raise ValueError if a favorite stock is not in the symbol catalog.
+    Takes stock names or [name, double] pairs, malformed items are left to crud.
+    """
+    if not app.config['VALIDATE_FAVORITE_SYMBOLS']:
+        return
+    stock_names = [item[0] if isinstance(item, (list, tuple)) and item else item for item in favorite_stocks]
+    unknown = symbol_catalog.unknown([name for name in stock_names if isinstance(name, str)])
+    if unknown:
+        raise ValueError(f"Unknown stock symbols: {', '.join(unknown)}")
+
 def extract_float_from_dictionary(input_string):
     """Function to extract float value from pd.series version of the yfinance row as string."""
     if not isinstance(input_string, str):
@@ -58,119 +238,997 @@ def extract_float_from_dictionary(input_string):
             return None
     return -1
 
-stock_cache = TTLCache(maxsize=500, ttl=300)
+# yfinance unless MARKET_DATA_PROVIDER selects the replay or synthetic provider
+market_data = create_provider()
+print(f"Using the {market_data.name} market data provider")
 
-def fetch_stock_data(symbol, interval, period):
-    """Function to fetch stock data with retry logic"""
-    cache_key = f"{symbol}_{interval}_{period}"
-    
-    # return cached data if available & catching is more suitable than writing it to the database
-    if cache_key in stock_cache:
-        return stock_cache[cache_key]
-    
-    max_retries = 2
-    backoff_factor = 0.5
-    
+# With SHARED_CACHE_BACKEND set the workers share one copy of the frames, the
+# in-process cache stays in front of it as a smaller L1
+shared_cache_backend = create_shared_backend()
+if shared_cache_backend is not None:
+    print(f"Sharing the stock cache through the {shared_cache_backend.name} backend")
+
+def create_stock_cache(name, maxsize, ttl):
+    if shared_cache_backend is None:
+        return InstrumentedTTLCache(maxsize=maxsize, ttl=ttl, evictions=CACHE_EVICTIONS, name=name)
+    l1 = InstrumentedTTLCache(
+        maxsize=min(maxsize, app.config['SHARED_CACHE_L1_SIZE']), ttl=ttl, evictions=CACHE_EVICTIONS, name=name
+    )
+    return TieredCache(
+        l1, shared_cache_backend, namespace=name, ttl=ttl, check_seconds=app.config['SHARED_CACHE_CHECK_SECONDS'],
+        on_error=lambda e: SHARED_CACHE_ERRORS.labels(shared_cache_backend.name).inc()
+    )
+
+stock_cache = create_stock_cache("stock", maxsize=500, ttl=300)
+# Every cached frame is also kept here for longer, it is served marked stale while a refresh runs
+stale_cache = create_stock_cache("stale", maxsize=500, ttl=app.config['STALE_CACHE_TTL_SECONDS'])
+stock_fetches = SingleFlight()
+CACHE_ENTRIES.labels("stock").set_function(lambda: len(stock_cache))
+CACHE_ENTRIES.labels("stale").set_function(lambda: len(stale_cache))
+COALESCED_FETCHES.set_function(lambda: stock_fetches.stats()["coalesced"])
+
+# The widest range the frontend requests per interval, the smaller periods of the
+# stock_charts and stockdetails pages (1d/5d, 1d/1mo, 1h/1d...) are cut out of them
+COMMON_FETCHES = [('5m', '1d'), ('1d', '2mo')]
+range_cache = RangeCache(stock_cache, COMMON_FETCHES)
+stale_range_cache = RangeCache(stale_cache, COMMON_FETCHES)
+
+def cache_stock_data(cache_key, stock_data):
+    stock_cache[cache_key] = stock_data
+    stale_cache[cache_key] = stock_data
+
+def cache_incomplete_stock_data(cache_key, stock_data):
+    # bars without their latest tail are only served marked stale, the next request downloads again
+    stale_cache[cache_key] = stock_data
+
+# Fail fast instead of queueing on the market data provider after repeated errors
+upstream_breaker = CircuitBreaker(
+    "market data",
+    failure_threshold=app.config['CIRCUIT_FAILURE_THRESHOLD'],
+    cooldown=app.config['CIRCUIT_COOLDOWN_SECONDS'],
+    on_state_change=lambda state: print(f"Market data circuit is {state}")
+)
+CIRCUIT_STATE.labels("market_data").set_function(lambda: int(upstream_breaker.state() != CircuitBreaker.CLOSED))
+
+# Daily and longer bars never change once the session is closed, so they are kept in
+# the price_bars table and only the missing tail is downloaded again.
+STORED_INTERVALS = {'1d', '5d', '1wk', '1mo', '3mo'}
+# weekends and market holidays between the period start and the first stored bar
+PERIOD_COVERAGE_SLACK = datetime.timedelta(days=4)
+# calendar days between two bars, two stored bars further apart than this plus the slack have bars missing between them
+STORED_BAR_SPACING_DAYS = {'1d': 1, '5d': 5, '1wk': 7, '1mo': 31, '3mo': 92}
+
+# Long histories written by services/backfill.py, ranges are sliced out of the mapped files
+bar_archive = BarArchive(app.config['BAR_ARCHIVE_DIR']) if app.config['BAR_ARCHIVE_DIR'] else None
+
+def period_to_start(period, now=None):
+    """Return the calendar start of a yfinance period, or None if it can not be stored.
+
+    Periods in days count trading days upstream, so they are returned as a bar count
+    by period_to_bar_count instead.
+    """
+    # whole days like slice_period, the bar dated on the first day belongs to the period
+    now = (now or datetime.datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'ytd':
+        return datetime.datetime(now.year, 1, 1)
+    match = re.fullmatch(r'(\d+)(wk|mo|y)', period)
+    if not match:
+        return None
+    amount, unit = int(match.group(1)), match.group(2)
+    if unit == 'wk':
+        return now - datetime.timedelta(weeks=amount)
+    if unit == 'mo':
+        return now - pd.DateOffset(months=amount)
+    return now - pd.DateOffset(years=amount)
+
+def period_to_bar_count(period):
+    """Return the number of bars of a trading-day period like 5d, or None."""
+    match = re.fullmatch(r'(\d+)d', period)
+    return int(match.group(1)) if match else None
+
+def price_bars_to_frame(bars, symbol):
+    """Build a yfinance shaped frame from stored PriceBar rows."""
+    index = pd.DatetimeIndex([bar.timestamp for bar in bars], name='Date')
+    columns = pd.MultiIndex.from_product(
+        [['Close', 'High', 'Low', 'Open', 'Volume'], [symbol]], names=['Price', 'Ticker']
+    )
+    values = [[bar.close, bar.high, bar.low, bar.open, bar.volume] for bar in bars]
+    return pd.DataFrame(values, index=index, columns=columns, dtype=np.float64)
+
+def frame_to_price_bars(stock_data, symbol, interval):
+    """Convert a downloaded frame into rows for crud.upsert_price_bars."""
+    length = len(stock_data)
+    columns = {
+        name: column_to_list(get_ohlcv_column(stock_data, column), length)
+        for name, column in (('open', 'Open'), ('high', 'High'), ('low', 'Low'), ('close', 'Close'), ('volume', 'Volume'))
+    }
+    timestamps = stock_data.index
+    if timestamps.tz is not None:
+        timestamps = timestamps.tz_localize(None)
+    return [
+        {
+            "symbol": symbol,
+            "interval": interval,
+            "timestamp": timestamp,
+            "open": columns['open'][i],
+            "high": columns['high'][i],
+            "low": columns['low'][i],
+            "close": columns['close'][i],
+            "volume": columns['volume'][i],
+        }
+        for i, timestamp in enumerate(timestamps.to_pydatetime())
+    ]
+
+def save_price_bars(symbol, interval, stock_data):
+    """Write downloaded bars to the price_bars table, ignoring store failures."""
+    if interval not in STORED_INTERVALS or stock_data is None or stock_data.empty:
+        return
+    try:
+        with db_session_scope() as db_session:
+            crud.upsert_price_bars(db_session, frame_to_price_bars(stock_data, symbol, interval))
+    except Exception as e:
+        print(f"Warning: Could not store price bars for {symbol} ({interval}): {e}")
+
+def load_price_bars(symbol, interval, period):
+    """Read the stored bars covering a period, or None if the store does not cover it."""
+    start = period_to_start(period)
+    bar_count = period_to_bar_count(period)
+    if interval not in STORED_INTERVALS or (start is None and bar_count is None):
+        return None
+
+    try:
+        with db_session_scope() as db_session:
+            if bar_count is not None:
+                bars = crud.get_latest_price_bars(db_session, symbol, interval, bar_count)
+                covered = len(bars) == bar_count
+            else:
+                bars = crud.get_price_bars(db_session, symbol, interval, start=start)
+                covered = bool(bars) and bars[0].timestamp <= start + PERIOD_COVERAGE_SLACK
+    except Exception as e:
+        print(f"Warning: Could not read price bars for {symbol} ({interval}): {e}")
+        return None
+
+    if not covered:
+        return None
+    stored_data = price_bars_to_frame(bars, symbol)
+    max_gap = pd.Timedelta(days=STORED_BAR_SPACING_DAYS[interval]) + PERIOD_COVERAGE_SLACK
+    gaps = np.flatnonzero(stored_data.index[1:] - stored_data.index[:-1] > max_gap)
+    if len(gaps):
+        # the store holds separate ranges, the bars from the first gap on are downloaded again with the tail
+        stored_data = stored_data.iloc[:gaps[0] + 1]
+    return stored_data
+
+def load_archived_bars(symbol, interval, period):
+    """Read a period from the bar archive, or None if there is no archive or it does not cover the period."""
+    if bar_archive is None:
+        return None
+    try:
+        return bar_archive.frame(symbol, interval, period)
+    except Exception as e:
+        print(f"Warning: Could not read archived bars for {symbol} ({interval}): {e}")
+        return None
+
+def extend_archived_bars(symbol, interval, period, archived_data):
+    """
+    Append the bars after the archived ones. Returns (frame, complete), the archive
+    answers alone and incomplete when they can not be downloaded.
+    """
+    # the last archived bar may still have been in progress, so it is fetched again
+    last_timestamp = archived_data.index[-1]
+    try:
+        tail_data = download_stock_data(
+            symbol, interval, max_retries=1, start=last_timestamp.strftime('%Y-%m-%d')
+        )
+    except Exception as e:
+        print(f"Warning: Could not download the bars after the archive for {symbol} ({interval}): {e}")
+        return archived_data, False
+    if tail_data is None or tail_data.empty:
+        return archived_data, True
+    with STOCK_STAGE_SECONDS.labels("store_write").time():
+        save_price_bars(symbol, interval, tail_data)
+
+    tail_data = tail_data.copy()
+    timezone = archived_data.index.tz
+    if timezone is None:
+        # naive bars hold wall time, like the bar store
+        if tail_data.index.tz is not None:
+            tail_data.index = tail_data.index.tz_localize(None)
+    elif tail_data.index.tz is None:
+        tail_data.index = tail_data.index.tz_localize(timezone)
+    else:
+        tail_data.index = tail_data.index.tz_convert(timezone)
+    stock_data = pd.concat([archived_data[archived_data.index < tail_data.index[0]], tail_data])
+    return slice_period(stock_data, period), True
+
+def download_stock_data(symbol, interval, max_retries=2, **date_range):
+    """Download one symbol from the market data provider with retry logic, returns None if nothing came back.
+
+    Retries are immediate, the backoff after repeated errors is the cooldown of
+    the circuit breaker so no worker sleeps while holding its slot.
+    """
     for attempt in range(max_retries):
+        if attempt > 0:
+            UPSTREAM_RETRIES.labels("single").inc()
         try:
-            stock_data = yfinance.download(
-                tickers=symbol, 
-                period=period, 
-                interval=interval,
-                progress=False
-            )
-            
+            with STOCK_STAGE_SECONDS.labels("download").time():
+                stock_data = upstream_breaker.call(
+                    market_data.download,
+                    tickers=symbol,
+                    interval=interval,
+                    progress=False,
+                    **date_range
+                )
+
             if not stock_data.empty:
-                # cache the results
-                stock_cache[cache_key] = stock_data
+                UPSTREAM_REQUESTS.labels("single", "ok").inc()
                 return stock_data
-                
+
+            UPSTREAM_REQUESTS.labels("single", "empty").inc()
             print(f"Attempt {attempt+1}: Empty data received for {symbol}. Retrying...")
-            # exponential backoff to let yfinance retrieve the data 
-            time.sleep(backoff_factor * (2 ** attempt))
-                
+
+        except CircuitOpenError:
+            UPSTREAM_REQUESTS.labels("single", "circuit_open").inc()
+            raise
         except Exception as e:
+            UPSTREAM_REQUESTS.labels("single", "error").inc()
             print(f"Attempt {attempt+1} failed for {symbol}: {str(e)}")
             if attempt == max_retries - 1:  # if this was the last attempt
+                UPSTREAM_FAILURES.labels("single").inc()
                 raise
-            time.sleep(backoff_factor * (2 ** attempt))
-    
+
+    UPSTREAM_FAILURES.labels("single").inc()
     return None
 
+def lookup_stock_source(symbol, interval, period):
+    """Return (interval, period, frame) of the cached entry a request is cut from, or None on a miss."""
+    with STOCK_STAGE_SECONDS.labels("cache_lookup").time():
+        source = range_cache.find_source(symbol, interval, period)
+    if source is None:
+        STOCK_CACHE_LOOKUPS.labels("miss").inc()
+    elif source[:2] == (interval, period):
+        STOCK_CACHE_LOOKUPS.labels("hit").inc()
+    else:
+        STOCK_CACHE_LOOKUPS.labels("derived").inc()
+    return source
+
+def lookup_stock_data(symbol, interval, period):
+    """Return the cached or derived frame for a request, or None on a miss."""
+    source = lookup_stock_source(symbol, interval, period)
+    if source is None:
+        return None
+    with STOCK_STAGE_SECONDS.labels("derive").time():
+        return derive_stock_data(source[2], source[0], source[1], interval, period)
+
+def lookup_stale_stock_source(symbol, interval, period):
+    """Return (interval, period, frame) of the expired but still kept entry for a request, or None."""
+    source = stale_range_cache.find_source(symbol, interval, period)
+    if source is not None:
+        STOCK_CACHE_LOOKUPS.labels("stale").inc()
+    return source
+
+def lookup_stale_stock_data(symbol, interval, period):
+    """Return the expired but still kept frame for a request, or None."""
+    source = lookup_stale_stock_source(symbol, interval, period)
+    if source is None:
+        return None
+    return derive_stock_data(source[2], source[0], source[1], interval, period)
+
+def fetch_stock_data(symbol, interval, period):
+    """Function to fetch stock data with retry logic"""
+    # return cached data if available & catching is more suitable than writing it to the database
+    stock_data = lookup_stock_data(symbol, interval, period)
+    if stock_data is not None:
+        return stock_data
+
+    # download the widest common range instead, concurrent misses for it share one download
+    fetch_interval, fetch_period = range_cache.fetch_plan(interval, period)
+    fetch_key = f"{symbol}_{fetch_interval}_{fetch_period}"
+    stock_data = stock_fetches.do(fetch_key, load_stock_data, symbol, fetch_interval, fetch_period)
+    return derive_stock_data(stock_data, fetch_interval, fetch_period, interval, period)
+
+def load_stock_data(symbol, interval, period):
+    """Load stock data from the bar archive, the bar store or the market data provider and cache it, without coalescing."""
+    cache_key = f"{symbol}_{interval}_{period}"
+
+    # another caller may have filled the cache while this one was waiting
+    if cache_key in stock_cache:
+        return stock_cache[cache_key]
+
+    with STOCK_STAGE_SECONDS.labels("archive_read").time():
+        archived_data = load_archived_bars(symbol, interval, period)
+
+    if archived_data is not None:
+        # multi-year ranges are a slice of the archive, only the bars after it are downloaded
+        stock_data, complete = extend_archived_bars(symbol, interval, period, archived_data)
+        if complete:
+            cache_stock_data(cache_key, stock_data)
+        else:
+            cache_incomplete_stock_data(cache_key, stock_data)
+        return stock_data
+
+    with STOCK_STAGE_SECONDS.labels("store_read").time():
+        stored_data = load_price_bars(symbol, interval, period)
+
+    complete = True
+    if stored_data is None:
+        stock_data = download_stock_data(symbol, interval, period=period)
+        with STOCK_STAGE_SECONDS.labels("store_write").time():
+            save_price_bars(symbol, interval, stock_data)
+    else:
+        # the last stored bar may still have been in progress, so it is fetched again
+        last_timestamp = stored_data.index[-1]
+        try:
+            tail_data = download_stock_data(
+                symbol, interval, max_retries=1, start=last_timestamp.strftime('%Y-%m-%d')
+            )
+        except Exception as e:
+            # the stored bars answer alone, like the archive when its tail can not be downloaded
+            print(f"Warning: Could not download the bars after the stored ones for {symbol} ({interval}): {e}")
+            tail_data = None
+            complete = False
+        with STOCK_STAGE_SECONDS.labels("store_write").time():
+            save_price_bars(symbol, interval, tail_data)
+
+        stock_data = stored_data
+        if tail_data is not None:
+            tail_data = tail_data.copy()
+            if tail_data.index.tz is not None:
+                tail_data.index = tail_data.index.tz_localize(None)
+            stock_data = pd.concat([stored_data[stored_data.index < tail_data.index[0]], tail_data])
+        bar_count = period_to_bar_count(period)
+        if bar_count is not None:
+            stock_data = stock_data.iloc[-bar_count:]
+        else:
+            stock_data = stock_data[stock_data.index >= period_to_start(period)]
+
+    if stock_data is not None and not stock_data.empty:
+        # cache the results
+        if complete:
+            cache_stock_data(cache_key, stock_data)
+        else:
+            cache_incomplete_stock_data(cache_key, stock_data)
+        return stock_data
+
+    return None
+
+MAX_BATCH_SYMBOLS = 50
+
+def split_batch_stock_data(batch_data, symbols):
+    """Split a multi-ticker yfinance frame into one frame per symbol.
+
+    The per-symbol frames keep the (Price, Ticker) column layout that a
+    single-ticker download returns, so they can be cached next to them.
+    """
+    result = {}
+    if batch_data is None or batch_data.empty:
+        return result
+
+    if not isinstance(batch_data.columns, pd.MultiIndex):
+        # yfinance may flatten the columns when a single ticker is requested
+        if len(symbols) == 1:
+            batch_data = pd.concat({symbols[0]: batch_data}, axis=1)
+        else:
+            return result
+
+    available = set(batch_data.columns.get_level_values(0))
+    for symbol in symbols:
+        if symbol not in available:
+            continue
+        symbol_data = batch_data[symbol].dropna(how='all')
+        if symbol_data.empty:
+            continue
+        symbol_data.columns = pd.MultiIndex.from_product(
+            [symbol_data.columns, [symbol]], names=['Price', 'Ticker']
+        )
+        result[symbol] = symbol_data
+    return result
+
+def download_stock_data_batch(symbols, interval, period, refresh=False):
+    """Download every symbol in one multi-ticker call and fill the cache.
+
+    Only the symbols that were not already cached are downloaded and returned,
+    unless refresh is set, then all of them are downloaded again.
+    """
+    if refresh:
+        missing = list(symbols)
+    else:
+        missing = [s for s in symbols if range_cache.find_source(s, interval, period) is None]
+    if not missing:
+        return {}
+
+    max_retries = 2
+
+    for attempt in range(max_retries):
+        if attempt > 0:
+            UPSTREAM_RETRIES.labels("batch").inc()
+        try:
+            with STOCK_STAGE_SECONDS.labels("batch_download").time():
+                batch_data = upstream_breaker.call(
+                    market_data.download,
+                    tickers=missing,
+                    period=period,
+                    interval=interval,
+                    group_by='ticker',
+                    progress=False
+                )
+
+            fetched = split_batch_stock_data(batch_data, missing)
+            if fetched:
+                UPSTREAM_REQUESTS.labels("batch", "ok").inc()
+                with STOCK_STAGE_SECONDS.labels("store_write").time():
+                    for symbol, symbol_data in fetched.items():
+                        cache_stock_data(f"{symbol}_{interval}_{period}", symbol_data)
+                        save_price_bars(symbol, interval, symbol_data)
+                return fetched
+
+            UPSTREAM_REQUESTS.labels("batch", "empty").inc()
+            print(f"Attempt {attempt+1}: Empty batch data received for {len(missing)} symbols. Retrying...")
+
+        except CircuitOpenError:
+            UPSTREAM_REQUESTS.labels("batch", "circuit_open").inc()
+            raise
+        except Exception as e:
+            UPSTREAM_REQUESTS.labels("batch", "error").inc()
+            print(f"Attempt {attempt+1} failed for batch of {len(missing)} symbols: {str(e)}")
+            if attempt == max_retries - 1:
+                UPSTREAM_FAILURES.labels("batch").inc()
+                raise
+
+    UPSTREAM_FAILURES.labels("batch").inc()
+    return {}
+
+def fetch_stock_data_batch(symbols, interval, period):
+    """Function to fetch stock data for many symbols with a single upstream download"""
+    missing = [s for s in symbols if range_cache.find_source(s, interval, period) is None]
+    STOCK_CACHE_LOOKUPS.labels("miss").inc(len(missing))
+    STOCK_CACHE_LOOKUPS.labels("hit").inc(len(symbols) - len(missing))
+    if missing:
+        # like single fetches, download the widest common range and cut the request out of it
+        fetch_interval, fetch_period = range_cache.fetch_plan(interval, period)
+        download_stock_data_batch(missing, fetch_interval, fetch_period, refresh=True)
+
+    return {symbol: range_cache.get(symbol, interval, period) for symbol in symbols}
+
+OHLCV_FIELDS = [
+    ("1. open", "Open"),
+    ("2. high", "High"),
+    ("3. low", "Low"),
+    ("4. close", "Close"),
+    ("5. volume", "Volume"),
+]
+
+def get_ohlcv_column(stock_data, column):
+    """Return one OHLCV column as a float array, or None if it is missing.
+
+    yfinance returns (Price, Ticker) multi-index columns, so the first column
+    under the price level is used for those frames.
+    """
+    if isinstance(stock_data.columns, pd.MultiIndex):
+        # positional lookup, xs() builds a new frame per call
+        positions = np.flatnonzero(stock_data.columns.get_level_values(0) == column)
+        if len(positions) == 0:
+            return None
+        values = stock_data.iloc[:, positions[0]]
+    else:
+        if column not in stock_data.columns:
+            return None
+        values = stock_data[column]
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+
+def column_to_list(values, length):
+    """Convert a float array to a list with NaN mapped to None for jsonify."""
+    if values is None:
+        return [None] * length
+    mask = np.isnan(values)
+    if not mask.any():
+        return values.tolist()
+    converted = values.astype(object)
+    converted[mask] = None
+    return converted.tolist()
+
+# The row loop this replaced parsed the printed pandas Series of every value: 6 decimals,
+# 7 significant digits in scientific notation for tiny values and long large ones
+SERIES_TEXT_DIGITS = 6
+
+def round_like_series_text(values):
+    """Round a float array to the values the printed one-value Series of the row loop held."""
+    rounded = np.round(values, SERIES_TEXT_DIGITS)
+    magnitudes = np.abs(values)
+    with np.errstate(invalid='ignore'):
+        # whole numbers below 1e9 print as "1234567.0", the rest outside [1e-6, 1e6] is decided one by one
+        whole = (values == np.round(values)) & (magnitudes < 1e9)
+        irregular = ((magnitudes < 10.0 ** -SERIES_TEXT_DIGITS) & (magnitudes > 0)) | ((magnitudes > 1e6) & ~whole)
+    for position in np.flatnonzero(irregular):
+        rounded[position] = series_text_value(values[position])
+    return rounded
+
+def series_text_value(value):
+    """The value pandas prints for a one-value float Series, read back as a float."""
+    fixed = f"{value: .{SERIES_TEXT_DIGITS}f}".rstrip('0')
+    if fixed.endswith('.'):
+        fixed += '0'
+    # the formatter switches to scientific notation when fixed notation would hide or widen the value
+    if 0 < abs(value) < 10.0 ** -SERIES_TEXT_DIGITS or (abs(value) > 1e6 and len(fixed) > SERIES_TEXT_DIGITS + 6):
+        return float(f"{value:.{SERIES_TEXT_DIGITS}e}")
+    return float(fixed)
+
 def process_stock_data(stock_data, interval):
     """Process the downloaded stock data into the desired format """
     if stock_data is None or stock_data.empty:
         return None
-    
-    result = {}
-    
+
     if interval == '1d':
         time_series_key = "Time Series (Daily)"
     else:
         time_series_key = f"Time Series ({interval})"
-    
-    result[time_series_key] = {}
-    
-    for index, row in stock_data.iterrows():
-        date_str = index.strftime('%Y-%m-%d %H:%M:%S')
-
-        open_val = extract_float_from_dictionary(str(row.get('Open', 0)))
-        high_val = extract_float_from_dictionary(str(row.get('High', 0)))
-        low_val = extract_float_from_dictionary(str(row.get('Low', 0)))
-        close_val = extract_float_from_dictionary(str(row.get('Close', 0)))
-        volume_val = extract_float_from_dictionary(str(row.get('Volume', 0)))
-        
-        # Handle the none value for the jsonify to resolve front end errors
-        data_point = {
-                "1. open": None if open_val is None else open_val,
-                "2. high": None if high_val is None else high_val,
-                "3. low": None if low_val is None else low_val,
-                "4. close": None if close_val is None else close_val,
-                "5. volume": None if volume_val is None else volume_val
-            }
-        
-        result[time_series_key][date_str] = data_point
-    
+
+    # format the index once and pull whole columns instead of walking rows
+    length = len(stock_data)
+    date_strs = stock_data.index.strftime('%Y-%m-%d %H:%M:%S')
+    keys = [key for key, _ in OHLCV_FIELDS]
+    columns = []
+    for _, column in OHLCV_FIELDS:
+        values = get_ohlcv_column(stock_data, column)
+        columns.append(column_to_list(round_like_series_text(values) if values is not None else None, length))
+
+    time_series = {
+        date_str: dict(zip(keys, values))
+        for date_str, values in zip(date_strs, zip(*columns))
+    }
+
+    return {time_series_key: time_series}
+
+# Portfolio quotes come from daily bars, any cached daily frame of a symbol has its last two closes
+PORTFOLIO_INTERVAL = '1d'
+PORTFOLIO_PERIOD = '5d'
+NO_QUOTE = (np.nan, np.nan, None)
+
+# symbol -> (frame, quote), reused while the cache still holds the same frame
+quote_cache = TTLCache(maxsize=2000, ttl=stock_cache.ttl)
+# read by request threads and the quote hub thread, TTLCache is not thread safe
+quote_cache_lock = threading.Lock()
+
+def quote_from_frame(stock_data):
+    """(last close, previous close, last bar time) of a frame."""
+    if stock_data is None or stock_data.empty:
+        return NO_QUOTE
+    closes = get_ohlcv_column(stock_data, "Close")
+    if closes is None:
+        return NO_QUOTE
+    valid = np.flatnonzero(~np.isnan(closes))
+    if len(valid) == 0:
+        return NO_QUOTE
+    previous = closes[valid[-2]] if len(valid) > 1 else np.nan
+    return closes[valid[-1]], previous, stock_data.index[valid[-1]].strftime('%Y-%m-%d %H:%M:%S')
+
+def cached_quote(symbol, stock_data):
+    with quote_cache_lock:
+        entry = quote_cache.get(symbol)
+    if entry is not None and entry[0] is stock_data:
+        return entry[1]
+    quote = quote_from_frame(stock_data)
+    with quote_cache_lock:
+        quote_cache[symbol] = (stock_data, quote)
+    return quote
+
+def lookup_quotes(symbols):
+    """
+    Quotes of many symbols from the cached daily frames, the missing symbols are fetched with one batch.
+    Returns ({symbol: quote}, stale_symbols).
+    """
+    quotes = {}
+    missing = []
+    for symbol in symbols:
+        source = range_cache.find_source(symbol, PORTFOLIO_INTERVAL, PORTFOLIO_PERIOD)
+        if source is None:
+            missing.append(symbol)
+        else:
+            quotes[symbol] = cached_quote(symbol, source[2])
+    STOCK_CACHE_LOOKUPS.labels("hit").inc(len(quotes))
+
+    stale_symbols = []
+    if missing:
+        stock_data_by_symbol, stale_symbols = fetch_stock_data_batch_or_cached(
+            missing, PORTFOLIO_INTERVAL, PORTFOLIO_PERIOD
+        )
+        for symbol, stock_data in stock_data_by_symbol.items():
+            quotes[symbol] = quote_from_frame(stock_data)
+    return quotes, stale_symbols
+
+def build_portfolio(watchlist, quotes):
+    """Price, day change and P&L against stock_double of every favorite, computed over all of them at once."""
+    rows = [quotes.get(stock_name.upper(), NO_QUOTE) for stock_name, _ in watchlist]
+    doubles = np.array([np.nan if stock_double is None else stock_double for _, stock_double in watchlist], dtype=np.float64)
+    price = np.array([row[0] for row in rows], dtype=np.float64)
+    previous_close = np.array([row[1] for row in rows], dtype=np.float64)
+    as_of = [row[2] for row in rows]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        day_change = price - previous_close
+        day_change_percent = day_change / previous_close * 100
+        pnl = price - doubles
+        pnl_percent = pnl / doubles * 100
+    # a zero reference price has no percentage
+    day_change_percent[~np.isfinite(day_change_percent)] = np.nan
+    pnl_percent[~np.isfinite(pnl_percent)] = np.nan
+
+    length = len(watchlist)
+    columns = {
+        "name": [stock_name for stock_name, _ in watchlist],
+        "double": column_to_list(doubles, length),
+        "price": column_to_list(price, length),
+        "previous_close": column_to_list(previous_close, length),
+        "day_change": column_to_list(day_change, length),
+        "day_change_percent": column_to_list(day_change_percent, length),
+        "pnl": column_to_list(pnl, length),
+        "pnl_percent": column_to_list(pnl_percent, length),
+        "as_of": as_of,
+    }
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+# The interval/period pairs requested by the stock_charts and stockdetails pages
+# (5m/1d, 1d/5d, 1d/1mo, 1d/2mo) are all derived from the common fetches
+WARM_INTERVAL_PERIODS = COMMON_FETCHES
+
+def get_warm_symbols():
+    """Symbols kept hot by the cache warmer: the service list plus every user's favorites."""
+    symbols = symbol_catalog.symbols
+
+    try:
+        with db_session_scope() as db_session:
+            symbols.extend(crud.get_all_favorite_stock_names(db_session))
+    except Exception as e:
+        print(f"Warning: Could not read favorite stocks for the cache warmer: {e}")
+
+    return [symbol.upper() for symbol in symbols]
+
+def refresh_stock_data_batch(symbols, interval, period):
+    """Download the symbols again even if cached, so the cache entries never expire.
+
+    The download waits in the background lane of the upstream queue like the
+    refreshes of stale entries, a full queue fails the batch with QueueFull.
+    """
+    batch_key = f"refresh:{','.join(symbols)}_{interval}_{period}"
+    future = stock_fetches.submit(
+        batch_key, upstream_queue.lane(BACKGROUND), download_stock_data_batch, symbols, interval, period, refresh=True
+    )
+    return future.result()
+
+# Final response bytes of /stock/<symbol>, reused while the underlying data is unchanged
+response_cache = ResponseCache(maxsize=500, ttl=300)
+
+STOCK_FORMAT_MIMETYPES = {"json": JSON_MIMETYPE, "columnar": JSON_MIMETYPE, "msgpack": MSGPACK_MIMETYPE}
+
+# Largest point budget a client can ask for, more than any chart draws
+MAX_POINTS_LIMIT = 10000
+
+def stock_response_key(symbol, interval, period, fmt="json", max_points=None):
+    key = f"{symbol}_{interval}_{period}"
+    if fmt != "json":
+        key = f"{key}:{fmt}"
+    # every point budget is a response of its own
+    return key if max_points is None else f"{key}:p{max_points}"
+
+# cache key -> (frame, content hash), a frame is hashed once per cache fill instead of per request
+frame_versions = TTLCache(maxsize=1000, ttl=stale_cache.ttl)
+frame_versions_lock = threading.Lock()
+
+def frame_version(cache_key, stock_data):
+    with frame_versions_lock:
+        entry = frame_versions.get(cache_key)
+    if entry is not None and entry[0] is stock_data:
+        return entry[1]
+    version = frame_content_hash(stock_data)
+    with frame_versions_lock:
+        frame_versions[cache_key] = (stock_data, version)
+    return version
+
+def stock_source_etag(symbol, interval, period, source):
+    """
+    ETag of the frame a request is cut from (interval, period, frame), known before the cut is made.
+
+    The content hash of the cached frame is combined with the cut and the time
+    step of calendar periods, whose cut moves while the frame stays the same.
+    """
+    source_interval, source_period, stock_data = source
+    version = frame_version(f"{symbol}_{source_interval}_{source_period}", stock_data)
+    if (source_interval, source_period) == (interval, period):
+        return version
+    epoch = derivation_epoch(source_interval, source_period, interval, period)
+    cut = f"{version}:{source_interval}_{source_period}:{interval}_{period}:{epoch}"
+    return hashlib.sha1(cut.encode("utf-8")).hexdigest()
+
+def stock_response_etag(etag, fmt="json", max_points=None):
+    # every representation of the same frame needs its own etag
+    if fmt != "json":
+        etag = f"{etag}-{fmt}"
+    return etag if max_points is None else f"{etag}-p{max_points}"
+
+def parse_max_points(value):
+    """Return the max_points parameter as an int, None when not given. Raises ValueError for bad values."""
+    if value is None or value == '':
+        return None
+    try:
+        max_points = int(value)
+    except ValueError:
+        raise ValueError("max_points must be an integer")
+    if not MIN_POINTS <= max_points <= MAX_POINTS_LIMIT:
+        raise ValueError(f"max_points must be between {MIN_POINTS} and {MAX_POINTS_LIMIT}")
+    return max_points
+
+def downsample_stock_data(stock_data, max_points):
+    """Keep at most max_points bars of a frame, the ones LTTB picks to keep the shape of the close."""
+    if max_points is None or len(stock_data) <= max_points:
+        return stock_data
+    close = get_ohlcv_column(stock_data, "Close")
+    if close is None:
+        close = np.zeros(len(stock_data))
+    index = stock_data.index
+    x = index.asi8 if isinstance(index, pd.DatetimeIndex) else np.arange(len(stock_data))
+    return stock_data.iloc[lttb_indices(x, close, max_points)]
+
+def columnar_stock_data(stock_data, interval):
+    """Parallel arrays of a frame: epoch seconds and one array per OHLCV field."""
+    index = stock_data.index
+    timezone = str(index.tz) if index.tz is not None else None
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    payload = {"interval": interval, "timezone": timezone, "timestamps": index.as_unit('s').asi8}
+
+    length = len(stock_data)
+    for _, column in OHLCV_FIELDS:
+        values = get_ohlcv_column(stock_data, column)
+        if values is None:
+            values = np.full(length, np.nan)
+        payload[column.lower()] = integral_or_float(values) if column == "Volume" else round_significant(values)
+    return payload
+
+def encode_stock_data(stock_data, interval, fmt="json", max_points=None):
+    """
+    Process the stock data and encode it to the bytes of the response in the given format,
+    reduced to max_points bars first when a budget is given.
+    """
+    if max_points is not None and stock_data is not None:
+        with STOCK_STAGE_SECONDS.labels("downsample").time():
+            stock_data = downsample_stock_data(stock_data, max_points)
+    if fmt == "json":
+        with STOCK_STAGE_SECONDS.labels("process").time():
+            result = process_stock_data(stock_data, interval)
+        if result is None:
+            return None
+        with STOCK_STAGE_SECONDS.labels("encode").time():
+            return encode_json(result)
+
+    if stock_data is None or stock_data.empty:
+        return None
+    with STOCK_STAGE_SECONDS.labels("process").time():
+        payload = columnar_stock_data(stock_data, interval)
+    with STOCK_STAGE_SECONDS.labels("encode").time():
+        if fmt == "msgpack":
+            return packb(payload)
+        length = len(stock_data)
+        return encode_json({
+            key: (column_to_list(value, length) if value.dtype.kind == 'f' else value.tolist())
+            if isinstance(value, np.ndarray) else value
+            for key, value in payload.items()
+        })
+
+def encoded_response(encoded):
+    """Build the response for a cached body, compressed when the client accepts gzip."""
+    if encoded.gzipped is not None and request.accept_encodings["gzip"] > 0:
+        response = app.response_class(encoded.gzipped, status=200, mimetype=encoded.mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = app.response_class(encoded.body, status=200, mimetype=encoded.mimetype)
+    response.vary.add("Accept-Encoding")
+    response.set_etag(encoded.etag)
+    return response
+
+# Live quotes are intraday bars, every subscriber shares one refresh of them
+QUOTE_STREAM_INTERVAL = '5m'
+QUOTE_STREAM_PERIOD = '1d'
+QUOTE_STREAM_HEARTBEAT_SECONDS = 15
+
+def stream_bars(stock_data_by_symbol):
+    """Serialize frames to {timestamp: bar} dicts in the /stock/<symbol> bar format."""
+    result = {}
+    for symbol, stock_data in stock_data_by_symbol.items():
+        processed = process_stock_data(stock_data, QUOTE_STREAM_INTERVAL)
+        result[symbol] = None if processed is None else next(iter(processed.values()))
     return result
 
+def refresh_stream_bars(symbols):
+    """Download the watched symbols again for the quote stream, one batch for all of them in the background lane."""
+    refreshed = refresh_stock_data_batch(symbols, QUOTE_STREAM_INTERVAL, QUOTE_STREAM_PERIOD)
+    return stream_bars(refreshed)
+
+def load_stream_snapshot(symbols):
+    """Initial bars of new quote stream symbols, answered from the cache when possible."""
+    return stream_bars(fetch_stock_data_batch(symbols, QUOTE_STREAM_INTERVAL, QUOTE_STREAM_PERIOD))
+
+quote_hub = QuoteHub(
+    fetch_bars=refresh_stream_bars,
+    load_snapshot=load_stream_snapshot,
+    refresh_seconds=app.config['QUOTE_STREAM_INTERVAL_SECONDS']
+)
+
 # Create threads to handle concurrent requests. 
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+executor = InstrumentedThreadPoolExecutor(
+    max_workers=10, name="stock", queued=EXECUTOR_QUEUED, active=EXECUTOR_ACTIVE, queue_wait=EXECUTOR_QUEUE_WAIT
+)
+# Upstream fetches wait in a bounded queue, requests with a user waiting go before background refreshes
+upstream_queue = AdmissionQueue(
+    max_workers=app.config['UPSTREAM_WORKERS'], max_queue=app.config['UPSTREAM_QUEUE_SIZE'], name="upstream",
+    queued=EXECUTOR_QUEUED, active=EXECUTOR_ACTIVE, queue_wait=EXECUTOR_QUEUE_WAIT, rejected=ADMISSION_REJECTED
+)
+
+# With a shared cache backend one warm copy serves every worker: each worker starts a
+# warmer, but only the holder of a lease on the backend refreshes. Without one every
+# worker has its own in-process cache and warms it itself.
+def hold_warmer_lease():
+    # the pid is read on every call, a preloaded app forks its workers after the import
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    return shared_cache_backend.acquire_lease("lease:cache_warmer", owner, cache_warmer.interval_seconds * 3)
+
+cache_warmer = None
+if app.config['POLLING_INTERVAL_SECONDS']:
+    polling_interval = int(app.config['POLLING_INTERVAL_SECONDS'])
+    if polling_interval >= stock_cache.ttl:
+        print(f"Warning: POLLING_INTERVAL_SECONDS={polling_interval} is not shorter than the cache ttl of {stock_cache.ttl}s, entries will expire between refreshes")
+    cache_warmer = CacheWarmer(
+        refresh_batch=refresh_stock_data_batch,
+        get_symbols=get_warm_symbols,
+        interval_seconds=polling_interval,
+        interval_periods=WARM_INTERVAL_PERIODS,
+        max_concurrency=app.config['WARMER_MAX_CONCURRENCY'],
+        lease=hold_warmer_lease if shared_cache_backend is not None else None
+    )
+    cache_warmer.start()
+
+def mark_stale(response):
+    """Mark a response built from an expired cache entry."""
+    response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+def service_unavailable(message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+def fetch_stock_data_batch_or_cached(symbols, interval, period, timeout=15):
+    """
+    Fetch many symbols through the upstream queue, falling back to the fresh and the expired
+    cache entries when the fetch times out or is not admitted.
+
+    Returns ({symbol: frame}, stale_symbols). The error is re-raised if nothing is cached at all.
+    """
+    batch_key = f"batch:{','.join(symbols)}_{interval}_{period}"
+    try:
+        future = stock_fetches.submit(
+            batch_key, upstream_queue.lane(INTERACTIVE), fetch_stock_data_batch, symbols, interval, period
+        )
+        # one download for many tickers takes longer than a single one
+        return future.result(timeout=timeout), []
+    except (concurrent.futures.TimeoutError, QueueFull, CircuitOpenError):
+        # the download keeps running if it was admitted
+        stock_data_by_symbol = {}
+        stale_symbols = []
+        for symbol in symbols:
+            stock_data = range_cache.get(symbol, interval, period)
+            if stock_data is None:
+                stock_data = lookup_stale_stock_data(symbol, interval, period)
+                if stock_data is not None:
+                    stale_symbols.append(symbol)
+            if stock_data is not None:
+                stock_data_by_symbol[symbol] = stock_data
+
+        if not stock_data_by_symbol:
+            raise
+        return stock_data_by_symbol, stale_symbols
 
 @app.route("/stock/<symbol>", methods=["GET"])
 def get_stock_price(symbol):
-    """API endpoint to get daily stock data for a given symbol."""
+    """
+    API endpoint to get daily stock data for a given symbol.
+    With format=columnar the bars come as parallel arrays, as MessagePack when Accept prefers it.
+    max_points caps the number of bars, long ranges are reduced with LTTB before encoding.
+    """
     interval = request.args.get('interval', '1d')
     period = request.args.get('period', '1mo')
+    fmt = negotiate_format(request.args.get('format'), request.headers.get('Accept'))
+    if fmt is None:
+        return jsonify({"error": "format must be json or columnar"}), 400
+    try:
+        max_points = parse_max_points(request.args.get('max_points'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
         print(f"Processing request for {symbol} with interval={interval}, period={period}")
         
-        # Submit task to thread pool
-        future = executor.submit(fetch_stock_data, symbol, interval, period)
-        
+        # the cached frame the request is cut from, the response cache is keyed on it before any cut is made
+        source = lookup_stock_source(symbol, interval, period)
+        stale = False
+
         # Set a timeout to prevent hanging requests
         try:
-            stock_data = future.result(timeout=5)  # 5 second timeout
+            if source is None:
+                # Submit task to the upstream queue, requests for a key that is already being
+                # downloaded wait on that download instead of taking another worker
+                fetch_interval, fetch_period = range_cache.fetch_plan(interval, period)
+                fetch_key = f"{symbol}_{fetch_interval}_{fetch_period}"
+                source = lookup_stale_stock_source(symbol, interval, period)
+                stale = source is not None
+                # with an expired copy to answer right away, the refresh runs in the background
+                lane = upstream_queue.lane(BACKGROUND if stale else INTERACTIVE)
+                try:
+                    future = stock_fetches.submit(fetch_key, lane, load_stock_data, symbol, fetch_interval, fetch_period)
+                except QueueFull:
+                    if not stale:
+                        return too_many_requests(f"Server is busy, try {symbol} again shortly.", 1)
+                else:
+                    if not stale:
+                        with STOCK_STAGE_SECONDS.labels("fetch_wait").time():
+                            fetched = future.result(timeout=5)  # 5 second timeout
+                        if fetched is not None:
+                            source = (fetch_interval, fetch_period, fetched)
         except concurrent.futures.TimeoutError:
             return jsonify({
                 "error": f"Request timeout for {symbol}. Server is experiencing high load."
             }), 503
-        
-        if stock_data is None or stock_data.empty:
-            return jsonify({
-                "error": f"No data available for {symbol} with interval={interval}, period={period}"
-            }), 404
-        
-        # Process the data in the thread pool to avoid blocking
-        process_future = executor.submit(process_stock_data, stock_data, interval)
-        result = process_future.result(timeout=3)  # 3 second timeout
-        
-        if result is None:
-            return jsonify({
-                "error": f"Error processing data for {symbol}"
-            }), 500
-            
-        return jsonify(result), 200
+        except QueueFull:
+            # pushed out of the queue by more urgent fetches
+            return too_many_requests(f"Server is busy, try {symbol} again shortly.", 1)
+        except CircuitOpenError as e:
+            return service_unavailable(f"Market data is temporarily unavailable for {symbol}.", e.retry_after)
+
+        if stale:
+            STALE_RESPONSES.labels("/stock/<symbol>").inc()
+
+        no_data = lambda: (jsonify({
+            "error": f"No data available for {symbol} with interval={interval}, period={period}"
+        }), 404)
+        if source is None:
+            return no_data()
+
+        response_key = stock_response_key(symbol, interval, period, fmt, max_points)
+        with STOCK_STAGE_SECONDS.labels("etag").time():
+            etag = stock_response_etag(stock_source_etag(symbol, interval, period, source), fmt, max_points)
+        if etag in request.if_none_match:
+            RESPONSE_CACHE_LOOKUPS.labels("not_modified").inc()
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            if fmt != "json":
+                response.vary.add("Accept")
+            return mark_stale(response) if stale else response
+
+        encoded = response_cache.get(response_key, etag)
+        RESPONSE_CACHE_LOOKUPS.labels("miss" if encoded is None else "hit").inc()
+        if encoded is None:
+            source_interval, source_period, source_data = source
+            with STOCK_STAGE_SECONDS.labels("derive").time():
+                stock_data = derive_stock_data(source_data, source_interval, source_period, interval, period)
+            if stock_data is None or stock_data.empty:
+                return no_data()
+
+            # Process the data in the thread pool to avoid blocking
+            process_future = executor.submit(encode_stock_data, stock_data, interval, fmt, max_points)
+            with STOCK_STAGE_SECONDS.labels("process_wait").time():
+                body = process_future.result(timeout=3)  # 3 second timeout
+
+            if body is None:
+                return jsonify({
+                    "error": f"Error processing data for {symbol}"
+                }), 500
+
+            encoded = response_cache.put(response_key, etag, body, mimetype=STOCK_FORMAT_MIMETYPES[fmt])
+
+        response = encoded_response(encoded)
+        if fmt != "json":
+            response.vary.add("Accept")
+        return mark_stale(response) if stale else response
         
     except Exception as e:
         import traceback
@@ -183,13 +1241,259 @@ def get_stock_price(symbol):
             "error": f"Failed to retrieve data for {symbol}: {error_message}"
         }), 500
     
+MAX_INDICATORS = 10
+
+# Indicator series per (symbol, interval, indicator), advanced when new bars arrive
+indicator_engine = IndicatorEngine(maxsize=2000)
+
+def lookup_stock_history(symbol, interval, period):
+    """
+    Return (history, stock_data, stale): the widest cached frame of the symbol at the
+    interval and the requested period cut out of it, (None, None, False) without data.
+
+    Raises QueueFull, CircuitOpenError or concurrent.futures.TimeoutError like /stock/<symbol>.
+    """
+    stale = False
+    source = range_cache.find_source(symbol, interval, period)
+    if source is None:
+        fetch_interval, fetch_period = range_cache.fetch_plan(interval, period)
+        fetch_key = f"{symbol}_{fetch_interval}_{fetch_period}"
+        source = stale_range_cache.find_source(symbol, interval, period)
+        stale = source is not None
+        lane = upstream_queue.lane(BACKGROUND if stale else INTERACTIVE)
+        try:
+            future = stock_fetches.submit(fetch_key, lane, load_stock_data, symbol, fetch_interval, fetch_period)
+        except QueueFull:
+            if not stale:
+                raise
+        else:
+            if not stale:
+                with STOCK_STAGE_SECONDS.labels("fetch_wait").time():
+                    fetched = future.result(timeout=5)
+                if fetched is None:
+                    return None, None, False
+                source = (fetch_interval, fetch_period, fetched)
+
+    source_interval, source_period, source_data = source
+    # the history keeps the whole source range, longer windows get their warm-up bars from it
+    history = derive_stock_data(source_data, source_interval, source_period, interval, source_period)
+    stock_data = derive_stock_data(source_data, source_interval, source_period, interval, period)
+    return history, stock_data, stale
+
+def indicator_inputs(stock_data, interval):
+    """The int64 timestamps and the input arrays of the indicators for a frame."""
+    length = len(stock_data)
+    columns = {}
+    for column in ("High", "Low", "Close", "Volume"):
+        values = get_ohlcv_column(stock_data, column)
+        columns[column.lower()] = values if values is not None else np.full(length, np.nan)
+    if INTERVAL_MINUTES.get(interval, INTRADAY_MINUTES) < INTRADAY_MINUTES:
+        # intraday VWAP starts over every day
+        columns["session"] = stock_data.index.normalize().asi8
+    else:
+        columns["session"] = np.zeros(length, dtype=np.int64)
+    return stock_data.index.asi8, columns
+
+@app.route("/stock/<symbol>/indicators", methods=["GET"])
+def get_stock_indicators(symbol):
+    """
+    API endpoint to get technical indicators of a symbol computed on the server.
+    Example: /stock/AAPL/indicators?names=sma20,ema50,rsi14,vwap,bbands&interval=1d&period=1y
+    """
+    interval = request.args.get('interval', '1d')
+    period = request.args.get('period', '1mo')
+    names = list(dict.fromkeys(name.strip() for name in request.args.get('names', '').split(',') if name.strip()))
+
+    if not names:
+        return jsonify({"error": "At least one indicator name is required"}), 400
+    if len(names) > MAX_INDICATORS:
+        return jsonify({"error": f"At most {MAX_INDICATORS} indicators can be requested at once"}), 400
+    try:
+        indicators = [(name, parse_indicator(name)) for name in names]
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    try:
+        try:
+            history, stock_data, stale = lookup_stock_history(symbol, interval, period)
+        except concurrent.futures.TimeoutError:
+            return jsonify({
+                "error": f"Request timeout for {symbol}. Server is experiencing high load."
+            }), 503
+        except QueueFull:
+            return too_many_requests(f"Server is busy, try {symbol} again shortly.", 1)
+        except CircuitOpenError as e:
+            return service_unavailable(f"Market data is temporarily unavailable for {symbol}.", e.retry_after)
+
+        if stock_data is None or stock_data.empty:
+            return jsonify({
+                "error": f"No data available for {symbol} with interval={interval}, period={period}"
+            }), 404
+
+        with STOCK_STAGE_SECONDS.labels("indicators").time():
+            timestamps, columns = indicator_inputs(history, interval)
+            wanted = stock_data.index.asi8
+            result = {}
+            for name, indicator in indicators:
+                series_timestamps, outputs = indicator_engine.series(
+                    (symbol, interval), indicator, history, timestamps, columns
+                )
+                values = {
+                    field: column_to_list(series, len(wanted))
+                    for field, series in select_range(series_timestamps, outputs, wanted).items()
+                }
+                result[name] = values["value"] if list(values) == ["value"] else values
+
+        response = jsonify({
+            "symbol": symbol,
+            "interval": interval,
+            "period": period,
+            "timestamps": stock_data.index.strftime('%Y-%m-%d %H:%M:%S').tolist(),
+            "indicators": result
+        })
+        if stale:
+            STALE_RESPONSES.labels("/stock/<symbol>/indicators").inc()
+            mark_stale(response)
+        return response, 200
+
+    except Exception as e:
+        import traceback
+        print(f"Error computing indicators for {symbol}: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({"error": f"Failed to compute indicators for {symbol}: {e}"}), 500
+
+@app.route("/stock/batch", methods=["GET"])
+def get_stock_price_batch():
+    """API endpoint to get stock data for many symbols with one upstream download."""
+    interval = request.args.get('interval', '1d')
+    period = request.args.get('period', '1mo')
+    symbols_param = request.args.get('symbols', '')
+
+    # keep the request order but drop duplicates
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols_param.split(',') if s.strip()))
+
+    if not symbols:
+        return jsonify({"error": "At least one symbol is required"}), 400
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        return jsonify({"error": f"At most {MAX_BATCH_SYMBOLS} symbols can be requested at once"}), 400
+
+    try:
+        print(f"Processing batch request for {len(symbols)} symbols with interval={interval}, period={period}")
+
+        try:
+            stock_data_by_symbol, stale_symbols = fetch_stock_data_batch_or_cached(symbols, interval, period)
+        except QueueFull:
+            return too_many_requests("Server is busy, try the batch again shortly.", 1)
+        except CircuitOpenError as e:
+            return service_unavailable("Market data is temporarily unavailable.", e.retry_after)
+        except concurrent.futures.TimeoutError:
+            return jsonify({
+                "error": "Batch request timeout. Server is experiencing high load."
+            }), 503
+
+        result = {}
+        for symbol in symbols:
+            stock_data = stock_data_by_symbol.get(symbol)
+            processed = process_stock_data(stock_data, interval)
+            if processed is None:
+                result[symbol] = {
+                    "error": f"No data available for {symbol} with interval={interval}, period={period}"
+                }
+            else:
+                result[symbol] = processed
+
+        response = jsonify(result)
+        if stale_symbols:
+            STALE_RESPONSES.labels("/stock/batch").inc()
+            response.headers["X-Stale-Symbols"] = ",".join(stale_symbols)
+            mark_stale(response)
+        return response, 200
+
+    except Exception as e:
+        import traceback
+        error_message = str(e)
+
+        print(f"Error processing batch request: {error_message}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({
+            "error": f"Failed to retrieve batch data: {error_message}"
+        }), 500
+
+@app.route("/stream/quotes", methods=["GET"])
+def stream_quotes():
+    """
+    API endpoint to stream live bars of the given symbols as server-sent events.
+    A "snapshot" event with the bars of the day is sent per symbol first, then "bars"
+    events only carry the bars that are new or changed since the previous refresh.
+    """
+    symbols_param = request.args.get('symbols', '')
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols_param.split(',') if s.strip()))
+
+    if not symbols:
+        return jsonify({"error": "At least one symbol is required"}), 400
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        return jsonify({"error": f"At most {MAX_BATCH_SYMBOLS} symbols can be streamed at once"}), 400
+
+    try:
+        subscription = quote_hub.subscribe(symbols)
+    except Exception as e:
+        return jsonify({"error": f"Failed to start quote stream: {e}"}), 500
+
+    def events():
+        try:
+            while not subscription.closed:
+                item = subscription.get(timeout=QUOTE_STREAM_HEARTBEAT_SECONDS)
+                if item is None:
+                    # comment line, keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                else:
+                    yield format_sse(*item)
+        finally:
+            quote_hub.unsubscribe(subscription)
+
+    response = app.response_class(stream_with_context(events()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    API endpoint to get the latency, cache, executor, upstream and database metrics in the Prometheus text format.
+    """
+    return app.response_class(render_metrics(), status=200, mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/stock_cache/stats", methods=["GET"])
+def get_stock_cache_stats():
+    """
+    API endpoint to get the stock cache sizes, coalesced fetches, upstream queue, circuit breaker, symbol catalog and bar archive state.
+    """
+    return jsonify({
+        "cache": {"size": len(stock_cache), "maxsize": stock_cache.maxsize, "ttl": stock_cache.ttl},
+        "stale_cache": {"size": len(stale_cache), "maxsize": stale_cache.maxsize, "ttl": stale_cache.ttl},
+        "shared_backend": shared_cache_backend.name if shared_cache_backend is not None else None,
+        "fetches": stock_fetches.stats(),
+        "upstream_queue": {"queued": upstream_queue.queued(), "max_queue": upstream_queue.max_queue},
+        "circuit": upstream_breaker.status(),
+        "symbol_catalog": symbol_catalog.stats(),
+        "indicators": indicator_engine.stats(),
+        "bar_archive": bar_archive.stats() if bar_archive is not None else None
+    }), 200
+
+@app.route("/api/cache_warmer/status", methods=["GET"])
+def get_cache_warmer_status():
+    """
+    API endpoint to get the last refresh time and failures per cache key of the cache warmer.
+    """
+    if cache_warmer is None:
+        return jsonify({"running": False, "message": "Cache warmer is disabled, set POLLING_INTERVAL_SECONDS to enable it"}), 200
+    return jsonify(cache_warmer.status()), 200
+
 @app.route("/register", methods=["POST"])
 def register_user():
     """
     API endpoint to register a new user.
     """
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
         data = request.get_json()
         nickname = data.get("nickname")
@@ -199,11 +1503,9 @@ def register_user():
         if not nickname or not email or not password:
             return jsonify({"message": "Nickname, email, and password are required"}), 400
 
-        user = crud.create_user(db_session, nickname=nickname, email=email, password=password)
-        next(db_gen, None)
+        user = crud.create_user(get_request_db(), nickname=nickname, email=email, password=password)
         return jsonify({"message": "User registered successfully", "user_id": user.id}), 201
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Registration failed", "error": str(e)}), 500
 
 @app.route("/login", methods=["POST"])
@@ -211,8 +1513,6 @@ def login_user():
     """
     API endpoint for login.
     """
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
         data = request.get_json()
         email = data.get("email")
@@ -221,15 +1521,12 @@ def login_user():
         if not email or not password:
             return jsonify({"message": "Email and password are required"}), 400
 
-        user = crud.get_user_by_email(db_session, email=email)
+        user = crud.get_user_by_email(get_request_db(), email=email)
         if user and user.check_password(password):
-            next(db_gen, None)
             return jsonify({"message": "Login successful", "user_id": user.id, "nickname": user.nickname, "email": user.email}), 200
         else:
-            next(db_gen, None)
             return jsonify({"message": "Invalid credentials"}), 401
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Login failed", "error": str(e)}), 500
 
 
@@ -238,8 +1535,6 @@ def update_user_nickname(user_id: int):
     """
     API endpoint to update user nickname.
     """ 
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
         data = request.get_json()
         new_nickname = data.get("nickname")
@@ -247,14 +1542,12 @@ def update_user_nickname(user_id: int):
         if not new_nickname:
             return jsonify({"message": "New nickname is required"}), 400
 
-        updated_user = crud.update_nickname(db_session, user_id=user_id, new_nickname=new_nickname)
-        next(db_gen, None)
+        updated_user = crud.update_nickname(get_request_db(), user_id=user_id, new_nickname=new_nickname)
         if updated_user:
             return jsonify({"message": "Nickname updated successfully", "nickname": updated_user.nickname}), 200
         else:
             return jsonify({"message": "User not found"}), 404
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Failed to update nickname", "error": str(e)}), 500
 
 @app.route("/users/<int:user_id>/password", methods=["PUT"])
@@ -262,8 +1555,6 @@ def update_user_password(user_id: int):
     """
     API endpoint to update user password.
     """
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
         data = request.get_json()
         new_password = data.get("password")
@@ -271,26 +1562,38 @@ def update_user_password(user_id: int):
         if not new_password:
             return jsonify({"message": "New password is required"}), 400
 
-        updated_user = crud.update_password(db_session, user_id=user_id, new_password=new_password)
-        next(db_gen, None)
+        updated_user = crud.update_password(get_request_db(), user_id=user_id, new_password=new_password)
         if updated_user:
             return jsonify({"message": "Password updated successfully"}), 200
         else:
             return jsonify({"message": "User not found"}), 404
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Failed to update password", "error": str(e)}), 500
 
 @app.route('/api/stock_symbols', methods=['GET'])
 def get_stock_symbols():
     """
     API endpoint to get all the stock symbols.
+    With ?prefix=AA&limit=10 it returns the symbols starting with the prefix, for autocomplete.
     """
-    stock_symbols = read_stock_list_from_file(SERVICE_STOCK_LIST_FILE)
-    if stock_symbols:
-        return jsonify(stock_symbols) 
+    prefix = request.args.get('prefix')
+    limit = request.args.get('limit')
+    if prefix is None and limit is None:
+        encoded = symbol_catalog.full_response()
     else:
-        return jsonify({"error": "Could not retrieve stock symbols"}), 500 
+        try:
+            limit = int(limit) if limit is not None else 10
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        encoded = symbol_catalog.search(prefix or "", limit)
+
+    if encoded is None or len(symbol_catalog) == 0:
+        return jsonify({"error": "Could not retrieve stock symbols"}), 500
+    if encoded.etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(encoded.etag)
+        return response
+    return encoded_response(encoded)
 
 
 @app.route("/users/<int:user_id>/favorite_stocks", methods=["POST"])
@@ -299,8 +1602,6 @@ def add_user_favorite_stock(user_id: int):
     API endpoint to add a new favorite stock to a user.
     Expected request body (JSON): {"stock_name": "AAPL", "stock_double": 170.50} (stock_double is optional)
     """
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
         data = request.get_json()
         stock_name = data.get("stock_name")
@@ -308,9 +1609,9 @@ def add_user_favorite_stock(user_id: int):
 
         if not stock_name:
             return jsonify({"message": "Stock name is required"}), 400
+        check_known_symbols([stock_name])
 
-        favorite_stock = crud.add_favorite_stock_to_user(db_session, user_id=user_id, stock_name=stock_name, stock_double=stock_double)
-        next(db_gen, None)
+        favorite_stock = crud.add_favorite_stock_to_user(get_request_db(), user_id=user_id, stock_name=stock_name, stock_double=stock_double)
         if favorite_stock:
             return jsonify({
                 "message": "Favorite stock added successfully",
@@ -322,28 +1623,69 @@ def add_user_favorite_stock(user_id: int):
         else:
             return jsonify({"message": "User not found"}), 404
     except ValueError as ve:
-        next(db_gen, None)
         return jsonify({"message": "Invalid favorite stock data", "error": str(ve)}), 400
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Failed to add favorite stock", "error": str(e)}), 500
 
+@app.route("/users/<int:user_id>/favorite_stocks/batch", methods=["POST"])
+def add_user_favorite_stocks_batch(user_id: int):
+    """
+    API endpoint to add or update many favorite stocks of a user in one query.
+    Expected request body (JSON): {"favorite_stocks": [["AAPL", 170.50], ["GOOG", null]]}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        favorite_stocks_data = data.get("favorite_stocks")
+
+        if not isinstance(favorite_stocks_data, list):
+            return jsonify({"message": "Favorite stocks must be a list of [name, double] pairs"}), 400
+        check_known_symbols(favorite_stocks_data)
+
+        favorite_stocks = crud.add_favorite_stocks_to_user(get_request_db(), user_id=user_id, favorite_stocks=favorite_stocks_data)
+        if favorite_stocks is not None:
+            return jsonify({
+                "message": "Favorite stocks added successfully",
+                "favorite_stocks": [{"name": fs.stock_name, "double": fs.stock_double} for fs in favorite_stocks]
+            }), 200
+        else:
+            return jsonify({"message": "User not found"}), 404
+    except ValueError as ve:
+        return jsonify({"message": "Invalid favorite stocks data", "error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"message": "Failed to add favorite stocks", "error": str(e)}), 500
+
+@app.route("/users/<int:user_id>/favorite_stocks", methods=["DELETE"])
+def delete_user_favorite_stocks_batch(user_id: int):
+    """
+    API endpoint to delete many favorite stocks of a user in one query.
+    Expects a comma separated query parameter: ?stock_names=AAPL,GOOG
+    """
+    stock_names = [name.strip() for name in request.args.get("stock_names", "").split(",") if name.strip()]
+    if not stock_names:
+        return jsonify({"message": "stock_names query parameter is required"}), 400
+
+    try:
+        removed = crud.remove_favorite_stocks_from_user(get_request_db(), user_id=user_id, stock_names=stock_names)
+        if removed is None:
+            return jsonify({"message": "User not found"}), 404
+        return jsonify({"message": f"{removed} favorite stocks removed successfully", "removed": removed}), 200
+    except ValueError as ve:
+        return jsonify({"message": "Invalid stock names", "error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"message": "Failed to remove favorite stocks", "error": str(e)}), 500
+
 @app.route("/users/<int:user_id>/favorite_stocks/<string:stock_name>", methods=["DELETE"])
 def delete_user_favorite_stock(user_id: int, stock_name: str):
     """
     API endpoint to delete a specific favorite stock from a user by stock name.
     """
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
-        deleted = crud.remove_favorite_stock_from_user(db_session, user_id=user_id, stock_name=stock_name)
-        next(db_gen, None)
+        deleted = crud.remove_favorite_stock_from_user(get_request_db(), user_id=user_id, stock_name=stock_name)
         if deleted:
             return jsonify({"message": f"Favorite stock '{stock_name}' removed successfully"}), 200
         else:
             return jsonify({"message": "Favorite stock not found for this user"}), 404
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Failed to remove favorite stock", "error": str(e)}), 500
 
 @app.route("/users/<int:user_id>/favorite_stocks", methods=["GET"])
@@ -351,47 +1693,74 @@ def get_user_favorite_stocks_api(user_id: int):
     """
     API endpoint to get all favorite stocks for a user.
     """
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
-        favorite_stocks = crud.get_user_favorite_stocks(db_session, user_id=user_id)
-        next(db_gen, None)
+        favorite_stocks = crud.get_user_favorite_stocks(get_request_db(), user_id=user_id)
         return jsonify({
             "favorite_stocks": [{"name": fs.stock_name, "double": fs.stock_double} for fs in favorite_stocks]
         }), 200
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Failed to retrieve favorite stocks", "error": str(e)}), 500
 
+@app.route("/users/<int:user_id>/portfolio", methods=["GET"])
+def get_user_portfolio(user_id: int):
+    """
+    API endpoint to get the favorite stocks of a user with their latest price, day change
+    and P&L against stock_double. One query reads the favorites and one batched, cached
+    lookup gets the quotes of all of them.
+    """
+    try:
+        # the connection goes back to the pool before waiting on quotes
+        with db_session_scope() as db_session:
+            watchlist = crud.get_user_watchlist(db_session, user_id=user_id)
+    except Exception as e:
+        return jsonify({"message": "Failed to retrieve favorite stocks", "error": str(e)}), 500
+    if watchlist is None:
+        return jsonify({"message": "User not found"}), 404
+
+    symbols = list(dict.fromkeys(stock_name.upper() for stock_name, _ in watchlist))
+    try:
+        quotes, stale_symbols = lookup_quotes(symbols)
+    except QueueFull:
+        return too_many_requests("Server is busy, try the portfolio again shortly.", 1)
+    except CircuitOpenError as e:
+        return service_unavailable("Market data is temporarily unavailable.", e.retry_after)
+    except concurrent.futures.TimeoutError:
+        return jsonify({"error": "Portfolio request timeout. Server is experiencing high load."}), 503
+    except Exception as e:
+        return jsonify({"error": f"Failed to retrieve portfolio quotes: {e}"}), 500
+
+    response = jsonify({"favorite_stocks": build_portfolio(watchlist, quotes)})
+    if stale_symbols:
+        STALE_RESPONSES.labels("/users/<int:user_id>/portfolio").inc()
+        response.headers["X-Stale-Symbols"] = ",".join(stale_symbols)
+        mark_stale(response)
+    return response, 200
+
 @app.route("/users/<int:user_id>/favorite_stocks", methods=["PUT"])
 def replace_user_favorite_stocks_api(user_id: int):
     """
     API endpoint to replace all favorite stocks for a user.
     Expected request body (JSON): {"favorite_stocks": [["AAPL", 170.50], ["GOOG", 2700.0]]}
     """
-    db_gen = get_db()
-    db_session = next(db_gen)
     try:
         data = request.get_json()
         favorite_stocks_data = data.get("favorite_stocks")
 
         if not isinstance(favorite_stocks_data, list):
             return jsonify({"message": "Favorite stocks must be a list of [name, double] pairs"}), 400
+        check_known_symbols(favorite_stocks_data)
 
-        updated_user = crud.replace_user_favorite_stocks(db_session, user_id=user_id, new_favorite_stocks=favorite_stocks_data)
-        next(db_gen, None)
-        if updated_user:
+        favorite_stocks = crud.replace_user_favorite_stocks(get_request_db(), user_id=user_id, new_favorite_stocks=favorite_stocks_data)
+        if favorite_stocks is not None:
             return jsonify({
                 "message": "Favorite stocks replaced successfully",
-                "favorite_stocks": [{"name": fs.stock_name, "double": fs.stock_double} for fs in updated_user.favorites] # Use .favorites relationship
+                "favorite_stocks": [{"name": fs.stock_name, "double": fs.stock_double} for fs in favorite_stocks]
             }), 200
         else:
             return jsonify({"message": "User not found"}), 404
     except ValueError as ve:
-        next(db_gen, None)
         return jsonify({"message": "Invalid favorite stocks data", "error": str(ve)}), 400
     except Exception as e:
-        next(db_gen, None)
         return jsonify({"message": "Failed to replace favorite stocks", "error": str(e)}), 500
 
 if __name__ == "__main__":
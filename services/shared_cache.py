@@ -0,0 +1,472 @@
+# services/shared_cache.py
+"""
+Market data cache shared by every worker process of a deployment.
+
+SHARED_CACHE_BACKEND selects where the frames live:
+    (unset)  only the in-process TTLCache of each worker, as before
+    disk     one file per key under SHARED_CACHE_DIR, for workers on one host
+    redis    a Redis-protocol server at SHARED_CACHE_URL (redis://host:port/db)
+
+Frames are stored as columnar bytes (a JSON header followed by the raw index
+and column arrays), not pickles, so a read is a few numpy buffer views. The
+in-process cache stays in front of the shared one as L1.
+"""
+
+import fcntl
+import functools
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache, TTLCache
+
+FRAME_MAGIC = b"BTF1"
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+def encode_frame(stock_data):
+    """Encode a frame with a datetime index and numeric columns to columnar bytes."""
+    index = stock_data.index
+    if not isinstance(index, pd.DatetimeIndex):
+        raise ValueError("Only frames with a DatetimeIndex can be encoded")
+
+    columns = []
+    arrays = []
+    for position, column in enumerate(stock_data.columns):
+        values = stock_data.iloc[:, position].to_numpy()
+        if values.dtype.kind not in "biuf":
+            raise ValueError(f"Column {column} is not numeric")
+        values = np.ascontiguousarray(values)
+        columns.append({"name": list(column) if isinstance(column, tuple) else column, "dtype": values.dtype.str})
+        arrays.append(values.tobytes())
+
+    header = json.dumps({
+        "rows": len(stock_data),
+        "tz": str(index.tz) if index.tz is not None else None,
+        "unit": index.unit,
+        "index_name": index.name,
+        "column_names": list(stock_data.columns.names),
+        "columns": columns,
+    }).encode("utf-8")
+    # asi8 of a tz-aware index is UTC, the time zone is only attached again on decode
+    index_bytes = np.ascontiguousarray(index.asi8).tobytes()
+    return b"".join([FRAME_MAGIC, _HEADER_LENGTH.pack(len(header)), header, index_bytes] + arrays)
+
+
+def decode_frame(data):
+    """Decode the bytes of encode_frame back to a frame."""
+    if data[:4] != FRAME_MAGIC:
+        raise ValueError("Not an encoded frame")
+    header_length = _HEADER_LENGTH.unpack_from(data, 4)[0]
+    offset = 8 + header_length
+    header = json.loads(bytes(data[8:offset]))
+    rows = header["rows"]
+
+    buffer = memoryview(data)
+    index_values = np.frombuffer(buffer, dtype="<i8", count=rows, offset=offset)
+    offset += index_values.nbytes
+    index = pd.DatetimeIndex(index_values.view(f"datetime64[{header['unit']}]"), name=header["index_name"])
+    if header["tz"] is not None:
+        index = index.tz_localize("UTC").tz_convert(header["tz"])
+
+    names = tuple(
+        tuple(column["name"]) if isinstance(column["name"], list) else column["name"] for column in header["columns"]
+    )
+    columns = _column_index(names, tuple(header["column_names"]))
+
+    dtypes = {column["dtype"] for column in header["columns"]}
+    if len(dtypes) == 1:
+        # one dtype (the usual all float OHLCV): a single block over the buffer, no per column copies
+        block = np.frombuffer(buffer, dtype=np.dtype(dtypes.pop()), count=rows * len(names), offset=offset)
+        return pd.DataFrame(block.reshape(len(names), rows).T, index=index, columns=columns)
+
+    values = {}
+    for position, column in enumerate(header["columns"]):
+        array = np.frombuffer(buffer, dtype=np.dtype(column["dtype"]), count=rows, offset=offset)
+        offset += array.nbytes
+        values[position] = array
+    stock_data = pd.DataFrame(values, index=index)
+    stock_data.columns = columns
+    return stock_data
+
+
+@functools.lru_cache(maxsize=1024)
+def _column_index(names, level_names):
+    # every frame of a symbol has the same columns, building the MultiIndex is most of a decode
+    if names and isinstance(names[0], tuple):
+        return pd.MultiIndex.from_tuples(names, names=level_names)
+    return pd.Index(names, name=level_names[0])
+
+
+class DiskBackend:
+    """
+    Shared cache in a directory, for the workers of one host.
+
+    Each key is one file holding its expiry, its version and the value. Writes go
+    to a temporary file that is renamed over the old one, so readers never see a
+    partial value.
+    """
+
+    name = "disk"
+    _HEADER = struct.Struct("<d32s")
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """Return (version, value) or None."""
+        try:
+            with open(self._path(key), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        expires_at, version = self._HEADER.unpack_from(data)
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+        return version.decode("ascii"), data[self._HEADER.size:]
+
+    def version(self, key):
+        try:
+            with open(self._path(key), "rb") as file:
+                header = file.read(self._HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < self._HEADER.size:
+            return None
+        expires_at, version = self._HEADER.unpack(header)
+        if expires_at < time.time():
+            return None
+        return version.decode("ascii")
+
+    def set(self, key, version, value, ttl):
+        header = self._HEADER.pack(time.time() + ttl, version.encode("ascii"))
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(header)
+                file.write(value)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def acquire_lease(self, key, owner, ttl):
+        """Take or renew the lease on key for owner, False while another owner holds it."""
+        with open(self._path(f"{key}.lock"), "a+b") as lock_file:
+            # the lock file only serializes the read and write of the lease between processes
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                current = self.get(key)
+                if current is not None and current[1] != owner.encode("utf-8"):
+                    return False
+                self.set(key, "lease", owner.encode("utf-8"), ttl)
+                return True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def clear(self, prefix):
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith(self._file_name(prefix)):
+                try:
+                    os.unlink(os.path.join(self.directory, file_name))
+                except FileNotFoundError:
+                    pass
+
+    def _file_name(self, key):
+        # keys are "{namespace}:{symbol}_{interval}_{period}", keep them readable but file system safe
+        return urllib.parse.quote(key, safe="_-.")
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._file_name(key))
+
+
+class RespError(Exception):
+    """Error reply of a Redis-protocol server."""
+
+
+class RedisBackend:
+    """
+    Shared cache on a Redis-protocol server.
+
+    A minimal RESP client with a small connection pool, enough for GET, SET with
+    an expiry, DEL and SCAN. It works against Redis, Valkey, KeyDB or the
+    stand-in of services/resp_standin.py.
+    """
+
+    name = "redis"
+
+    def __init__(self, url, pool_size=8, timeout=2.0):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool = []
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value, version = self._execute(("GET", key), ("GET", f"{key}:v"))
+        if value is None or version is None:
+            return None
+        return version.decode("ascii"), value
+
+    def version(self, key):
+        version = self._execute(("GET", f"{key}:v"))[0]
+        return version.decode("ascii") if version is not None else None
+
+    def set(self, key, version, value, ttl):
+        ttl_ms = str(int(ttl * 1000))
+        self._execute(("SET", key, value, "PX", ttl_ms), ("SET", f"{key}:v", version, "PX", ttl_ms))
+
+    def acquire_lease(self, key, owner, ttl):
+        """Take or renew the lease on key for owner, False while another owner holds it."""
+        ttl_ms = str(int(ttl * 1000))
+        if self._execute(("SET", key, owner, "NX", "PX", ttl_ms))[0] is not None:
+            return True
+        if self._execute(("GET", key))[0] != owner.encode("utf-8"):
+            return False
+        # XX, a lease that expired in between is taken again with NX on the next call
+        return self._execute(("SET", key, owner, "XX", "PX", ttl_ms))[0] is not None
+
+    def delete(self, key):
+        # the version first, a reader that sees no version treats the key as missing
+        self._execute(("DEL", f"{key}:v", key))
+
+    def clear(self, prefix):
+        cursor = b"0"
+        while True:
+            cursor, keys = self._execute(("SCAN", cursor, "MATCH", f"{prefix}*", "COUNT", "500"))[0]
+            if keys:
+                self._execute(("DEL", *keys))
+            if cursor == b"0":
+                return
+
+    def _execute(self, *commands):
+        """Send the commands in one pipeline and return their replies."""
+        connection = self._checkout()
+        try:
+            connection.sendall(b"".join(_encode_command(command) for command in commands))
+            reader = connection.makefile("rb")
+            replies = [_read_reply(reader) for _ in commands]
+        except BaseException:
+            connection.close()
+            raise
+        self._checkin(connection)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _checkout(self):
+        with self._lock:
+            if self._pool:
+                return self._pool.pop()
+        connection = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", str(self.db)))
+        if setup:
+            connection.sendall(b"".join(_encode_command(command) for command in setup))
+            reader = connection.makefile("rb")
+            for _ in setup:
+                reply = _read_reply(reader)
+                if isinstance(reply, RespError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    def _checkin(self, connection):
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(connection)
+                return
+        connection.close()
+
+
+def _encode_command(command):
+    parts = [b"*%d\r\n" % len(command)]
+    for argument in command:
+        if isinstance(argument, str):
+            argument = argument.encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the cache server")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload
+    if kind == b"-":
+        return RespError(payload.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [_read_reply(reader) for _ in range(length)]
+    raise RespError(f"Unexpected reply {line!r}")
+
+
+class TieredCache:
+    """
+    Mapping of frames with an in-process L1 in front of a shared backend.
+
+    Writes go to both tiers under a new version. An L1 entry is trusted for
+    check_seconds, after that its version is compared with the shared one, so
+    a write or an invalidation in another worker is seen within check_seconds.
+    Misses are remembered for the same time so range lookups that probe many
+    keys do not hit the backend for each of them.
+    """
+
+    def __init__(self, l1, backend, namespace, ttl, check_seconds=1.0, on_error=None):
+        self.l1 = l1
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.check_seconds = check_seconds
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        # both are bounded like L1, range lookups probe keys for any symbol a client puts in the URL
+        self._versions = LRUCache(maxsize=l1.maxsize)
+        self._misses = TTLCache(maxsize=l1.maxsize, ttl=check_seconds)
+
+    @property
+    def maxsize(self):
+        return self.l1.maxsize
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            stock_data = self.l1.get(key)
+            version, checked_at = self._versions.get(key, (None, 0))
+            missed_at = self._misses.get(key)
+        if stock_data is not None and now - checked_at < self.check_seconds:
+            return stock_data
+        if stock_data is None and missed_at is not None and now - missed_at < self.check_seconds:
+            return default
+
+        try:
+            if stock_data is not None and self.backend.version(self._key(key)) == version:
+                with self._lock:
+                    self._versions[key] = (version, now)
+                return stock_data
+            entry = self.backend.get(self._key(key))
+        except Exception as e:
+            # the shared tier is an optimization, fall back to L1 when it is down
+            self._report(e)
+            return stock_data if stock_data is not None else default
+
+        if entry is None:
+            with self._lock:
+                self.l1.pop(key, None)
+                self._versions.pop(key, None)
+                self._misses[key] = now
+            return default
+
+        version, value = entry
+        stock_data = decode_frame(value)
+        with self._lock:
+            self.l1[key] = stock_data
+            self._versions[key] = (version, now)
+            self._misses.pop(key, None)
+        return stock_data
+
+    def __getitem__(self, key):
+        stock_data = self.get(key)
+        if stock_data is None:
+            raise KeyError(key)
+        return stock_data
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, stock_data):
+        version = uuid.uuid4().hex
+        try:
+            self.backend.set(self._key(key), version, encode_frame(stock_data), self.ttl)
+        except Exception as e:
+            self._report(e)
+        with self._lock:
+            self.l1[key] = stock_data
+            self._versions[key] = (version, time.monotonic())
+            self._misses.pop(key, None)
+
+    def __delitem__(self, key):
+        self.invalidate(key)
+
+    def invalidate(self, key):
+        """Drop a key in every worker, the others notice within check_seconds."""
+        try:
+            self.backend.delete(self._key(key))
+        except Exception as e:
+            self._report(e)
+        with self._lock:
+            self.l1.pop(key, None)
+            self._versions.pop(key, None)
+
+    def clear(self):
+        try:
+            self.backend.clear(f"{self.namespace}:")
+        except Exception as e:
+            self._report(e)
+        with self._lock:
+            self.l1.clear()
+            self._versions.clear()
+            self._misses.clear()
+
+    def __len__(self):
+        return len(self.l1)
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _report(self, error):
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            print(f"Shared cache {self.backend.name} error: {error}")
+
+
+def create_shared_backend(name=None):
+    """Return the backend selected by SHARED_CACHE_BACKEND, or None for in-process caching only."""
+    name = (name if name is not None else os.environ.get("SHARED_CACHE_BACKEND", "")).lower()
+    if not name:
+        return None
+    if name == "disk":
+        directory = os.environ.get("SHARED_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "borsa-takip-cache")
+        return DiskBackend(directory)
+    if name == "redis":
+        return RedisBackend(os.environ.get("SHARED_CACHE_URL", "redis://127.0.0.1:6379/0"))
+    raise ValueError(f"Unknown SHARED_CACHE_BACKEND: {name}")
@@ -0,0 +1,135 @@
+# services/singleflight.py
+import asyncio
+import concurrent.futures
+import threading
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key.
+
+    The first caller for a key runs the work, every caller that arrives while it is
+    still running gets the same future and so shares its result or its error.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    def submit(self, key, executor, fn, *args, **kwargs):
+        """Run fn on the executor unless the same key is already in flight.
+
+        Coalesced callers only wait on the returned future, they do not take
+        another executor worker.
+        """
+        with self._lock:
+            self._calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future
+            future = executor.submit(fn, *args, **kwargs)
+            self._in_flight[key] = future
+            self._executions += 1
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn in the calling thread unless the same key is already in flight."""
+        with self._lock:
+            self._calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                future = concurrent.futures.Future()
+                future.set_running_or_notify_cancel()
+                self._in_flight[key] = future
+                self._executions += 1
+                leader = True
+
+        if leader:
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._forget(key, future)
+
+        return future.result()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._in_flight),
+            }
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines running on one event loop.
+
+    The first caller for a key starts the work as a task, later callers await the
+    same task. A caller that is cancelled (timeout or client disconnect) only stops
+    waiting, the work is cancelled when the last of its callers has gone.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self._waiters = {}
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        self._calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            self._in_flight[key] = task
+            self._executions += 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._coalesced += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if not task.done():
+                self._waiters[task] -= 1
+                if self._waiters[task] == 0:
+                    # nobody waits for the result anymore
+                    task.cancel()
+
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def stats(self):
+        return {
+            "calls": self._calls,
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._in_flight),
+        }
+
+    def _forget(self, key, task):
+        self._waiters.pop(task, None)
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
@@ -0,0 +1,148 @@
+# services/symbol_catalog.py
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cachetools import LRUCache
+
+from services.response_cache import EncodedResponse
+
+MAX_SEARCH_LIMIT = 100
+
+
+class _Snapshot:
+    """One loaded version of the stock list, never changed after it is built."""
+
+    def __init__(self, symbols, file_state, encode):
+        # the list as written in the file, that is what the full list endpoint answers
+        self.symbols = symbols
+        self.file_state = file_state
+        self.sorted_symbols = sorted({symbol.upper() for symbol in symbols})
+        self.members = frozenset(self.sorted_symbols)
+        body = encode(symbols)
+        self.full_response = EncodedResponse(hashlib.sha1(body).hexdigest(), body)
+        self.searches = LRUCache(maxsize=1024)
+
+
+class SymbolCatalog:
+    """
+    In-memory index of the service stock list.
+
+    The file is read once and read again only when its mtime or size changes,
+    which is checked at most every check_seconds. The symbols are kept sorted,
+    so a prefix search is a binary search plus the matches, and the full list
+    response is encoded once per version of the file. A file that cannot be
+    read keeps the last good version.
+    """
+
+    def __init__(self, path, encode, check_seconds=1.0):
+        self.path = path
+        self.encode = encode
+        self.check_seconds = check_seconds
+        self._snapshot = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Return the current version, or None if the file was never readable."""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_seconds:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_seconds:
+                    self._reload_if_changed()
+                    self._checked_at = now
+        return self._snapshot
+
+    @property
+    def symbols(self):
+        snapshot = self.snapshot()
+        return list(snapshot.symbols) if snapshot is not None else []
+
+    def full_response(self):
+        snapshot = self.snapshot()
+        return snapshot.full_response if snapshot is not None else None
+
+    def search(self, prefix, limit=10):
+        """Return the encoded response with up to limit symbols starting with prefix, in sorted order."""
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return None
+        prefix = prefix.strip().upper()
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        key = (prefix, limit)
+        with self._lock:
+            encoded = snapshot.searches.get(key)
+        if encoded is not None:
+            return encoded
+
+        sorted_symbols = snapshot.sorted_symbols
+        matches = []
+        position = bisect.bisect_left(sorted_symbols, prefix)
+        while position < len(sorted_symbols) and len(matches) < limit:
+            symbol = sorted_symbols[position]
+            if not symbol.startswith(prefix):
+                break
+            matches.append(symbol)
+            position += 1
+
+        body = self.encode(matches)
+        encoded = EncodedResponse(hashlib.sha1(body).hexdigest(), body)
+        with self._lock:
+            snapshot.searches[key] = encoded
+        return encoded
+
+    def __contains__(self, symbol):
+        snapshot = self.snapshot()
+        return snapshot is not None and symbol.upper() in snapshot.members
+
+    def __len__(self):
+        snapshot = self.snapshot()
+        return len(snapshot.members) if snapshot is not None else 0
+
+    def unknown(self, symbols):
+        """Return the symbols that are not in the catalog, none while the catalog is unavailable."""
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return []
+        return [symbol for symbol in symbols if symbol.upper() not in snapshot.members]
+
+    def stats(self):
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return {"loaded": False, "path": self.path}
+        return {
+            "loaded": True,
+            "path": self.path,
+            "symbols": len(snapshot.members),
+            "etag": snapshot.full_response.etag,
+            "cached_searches": len(snapshot.searches),
+        }
+
+    def _reload_if_changed(self):
+        if not self.path:
+            return
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if self._snapshot is None:
+                print(f"Error: Could not read stock list file {self.path}: {e}")
+            return
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and self._snapshot.file_state == file_state:
+            return
+
+        try:
+            with open(self.path, 'r') as file:
+                loaded = json.load(file)
+            if not isinstance(loaded, list):
+                raise ValueError("the stock list must be a JSON array of symbols")
+            symbols = [symbol.strip() for symbol in loaded if isinstance(symbol, str) and symbol.strip()]
+        except (OSError, ValueError) as e:
+            # a half written file is tried again on the next check
+            print(f"Error: Could not load stock list file {self.path}, keeping the previous list: {e}")
+            return
+        self._snapshot = _Snapshot(symbols, file_state, self.encode)
+        print(f"Loaded {len(self._snapshot.members)} symbols from {self.path}")
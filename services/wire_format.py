@@ -0,0 +1,155 @@
+# services/wire_format.py
+"""
+Columnar encodings of the /stock/<symbol> response.
+
+The default body nests one object per bar under a date string with "1. open"
+like keys. format=columnar sends parallel arrays instead: epoch seconds and one
+array per OHLCV field, as JSON or, when the client prefers it in Accept, as
+MessagePack. The MessagePack encoder is just big enough for these payloads,
+numpy arrays are written as one block of fixed width elements.
+"""
+
+import struct
+
+import numpy as np
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+FORMATS = ("json", "columnar")
+
+# prices arrive as float32 noise like 227.47999572753906, 8 digits keep every real digit
+SIGNIFICANT_DIGITS = 8
+
+
+def negotiate_format(format_param, accept_header):
+    """
+    Return "json", "columnar" or "msgpack" for a request, None for an unknown format.
+    MessagePack is only sent for format=columnar when Accept prefers it over JSON.
+    """
+    format_param = (format_param or "json").lower()
+    if format_param not in FORMATS:
+        return None
+    if format_param == "json":
+        return "json"
+    accept = parse_accept_header(accept_header, MIMEAccept)
+    if accept.best_match((JSON_MIMETYPE, *MSGPACK_MIMETYPES)) in MSGPACK_MIMETYPES:
+        return "msgpack"
+    return "columnar"
+
+
+def round_significant(values, digits=SIGNIFICANT_DIGITS):
+    """Round a float array to significant digits, so JSON writes 227.48 instead of 17 digits."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    decimals = np.where(np.isfinite(magnitude), digits - 1 - magnitude, 0)
+    scale = np.power(10.0, decimals)
+    return np.round(values * scale) / scale
+
+
+def integral_or_float(values):
+    """An int64 array when every value is a whole number, volumes mostly are."""
+    if len(values) and np.isfinite(values).all() and (values == np.round(values)).all():
+        return values.astype(np.int64)
+    return values
+
+
+def packb(obj):
+    """Encode None, bool, int, float, str, bytes, lists, dicts and numpy arrays as MessagePack."""
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        _pack_int(obj, out)
+    elif isinstance(obj, float):
+        out += struct.pack(">Bd", 0xcb, obj)
+    elif isinstance(obj, str):
+        encoded = obj.encode("utf-8")
+        _pack_length(len(encoded), out, fix=0xa0, fix_limit=32, small=0xd9, medium=0xda, large=0xdb)
+        out += encoded
+    elif isinstance(obj, (bytes, bytearray)):
+        _pack_length(len(obj), out, fix=None, fix_limit=0, small=0xc4, medium=0xc5, large=0xc6)
+        out += obj
+    elif isinstance(obj, np.ndarray):
+        _pack_ndarray(obj, out)
+    elif isinstance(obj, np.generic):
+        _pack(obj.item(), out)
+    elif isinstance(obj, (list, tuple)):
+        _pack_length(len(obj), out, fix=0x90, fix_limit=16, small=None, medium=0xdc, large=0xdd)
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        _pack_length(len(obj), out, fix=0x80, fix_limit=16, small=None, medium=0xde, large=0xdf)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"Cannot encode {type(obj).__name__} as MessagePack")
+
+
+def _pack_int(value, out):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -0x20 <= value < 0:
+        out.append(value & 0xff)
+    elif 0 <= value <= 0xffffffff:
+        out += struct.pack(">BI", 0xce, value)
+    elif 0 <= value <= 0xffffffffffffffff:
+        out += struct.pack(">BQ", 0xcf, value)
+    elif -0x80000000 <= value < 0:
+        out += struct.pack(">Bi", 0xd2, value)
+    elif -0x8000000000000000 <= value < 0:
+        out += struct.pack(">Bq", 0xd3, value)
+    else:
+        raise OverflowError("Integer too large for MessagePack")
+
+
+def _pack_length(length, out, fix, fix_limit, small, medium, large):
+    if fix is not None and length < fix_limit:
+        out.append(fix | length)
+    elif small is not None and length <= 0xff:
+        out += struct.pack(">BB", small, length)
+    elif length <= 0xffff:
+        out += struct.pack(">BH", medium, length)
+    else:
+        out += struct.pack(">BI", large, length)
+
+
+def _pack_ndarray(values, out):
+    values = values.ravel()
+    _pack_length(len(values), out, fix=0x90, fix_limit=16, small=None, medium=0xdc, large=0xdd)
+    if values.dtype.kind == 'f':
+        # float64 elements, NaN is written as nil like the null of the JSON encoding
+        tag, dtype = 0xcb, ">f8"
+    elif values.dtype.kind in 'iu' and (len(values) == 0 or (values.min() >= 0 and values.max() <= 0xffffffff)):
+        tag, dtype = 0xce, ">u4"
+    elif values.dtype.kind in 'iu':
+        tag, dtype = 0xd3, ">i8"
+    else:
+        for item in values.tolist():
+            _pack(item, out)
+        return
+    block = np.empty(len(values), dtype=[("tag", "u1"), ("value", dtype)])
+    block["tag"] = tag
+    block["value"] = values
+    missing = np.isnan(values) if values.dtype.kind == 'f' else None
+    if missing is None or not missing.any():
+        out += block.tobytes()
+        return
+    # a nil is the one byte 0xc0, the value bytes of those elements are left out
+    block["tag"][missing] = 0xc0
+    keep = np.ones((len(values), block.dtype.itemsize), dtype=bool)
+    keep[missing, 1:] = False
+    out += block.view(np.uint8).reshape(len(values), -1)[keep].tobytes()